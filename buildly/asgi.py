@@ -0,0 +1,42 @@
+"""
+ASGI config for Buildly Core.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with an ASGI server to serve the async gateway (``/async/<service>/...``)
+natively, e.g. ``gunicorn buildly.asgi:application -k uvicorn.workers.UvicornWorker``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "buildly.settings.production")
+
+django_application = get_asgi_application()
+
+from gateway.sessions import async_session_manager  # noqa: E402 (apps have to be loaded first)
+
+
+async def lifespan(scope, receive, send):
+    """ Handle ASGI lifespan events, which Django doesn't support itself """
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # requests of the application loop share one upstream session
+            async_session_manager.open()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # close the shared upstream connections gracefully
+            await async_session_manager.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
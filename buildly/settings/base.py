@@ -48,6 +48,8 @@ INSTALLED_APPS = (
         INSTALLED_APPS_DJANGO + INSTALLED_APPS_THIRD_PARTIES + INSTALLED_APPS_LOCAL
 )
 
+MIDDLEWARE_COMPRESSION = ['core.middleware.CompressionMiddleware']
+
 MIDDLEWARE_DJANGO = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -62,7 +64,7 @@ MIDDLEWARE_CSRF = ['core.middleware.DisableCsrfCheck']
 
 EXCEPTION_MIDDLEWARE = ['core.middleware.AsyncSessionAuthBlockMiddleware', 'core.middleware.ExceptionMiddleware']
 
-MIDDLEWARE = MIDDLEWARE_DJANGO + MIDDLEWARE_CSRF + EXCEPTION_MIDDLEWARE
+MIDDLEWARE = MIDDLEWARE_COMPRESSION + MIDDLEWARE_DJANGO + MIDDLEWARE_CSRF + EXCEPTION_MIDDLEWARE
 
 ROOT_URLCONF = 'core.urls'
 
@@ -88,6 +90,8 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'buildly.wsgi.application'
 
+ASGI_APPLICATION = 'buildly.asgi.application'
+
 AUTH_USER_MODEL = 'core.CoreUser'
 
 AUTHENTICATION_BACKENDS = [
@@ -132,6 +136,9 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.openapi.AutoSchema',
 }
 
+# Responses smaller than that many bytes aren't compressed
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', 1024))
+
 # Front-end application URL
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://www.example.com/')
 REGISTRATION_URL_PATH = os.getenv('REGISTRATION_URL_PATH', 'register/')
@@ -175,3 +182,104 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
     # Add other options as needed
 }
+
+# Cache. The gateway keeps its throttle buckets, metrics, coalesced responses, response
+# cache, spec fetch locks and registry version stamp in it, which only work across
+# workers and nodes with a shared backend, e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache CACHE_LOCATION=redis://redis:6379/0.
+# The local-memory default keeps them per worker process
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Gateway
+
+# Seconds a worker trusts its registry of logic modules before it checks the version
+# stamp in the shared cache for changes made by other workers
+GATEWAY_LOGIC_MODULE_REGISTRY_CHECK_INTERVAL = float(os.getenv('GATEWAY_LOGIC_MODULE_REGISTRY_CHECK_INTERVAL', 1))
+
+# Seconds a worker may hold the cluster-wide lock for pulling a service's Swagger spec
+GATEWAY_SPEC_FETCH_LOCK_TIMEOUT = int(os.getenv('GATEWAY_SPEC_FETCH_LOCK_TIMEOUT', 10))
+
+# Defaults for the keep-alive connections to the services, overridable per LogicModule
+GATEWAY_UPSTREAM_POOL_SIZE = int(os.getenv('GATEWAY_UPSTREAM_POOL_SIZE', 10))
+GATEWAY_UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('GATEWAY_UPSTREAM_CONNECT_TIMEOUT', 5))
+GATEWAY_UPSTREAM_READ_TIMEOUT = float(os.getenv('GATEWAY_UPSTREAM_READ_TIMEOUT', 60))
+
+# Retries of idempotent requests to the services, overridable per LogicModule. The backoff
+# doubles with each retry up to BACKOFF_MAX seconds and is jittered
+GATEWAY_UPSTREAM_MAX_RETRIES = int(os.getenv('GATEWAY_UPSTREAM_MAX_RETRIES', 2))
+GATEWAY_UPSTREAM_RETRY_BACKOFF = float(os.getenv('GATEWAY_UPSTREAM_RETRY_BACKOFF', 0.1))
+GATEWAY_UPSTREAM_RETRY_BACKOFF_MAX = float(os.getenv('GATEWAY_UPSTREAM_RETRY_BACKOFF_MAX', 2))
+
+# Retry budget of a worker: within WINDOW seconds at most MIN_RETRIES retries plus
+# RATIO of the requests, so retries can't amplify an outage
+GATEWAY_RETRY_BUDGET_WINDOW = float(os.getenv('GATEWAY_RETRY_BUDGET_WINDOW', 10))
+GATEWAY_RETRY_BUDGET_RATIO = float(os.getenv('GATEWAY_RETRY_BUDGET_RATIO', 0.2))
+GATEWAY_RETRY_BUDGET_MIN_RETRIES = int(os.getenv('GATEWAY_RETRY_BUDGET_MIN_RETRIES', 10))
+
+# JSON codec of the gateway: 'json' (standard library), 'orjson' or 'auto' for the
+# fastest installed one
+GATEWAY_JSON_CODEC = os.getenv('GATEWAY_JSON_CODEC', 'auto')
+
+# Shared aiohttp connector of the async gateway
+GATEWAY_ASYNC_CONNECTION_LIMIT = int(os.getenv('GATEWAY_ASYNC_CONNECTION_LIMIT', 100))
+GATEWAY_ASYNC_CONNECTION_LIMIT_PER_HOST = int(os.getenv('GATEWAY_ASYNC_CONNECTION_LIMIT_PER_HOST', 20))
+GATEWAY_ASYNC_DNS_CACHE_TTL = int(os.getenv('GATEWAY_ASYNC_DNS_CACHE_TTL', 300))
+GATEWAY_ASYNC_KEEPALIVE_TIMEOUT = float(os.getenv('GATEWAY_ASYNC_KEEPALIVE_TIMEOUT', 15))
+
+# Responses without join/extend larger than the threshold (or of unknown size) are
+# streamed to the client in chunks instead of being read into memory
+GATEWAY_STREAMING_THRESHOLD = int(os.getenv('GATEWAY_STREAMING_THRESHOLD', 256 * 1024))
+GATEWAY_STREAMING_CHUNK_SIZE = int(os.getenv('GATEWAY_STREAMING_CHUNK_SIZE', 64 * 1024))
+
+# Shared cache of GET responses, enabled per LogicModule by its cache TTL. Expired
+# responses are served for GATEWAY_RESPONSE_CACHE_STALE_TTL more seconds while they
+# are refreshed in background
+GATEWAY_RESPONSE_CACHE_ALIAS = os.getenv('GATEWAY_RESPONSE_CACHE_ALIAS', 'default')
+GATEWAY_RESPONSE_CACHE_MAX_ENTRY_SIZE = int(os.getenv('GATEWAY_RESPONSE_CACHE_MAX_ENTRY_SIZE', 1024 * 1024))
+GATEWAY_RESPONSE_CACHE_STALE_TTL = int(os.getenv('GATEWAY_RESPONSE_CACHE_STALE_TTL', 30))
+GATEWAY_RESPONSE_CACHE_REVALIDATION_WORKERS = int(os.getenv('GATEWAY_RESPONSE_CACHE_REVALIDATION_WORKERS', 4))
+
+# Identical concurrent GET requests to services with LogicModule.coalesce_requests
+# share one request; other workers wait up to the timeout for the leader's response
+GATEWAY_COALESCING_TIMEOUT = float(os.getenv('GATEWAY_COALESCING_TIMEOUT', 10))
+GATEWAY_COALESCING_POLL_INTERVAL = float(os.getenv('GATEWAY_COALESCING_POLL_INTERVAL', 0.05))
+
+# Per-service circuit breaker: the circuit opens when at least ERROR_RATE of the calls
+# within WINDOW seconds failed, answered with a server error or took longer than
+# SLOW_CALL_DURATION seconds, given MIN_REQUESTS calls. It stays open for OPEN_DURATION
+# seconds, then HALF_OPEN_REQUESTS trial calls decide whether it closes again
+GATEWAY_CIRCUIT_BREAKER_ENABLED = False if os.getenv('GATEWAY_CIRCUIT_BREAKER_ENABLED') == 'False' else True
+GATEWAY_CIRCUIT_BREAKER_WINDOW = float(os.getenv('GATEWAY_CIRCUIT_BREAKER_WINDOW', 30))
+GATEWAY_CIRCUIT_BREAKER_MIN_REQUESTS = int(os.getenv('GATEWAY_CIRCUIT_BREAKER_MIN_REQUESTS', 10))
+GATEWAY_CIRCUIT_BREAKER_ERROR_RATE = float(os.getenv('GATEWAY_CIRCUIT_BREAKER_ERROR_RATE', 0.5))
+GATEWAY_CIRCUIT_BREAKER_SLOW_CALL_DURATION = float(os.getenv('GATEWAY_CIRCUIT_BREAKER_SLOW_CALL_DURATION', 10))
+GATEWAY_CIRCUIT_BREAKER_OPEN_DURATION = float(os.getenv('GATEWAY_CIRCUIT_BREAKER_OPEN_DURATION', 30))
+GATEWAY_CIRCUIT_BREAKER_HALF_OPEN_REQUESTS = int(os.getenv('GATEWAY_CIRCUIT_BREAKER_HALF_OPEN_REQUESTS', 1))
+
+# POST /batch/ performs at most MAX_REQUESTS sub-requests, CONCURRENCY of them at once
+GATEWAY_BATCH_MAX_REQUESTS = int(os.getenv('GATEWAY_BATCH_MAX_REQUESTS', 50))
+GATEWAY_BATCH_CONCURRENCY = int(os.getenv('GATEWAY_BATCH_CONCURRENCY', 10))
+
+# Prometheus metrics at /metrics/. Each worker pushes its samples to the shared cache
+# at most every PUSH_INTERVAL seconds, the endpoint adds up the samples of all workers
+GATEWAY_METRICS_ENABLED = True if os.getenv('GATEWAY_METRICS_ENABLED') == 'True' else False
+GATEWAY_METRICS_CACHE_ALIAS = os.getenv('GATEWAY_METRICS_CACHE_ALIAS', 'default')
+GATEWAY_METRICS_PUSH_INTERVAL = float(os.getenv('GATEWAY_METRICS_PUSH_INTERVAL', 5))
+GATEWAY_METRICS_TOKEN = os.getenv('GATEWAY_METRICS_TOKEN', '')
+
+# Time spent per phase of gateway requests (auth, permission, spec, upstream, datamesh,
+# encode) is sent in a Server-Timing header when enabled, and logged for requests that
+# take longer than SLOW_REQUEST_THRESHOLD seconds (0 disables the log)
+GATEWAY_SERVER_TIMING = True if os.getenv('GATEWAY_SERVER_TIMING') == 'True' else False
+GATEWAY_SLOW_REQUEST_THRESHOLD = float(os.getenv('GATEWAY_SLOW_REQUEST_THRESHOLD', 5))
+
+# Default throttle rates of the gateway like '1000/minute', overridable per LogicModule
+# and per CoreGroup; empty means no limit. The token buckets live in the shared cache
+GATEWAY_THROTTLE_CACHE_ALIAS = os.getenv('GATEWAY_THROTTLE_CACHE_ALIAS', 'default')
+GATEWAY_THROTTLE_ORGANIZATION_RATE = os.getenv('GATEWAY_THROTTLE_ORGANIZATION_RATE', '')
+GATEWAY_THROTTLE_USER_RATE = os.getenv('GATEWAY_THROTTLE_USER_RATE', '')
@@ -0,0 +1,26 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+from buildly.asgi import application
+
+
+def test_asgi_lifespan_closes_upstream_sessions():
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    with patch('buildly.asgi.async_session_manager.open') as open_mock, \
+            patch('buildly.asgi.async_session_manager.close', new_callable=AsyncMock) as close_mock:
+        asyncio.run(application({'type': 'lifespan'}, receive, send))
+
+    assert sent == [
+        {'type': 'lifespan.startup.complete'},
+        {'type': 'lifespan.shutdown.complete'},
+    ]
+    open_mock.assert_called_once()
+    close_mock.assert_awaited_once()
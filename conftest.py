@@ -4,6 +4,22 @@ from django.core.handlers.wsgi import WSGIRequest
 from rest_framework.test import APIRequestFactory
 
 
+def pytest_addoption(parser):
+    parser.addoption(
+        '--benchmarks', action='store_true', default=False, help='run the micro-benchmarks marked with benchmark',
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    """ Micro-benchmarks only print timings, they are skipped unless --benchmarks is given """
+    if config.getoption('--benchmarks'):
+        return
+    skip_benchmark = pytest.mark.skip(reason='micro-benchmark, run with --benchmarks')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip_benchmark)
+
+
 @pytest.fixture(scope='session')
 def request_factory():
     return APIRequestFactory()
@@ -24,3 +40,17 @@ def wsgi_request_factory():
         return WSGIRequest(environ)
 
     return _make_wsgi_request
+
+
+@pytest.fixture(autouse=True)
+def reset_gateway_state():
+    """ Every test starts with healthy services and empty worker-wide registries """
+    from gateway.breakers import circuit_breakers
+    from gateway.metrics import metrics_registry
+    from gateway.registry import logic_module_registry
+    from gateway.retries import retry_budget
+    circuit_breakers.clear()
+    retry_budget.reset()
+    metrics_registry.clear()
+    # the logic modules of the previous test were rolled back without signals
+    logic_module_registry.clear()
@@ -0,0 +1,122 @@
+import zlib
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class GzipCompressor:
+    encoding = 'gzip'
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        """ Compress a chunk and flush it, so the client can decode the stream as it arrives """
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    encoding = 'br'
+
+    def __init__(self):
+        # a low quality, the higher ones are too slow for dynamic content
+        self._compressor = brotli.Compressor(quality=4)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    encoding = 'zstd'
+
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def get_compressors() -> Dict[str, type]:
+    """ Compressors of the installed libraries, in the order of preference """
+    compressors = {}
+    if zstandard is not None:
+        compressors[ZstdCompressor.encoding] = ZstdCompressor
+    if brotli is not None:
+        compressors[BrotliCompressor.encoding] = BrotliCompressor
+    compressors[GzipCompressor.encoding] = GzipCompressor
+    return compressors
+
+
+COMPRESSORS = get_compressors()
+# Encodings the gateway can decode, both requests and aiohttp decode them transparently
+UPSTREAM_ACCEPT_ENCODING = ', '.join(['gzip', 'deflate'] + (['br'] if brotli is not None else []))
+
+
+def parse_accept_encoding(accept_encoding: str) -> Dict[str, float]:
+    """ Map the codings of an Accept-Encoding header to their quality values """
+    codings = {}
+    for item in accept_encoding.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding.lower()] = quality
+    return codings
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """ The encoding with the highest quality the client accepts, ties go by our preference """
+    codings = parse_accept_encoding(accept_encoding)
+    candidates: List[tuple] = []
+    for preference, encoding in enumerate(COMPRESSORS):
+        quality = codings.get(encoding, codings.get('*', 0.0))
+        if quality > 0:
+            candidates.append((-quality, preference, encoding))
+    return min(candidates)[2] if candidates else None
+
+
+def compress(encoding: str, data: bytes) -> bytes:
+    compressor = COMPRESSORS[encoding]()
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_sequence(encoding: str, sequence: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = COMPRESSORS[encoding]()
+    for chunk in sequence:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def acompress_sequence(encoding: str, sequence: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = COMPRESSORS[encoding]()
+    async for chunk in sequence:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
@@ -1,14 +1,17 @@
 import logging
 import json
 
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
 from django.utils.deprecation import MiddlewareMixin
 from django.http import JsonResponse
 
 from django.core.exceptions import SynchronousOnlyOperation
 from django.http import JsonResponse
 
+from . import compression
 from .exceptions import SocialAuthFailed, SocialAuthNotConfigured
-from gateway.exceptions import PermissionDenied, EndpointNotFound, DataMeshError
+from gateway.exceptions import PermissionDenied, EndpointNotFound, DataMeshError, ServiceUnavailable
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +23,49 @@ class DisableCsrfCheck(MiddlewareMixin):
             setattr(req, attr, True)
 
 
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress responses with the best encoding the client accepts: zstd and brotli
+    when their libraries are installed, gzip otherwise. Responses below
+    RESPONSE_COMPRESSION_MIN_SIZE are sent as they are, streamed responses are
+    compressed chunk by chunk.
+    """
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE:
+            return response
+
+        if response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = compression.negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compression.acompress_sequence(encoding, response.streaming_content)
+            else:
+                response.streaming_content = compression.compress_sequence(encoding, response.streaming_content)
+            # the compressed size isn't known until the stream is consumed
+            del response.headers['Content-Length']
+        else:
+            compressed_content = compression.compress(encoding, response.content)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        # a strong ETag would claim the compressed body is byte-identical to the original
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
 # TODO: Remove dependency to gateway and datamesh app making their exception classes inherit the core one
 MIDDLEWARE_EXCEPTIONS = (
     PermissionDenied,
@@ -27,6 +73,7 @@ MIDDLEWARE_EXCEPTIONS = (
     SocialAuthFailed,
     SocialAuthNotConfigured,
     DataMeshError,
+    ServiceUnavailable,
 )
 
 
@@ -34,9 +81,12 @@ class ExceptionMiddleware(MiddlewareMixin):
     @staticmethod
     def process_exception(request, exception):
         if isinstance(exception, MIDDLEWARE_EXCEPTIONS):
-            return JsonResponse(
+            response = JsonResponse(
                 data=json.loads(exception.content), status=exception.status
             )
+            for header, value in getattr(exception, 'headers', {}).items():
+                response[header] = value
+            return response
         return None
 
 
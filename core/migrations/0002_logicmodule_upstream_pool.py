@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logicmodule',
+            name='connect_timeout',
+            field=models.FloatField(blank=True, help_text='Seconds to wait for a connection to the service', null=True, verbose_name='Connect timeout'),
+        ),
+        migrations.AddField(
+            model_name='logicmodule',
+            name='keep_alive',
+            field=models.BooleanField(default=True, verbose_name='Keep connections alive'),
+        ),
+        migrations.AddField(
+            model_name='logicmodule',
+            name='pool_size',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Maximum number of keep-alive connections a gateway worker keeps to the service', null=True, verbose_name='Connection pool size'),
+        ),
+        migrations.AddField(
+            model_name='logicmodule',
+            name='read_timeout',
+            field=models.FloatField(blank=True, help_text='Seconds to wait for the service to send data', null=True, verbose_name='Read timeout'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_logicmodule_upstream_pool'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logicmodule',
+            name='cache_scope',
+            field=models.CharField(choices=[('user', 'User'), ('organization', 'Organization')], default='user', help_text='Whether cached responses are shared by the same user or by the whole organization', max_length=16, verbose_name='Response cache scope'),
+        ),
+        migrations.AddField(
+            model_name='logicmodule',
+            name='cache_ttl',
+            field=models.PositiveIntegerField(blank=True, help_text='Seconds GET responses of the service are shared between gateway requests, empty to disable', null=True, verbose_name='Response cache TTL'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_logicmodule_response_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logicmodule',
+            name='coalesce_requests',
+            field=models.BooleanField(default=False, help_text='Identical concurrent GET requests in the response cache scope share one request to the service', verbose_name='Coalesce identical requests'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_logicmodule_coalesce_requests'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logicmodule',
+            name='max_retries',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Retries of idempotent requests that failed or got a 502, 503 or 504 from the service', null=True, verbose_name='Max retries'),
+        ),
+        migrations.AddField(
+            model_name='logicmodule',
+            name='retry_backoff',
+            field=models.FloatField(blank=True, help_text='Seconds of the base backoff between retries, doubled with each retry and jittered', null=True, verbose_name='Retry backoff'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:18
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_logicmodule_retry_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coregroup',
+            name='throttle_rate',
+            field=models.CharField(blank=True, help_text='Gateway requests per member of the group to each service, e.g. "100/minute"', max_length=32, validators=[django.core.validators.RegexValidator('^\\d+/(s|sec|second|m|min|minute|h|hour|d|day)$', 'Enter a rate like "100/minute".')], verbose_name='Throttle rate'),
+        ),
+        migrations.AddField(
+            model_name='logicmodule',
+            name='organization_throttle_rate',
+            field=models.CharField(blank=True, help_text='Gateway requests per organization to the service, e.g. "1000/minute"', max_length=32, validators=[django.core.validators.RegexValidator('^\\d+/(s|sec|second|m|min|minute|h|hour|d|day)$', 'Enter a rate like "100/minute".')], verbose_name='Organization throttle rate'),
+        ),
+        migrations.AddField(
+            model_name='logicmodule',
+            name='user_throttle_rate',
+            field=models.CharField(blank=True, help_text='Gateway requests per user to the service, e.g. "100/minute", groups may grant more', max_length=32, validators=[django.core.validators.RegexValidator('^\\d+/(s|sec|second|m|min|minute|h|hour|d|day)$', 'Enter a rate like "100/minute".')], verbose_name='User throttle rate'),
+        ),
+    ]
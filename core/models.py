@@ -7,6 +7,7 @@ from django.contrib.auth.models import AbstractUser
 from django.db.models import JSONField
 
 from django.contrib.sites.models import Site
+from django.core.validators import RegexValidator
 from django.db import models
 from django.utils import timezone
 
@@ -37,6 +38,11 @@ PERMISSIONS_VIEW_ONLY = 4  # 0100
 
 PERMISSIONS_NO_ACCESS = 0  # 0000
 
+# Rate of requests like '100/minute', the period may be given by its first letter
+THROTTLE_RATE_VALIDATOR = RegexValidator(
+    r'^\d+/(s|sec|second|m|min|minute|h|hour|d|day)$', 'Enter a rate like "100/minute".'
+)
+
 TEMPLATE_RESET_PASSWORD, TEMPLATE_INVITE = 1, 2
 TEMPLATE_TYPES = (
     (TEMPLATE_RESET_PASSWORD, 'Password resetting'),
@@ -236,6 +242,8 @@ class CoreGroup(models.Model):
     is_default = models.BooleanField('Is organization default group', default=False)
     permissions = models.PositiveSmallIntegerField('Permissions', default=PERMISSIONS_VIEW_ONLY,
                                                    help_text='Decimal integer from 0 to 15 converted from 4-bit binary, each bit indicates permissions for CRUD')
+    throttle_rate = models.CharField('Throttle rate', max_length=32, blank=True, validators=[THROTTLE_RATE_VALIDATOR],
+                                     help_text='Gateway requests per member of the group to each service, e.g. "100/minute"')
     create_date = models.DateTimeField(default=timezone.now)
     edit_date = models.DateTimeField(null=True, blank=True)
 
@@ -402,6 +410,14 @@ class EmailTemplate(models.Model):
 
 
 class LogicModule(models.Model):
+    CACHE_SCOPE_USER = 'user'
+    CACHE_SCOPE_ORGANIZATION = 'organization'
+
+    CacheScopeChoices = (
+        (CACHE_SCOPE_USER, 'User'),
+        (CACHE_SCOPE_ORGANIZATION, 'Organization'),
+    )
+
     module_uuid = models.CharField(
         max_length=255,
         verbose_name='Logic Module UUID',
@@ -417,6 +433,45 @@ class LogicModule(models.Model):
     docs_endpoint = models.CharField(blank=True, null=True, max_length=255)
     api_specification = JSONField(blank=True, null=True)
     swagger_version = models.CharField(max_length=50, null=True, blank=True)
+    pool_size = models.PositiveSmallIntegerField(
+        'Connection pool size', null=True, blank=True,
+        help_text='Maximum number of keep-alive connections a gateway worker keeps to the service',
+    )
+    keep_alive = models.BooleanField('Keep connections alive', default=True)
+    connect_timeout = models.FloatField(
+        'Connect timeout', null=True, blank=True, help_text='Seconds to wait for a connection to the service'
+    )
+    read_timeout = models.FloatField(
+        'Read timeout', null=True, blank=True, help_text='Seconds to wait for the service to send data'
+    )
+    max_retries = models.PositiveSmallIntegerField(
+        'Max retries', null=True, blank=True,
+        help_text='Retries of idempotent requests that failed or got a 502, 503 or 504 from the service',
+    )
+    retry_backoff = models.FloatField(
+        'Retry backoff', null=True, blank=True,
+        help_text='Seconds of the base backoff between retries, doubled with each retry and jittered',
+    )
+    cache_ttl = models.PositiveIntegerField(
+        'Response cache TTL', null=True, blank=True,
+        help_text='Seconds GET responses of the service are shared between gateway requests, empty to disable',
+    )
+    cache_scope = models.CharField(
+        'Response cache scope', choices=CacheScopeChoices, max_length=16, default=CACHE_SCOPE_USER,
+        help_text='Whether cached responses are shared by the same user or by the whole organization',
+    )
+    coalesce_requests = models.BooleanField(
+        'Coalesce identical requests', default=False,
+        help_text='Identical concurrent GET requests in the response cache scope share one request to the service',
+    )
+    organization_throttle_rate = models.CharField(
+        'Organization throttle rate', max_length=32, blank=True, validators=[THROTTLE_RATE_VALIDATOR],
+        help_text='Gateway requests per organization to the service, e.g. "1000/minute"',
+    )
+    user_throttle_rate = models.CharField(
+        'User throttle rate', max_length=32, blank=True, validators=[THROTTLE_RATE_VALIDATOR],
+        help_text='Gateway requests per user to the service, e.g. "100/minute", groups may grant more',
+    )
     core_groups = models.ManyToManyField(
         CoreGroup,
         verbose_name='Logic Module groups',
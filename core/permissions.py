@@ -1,45 +1,78 @@
 import logging
+from typing import Iterable, Optional
 
 from rest_framework import permissions
 
-from core.models import Organization
+from core.models import CoreGroup, Organization, PERMISSIONS_NO_ACCESS
 
 
 logger = logging.getLogger(__name__)
 
 
+# Bits of the CRUD permissions of CoreGroup.permissions, '1001' is create and delete
+PERMISSION_CREATE = 0b1000
+PERMISSION_READ = 0b0100
+PERMISSION_UPDATE = 0b0010
+PERMISSION_DELETE = 0b0001
+PERMISSIONS_ALL = PERMISSION_CREATE | PERMISSION_READ | PERMISSION_UPDATE | PERMISSION_DELETE
+
+# Permission bit required by an HTTP method or CRUD action
+METHOD_PERMISSIONS = {
+    # HTTP methods
+    'POST': PERMISSION_CREATE,
+    'GET': PERMISSION_READ,
+    'HEAD': PERMISSION_READ,
+    'PUT': PERMISSION_UPDATE,
+    'PATCH': PERMISSION_UPDATE,
+    'DELETE': PERMISSION_DELETE,
+    'OPTIONS': PERMISSION_READ,
+    # CRUD actions
+    'create': PERMISSION_CREATE,
+    'list': PERMISSION_READ,
+    'retrieve': PERMISSION_READ,
+    'update': PERMISSION_UPDATE,
+    'partial_update': PERMISSION_UPDATE,
+    'destroy': PERMISSION_DELETE,
+}
+
+
+def get_permission_mask(permissions_: int) -> int:
+    """ Permissions of a group as a bit mask, values above 15 grant everything """
+    return permissions_ if permissions_ <= PERMISSIONS_ALL else PERMISSIONS_ALL
+
+
+def has_method_permission(mask: int, method: str) -> bool:
+    """ Check if the permission mask allows the HTTP method or CRUD action """
+    try:
+        return bool(mask & METHOD_PERMISSIONS[method])
+    except KeyError:
+        logger.warning(f'No view method with such name: {method}')
+        return False
+
+
 def merge_permissions(permissions1: str, permissions2: str) -> str:
     """ Merge two CRUD permissions string representations"""
-    return ''.join(
-        map(str, [max(int(i), int(j)) for i, j in zip(permissions1, permissions2)])
-    )
+    return '{0:04b}'.format(int(permissions1, 2) | int(permissions2, 2))
 
 
 def has_permission(permissions_: str, method: str) -> bool:
     """ Check if HTTP method or CRUD action corresponds to permissions"""
-    methods = {
-        # HTTP methods
-        'POST': 0,
-        'GET': 1,
-        'HEAD': 1,
-        'PUT': 2,
-        'PATCH': 2,
-        'DELETE': 3,
-        'OPTIONS': 1,
-        # CRUD actions
-        'create': 0,
-        'list': 1,
-        'retrieve': 1,
-        'update': 2,
-        'partial_update': 2,
-        'destroy': 3,
-    }
-    try:
-        i = methods[method]
-    except KeyError:
-        logger.warning(f'No view method with such name: {method}')
-        return False
-    return bool(int(permissions_[i]))
+    return has_method_permission(int(permissions_, 2), method)
+
+
+def get_effective_permissions(groups: Iterable[CoreGroup], organization_id: Optional[int]) -> int:
+    """
+    Merge the CRUD permissions the groups of a logic module grant to the users of the
+    organization: global groups and org-level groups of the organization. A logic
+    module without such groups is open to everybody.
+    """
+    mask = PERMISSIONS_NO_ACCESS
+    has_groups = False
+    for group in groups:
+        if group.is_global or (group.organization_id == organization_id and group.is_org_level):
+            mask |= get_permission_mask(group.permissions)
+            has_groups = True
+    return mask if has_groups else PERMISSIONS_ALL
 
 
 class IsSuperUserBrowseableAPI(permissions.BasePermission):
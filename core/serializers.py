@@ -14,6 +14,9 @@ from rest_framework import serializers
 
 from core.email_utils import send_email, send_email_body
 from core.helpers.oauth import EmailVerificationToken
+from core.permissions import (
+    PERMISSION_CREATE, PERMISSION_DELETE, PERMISSION_READ, PERMISSION_UPDATE, get_permission_mask
+)
 
 from core.models import CoreUser, CoreGroup, EmailTemplate, LogicModule, Organization, OrganizationType, PERMISSIONS_ORG_ADMIN, \
     TEMPLATE_RESET_PASSWORD, PERMISSIONS_VIEW_ONLY, Partner, Subscription, Coupon, Referral, ROLE_ORGANIZATION_ADMIN
@@ -34,24 +37,32 @@ class PermissionsField(serializers.DictField):
     For example:
     9 -> '1001' (binary representation) -> `{'create': True, 'read': False, 'update': False, 'delete': True}`
     """
-    _keys = ('create', 'read', 'update', 'delete')
+    _bits = {
+        'create': PERMISSION_CREATE,
+        'read': PERMISSION_READ,
+        'update': PERMISSION_UPDATE,
+        'delete': PERMISSION_DELETE,
+    }
 
     def __init__(self, *args, **kwargs):
         kwargs['child'] = serializers.BooleanField()
         super().__init__(*args, **kwargs)
 
     def to_representation(self, value):
-        permissions = list('{0:04b}'.format(value if value < 16 else 15))
-        return dict(zip(self._keys, map(bool, map(int, permissions))))
+        mask = get_permission_mask(value)
+        return {key: bool(mask & bit) for key, bit in self._bits.items()}
 
     def to_internal_value(self, data):
         data = super().to_internal_value(data)
         keys = data.keys()
-        if not set(keys) == set(self._keys):
+        if not set(keys) == set(self._bits):
             raise serializers.ValidationError("Permissions field: incorrect keys format")
 
-        permissions = ''.join([str(int(data[key])) for key in self._keys])
-        return int(permissions, 2)
+        mask = 0
+        for key, bit in self._bits.items():
+            if data[key]:
+                mask |= bit
+        return mask
 
 
 class UUIDPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
@@ -0,0 +1,75 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+from django.http import HttpResponse, StreamingHttpResponse
+
+from core import compression
+from core.middleware import CompressionMiddleware
+
+CONTENT = json.dumps([{'id': i, 'name': 'document', 'tags': ['a', 'b']} for i in range(200)]).encode()
+
+
+def make_middleware(response):
+    return CompressionMiddleware(lambda request: response)
+
+
+def test_negotiate_encoding():
+    assert compression.negotiate_encoding('gzip, deflate') == 'gzip'
+    assert compression.negotiate_encoding('gzip;q=0') is None
+    assert compression.negotiate_encoding('identity') is None
+    assert compression.negotiate_encoding('*') == next(iter(compression.COMPRESSORS))
+    assert compression.negotiate_encoding('') is None
+
+
+def test_compresses_large_response(rf):
+    response = HttpResponse(CONTENT, content_type='application/json')
+    response['ETag'] = '"abc"'
+
+    response = make_middleware(response)(rf.get('/', HTTP_ACCEPT_ENCODING='gzip, deflate'))
+
+    assert response['Content-Encoding'] == 'gzip'
+    assert response['Vary'] == 'Accept-Encoding'
+    assert response['ETag'] == 'W/"abc"'
+    assert int(response['Content-Length']) < len(CONTENT)
+    assert gzip.decompress(response.content) == CONTENT
+
+
+@pytest.mark.parametrize('accept_encoding, content', [
+    ('gzip', b'{"id": 1}'),
+    ('', CONTENT),
+    ('br;q=1, gzip;q=0', CONTENT),
+])
+def test_does_not_compress(rf, settings, accept_encoding, content):
+    settings.RESPONSE_COMPRESSION_MIN_SIZE = 1024
+    response = make_middleware(HttpResponse(content))(rf.get('/', HTTP_ACCEPT_ENCODING=accept_encoding))
+
+    assert not response.has_header('Content-Encoding')
+    assert response.content == content
+
+
+def test_compresses_streaming_response(rf):
+    chunks = [CONTENT[i:i + 1024] for i in range(0, len(CONTENT), 1024)]
+    response = StreamingHttpResponse(iter(chunks))
+    response['Content-Length'] = str(len(CONTENT))
+
+    response = make_middleware(response)(rf.get('/', HTTP_ACCEPT_ENCODING='gzip'))
+
+    assert response['Content-Encoding'] == 'gzip'
+    assert not response.has_header('Content-Length')
+    assert gzip.decompress(b''.join(response.streaming_content)) == CONTENT
+
+
+def test_compresses_async_streaming_response(rf):
+    async def stream():
+        for i in range(0, len(CONTENT), 1024):
+            yield CONTENT[i:i + 1024]
+
+    response = make_middleware(StreamingHttpResponse(stream()))(rf.get('/', HTTP_ACCEPT_ENCODING='gzip'))
+
+    async def consume():
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    assert response['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(asyncio.run(consume())) == CONTENT
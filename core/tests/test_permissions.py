@@ -1,4 +1,12 @@
-from core.permissions import has_permission, merge_permissions
+import timeit
+
+import pytest
+
+from core.models import CoreGroup
+from core.permissions import (
+    PERMISSION_DELETE, PERMISSION_READ, PERMISSIONS_ALL, get_effective_permissions, get_permission_mask,
+    has_method_permission, has_permission, merge_permissions
+)
 
 
 class TestMergePermissions:
@@ -28,3 +36,58 @@ class TestHasPermission:
     def test_has_permission_no_method(self):
         result = has_permission('0100', 'CONNECT')
         assert not result
+
+
+class TestPermissionMask:
+    def test_has_method_permission(self):
+        mask = PERMISSION_READ | PERMISSION_DELETE
+        assert has_method_permission(mask, 'GET')
+        assert has_method_permission(mask, 'destroy')
+        assert not has_method_permission(mask, 'PATCH')
+        assert not has_method_permission(mask, 'CONNECT')
+
+    def test_get_permission_mask(self):
+        assert get_permission_mask(9) == 0b1001
+        assert get_permission_mask(20) == PERMISSIONS_ALL
+
+    def test_get_effective_permissions(self):
+        groups = [
+            CoreGroup(permissions=0b0100, is_global=True),
+            CoreGroup(permissions=0b0010, organization_id=1, is_org_level=True),
+            CoreGroup(permissions=0b0001, organization_id=2, is_org_level=True),
+            CoreGroup(permissions=0b1000, organization_id=1),
+        ]
+
+        assert get_effective_permissions(groups, 1) == 0b0110
+        assert get_effective_permissions(groups, 2) == 0b0101
+        # a logic module without groups is open to everybody
+        assert get_effective_permissions(groups[2:], 1) == PERMISSIONS_ALL
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('count', [10, 100, 1000])
+def test_benchmark_permission_masks_vs_strings(count):
+    groups = [CoreGroup(permissions=i % 16, organization_id=1, is_org_level=True) for i in range(count)]
+
+    def merge_strings():
+        # the former string based merging, character by character
+        permissions = '0000'
+        for group in groups:
+            display_permissions = '{0:04b}'.format(group.permissions)
+            permissions = ''.join(
+                map(str, [max(int(i), int(j)) for i, j in zip(permissions, display_permissions)])
+            )
+        return bool(int(permissions[{'GET': 1}['GET']]))
+
+    def merge_masks():
+        return has_method_permission(get_effective_permissions(groups, 1), 'GET')
+
+    assert merge_strings() == merge_masks()
+
+    number = max(100000 // count, 1)
+    strings_time = min(timeit.repeat(merge_strings, number=number, repeat=3)) / number
+    masks_time = min(timeit.repeat(merge_masks, number=number, repeat=3)) / number
+    print(
+        f'\nUser with {count} groups: string permissions {strings_time * 1e6:.1f}us, '
+        f'bit masks {masks_time * 1e6:.1f}us per check'
+    )
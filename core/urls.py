@@ -30,11 +30,12 @@ router.register(r'subscription', views.SubscriptionViewSet)
 
 
 urlpatterns = [
+    # most requests are for services, the gateway skips reserved names in constant time
+    path('', include('gateway.urls')),
     path('', index),
     path('admin/', admin.site.urls),
     path('health_check/', include('health_check.urls')),
     path('datamesh/', include('datamesh.urls')),
-    path('', include('gateway.urls')),
     path('token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('token/verify/', TokenVerifyView.as_view(), name='token_verify'),
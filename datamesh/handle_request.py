@@ -1,15 +1,16 @@
-import json
 from typing import Union
 
 from django.core.exceptions import ValidationError
 from django.forms.models import model_to_dict
 from datamesh.utils import validate_join, delete_join_record, join_record, prepare_request
 from gateway.clients import SwaggerClient
+from gateway.codecs import json_codec
+from gateway.retries import NO_RETRIES
+from gateway.upstream import send_request
 from django.apps import apps
 import gateway.request as gateway_request
 from .exceptions import DatameshConfigurationError
 import logging
-import requests
 
 logger = logging.getLogger(__name__)
 
@@ -189,8 +190,9 @@ class RequestHandler:
             else:
                 # create a client for performing data requests
                 g_request = gateway_request.GatewayRequest(self.request_kwargs['request'])
-                spec = g_request._get_swagger_spec(self.request_param[relationship]['service'])
-                client = SwaggerClient(spec, relation_data)
+                service = self.request_param[relationship]['service']
+                spec = g_request._get_swagger_spec(service)
+                client = SwaggerClient(spec, relation_data, g_request._get_logic_module(service))
 
                 # perform a service data request
                 content, status_code, headers = client.request(**self.request_param[relationship])
@@ -260,11 +262,13 @@ class RequestHandler:
     def perform_get_request(self, relationship: str, related_pk: [int, str]):
 
         service_url, header = prepare_request(request=self.request, request_param=self.request_param[relationship], related_model_pk=related_pk)
-        result = requests.get(url=service_url, headers=header)
+        # the request goes through the gateway itself, whose request to the service is retried
+        # and guarded by the circuit breaker of the service
+        result = send_request('get', service_url, retry_policy=NO_RETRIES, guarded=False, headers=header)
 
         if result.status_code in [200] and relationship in self.request_response:
             relation_data = self.request_response[relationship].copy()
-            relation_data.append(result.json())
+            relation_data.append(json_codec.loads(result.content))
 
             self.request_response.update({relationship: relation_data})
 
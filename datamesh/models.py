@@ -50,11 +50,11 @@ class LogicModuleModel(models.Model):
         """
         relationships = Relationship.objects.filter(
             Q(origin_model=self) | Q(related_model=self)
-        )
+        ).select_related('origin_model', 'related_model')
         relationships_with_direction = list()
         for relationship in relationships:
             relationships_with_direction.append(
-                (relationship, relationship.origin_model == self)
+                (relationship, relationship.origin_model_id == self.pk)
             )
 
         return relationships_with_direction
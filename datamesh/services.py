@@ -1,11 +1,14 @@
 import logging
 import asyncio
-from typing import Any, Dict, Generator, Union
+from typing import Any, Callable, Dict, Generator, Optional, Union
 
 from asgiref.sync import sync_to_async
 from django.apps import apps
 from django.forms.models import model_to_dict
 
+from gateway.exceptions import ServiceUnavailable
+from gateway.metrics import datamesh_cache_hits, datamesh_join_record_queries, datamesh_related_fetches
+from gateway.timing import RequestTimer
 from .models import LogicModuleModel, Relationship, JoinRecord
 from .utils import prepare_lookup_kwargs
 from .exceptions import DatameshConfigurationError
@@ -24,6 +27,7 @@ class DataMesh:
         logic_module_endpoint: str,
         model_endpoint: str,
         access_validator: Any = None,
+        timer: Optional[RequestTimer] = None,
     ):
         self._logic_module_model = LogicModuleModel.objects.get(
             logic_module_endpoint_name=logic_module_endpoint, endpoint=model_endpoint
@@ -31,21 +35,36 @@ class DataMesh:
         self._relationships = self._logic_module_model.get_relationships()
         self._origin_lookup_field = self._logic_module_model.lookup_field_name
         self._access_validator = access_validator
+        self._timer = timer or RequestTimer()
         self._cache = {}
 
     @classmethod
-    async def async_create(cls, logic_module_endpoint, model_endpoint, access_validator=None):
+    async def async_create(cls, logic_module_endpoint, model_endpoint, access_validator=None, timer=None):
         logic_module_model = await sync_to_async(LogicModuleModel.objects.get)(
             logic_module_endpoint_name=logic_module_endpoint, endpoint=model_endpoint
         )
         instance = cls.__new__(cls)
         instance._logic_module_model = logic_module_model
-        instance._relationships = logic_module_model.get_relationships()
+        instance._relationships = await sync_to_async(logic_module_model.get_relationships)()
         instance._origin_lookup_field = logic_module_model.lookup_field_name
         instance._access_validator = access_validator
+        instance._timer = timer or RequestTimer()
         instance._cache = {}
         return instance
 
+    @property
+    def origin_lookup_field(self) -> str:
+        return self._origin_lookup_field
+
+    def select_relationships(self, include: Callable[[str], bool]) -> None:
+        """ Join only the relationships whose key is included, e.g. by a field projection of the request """
+        self._relationships = [
+            (relationship, is_forward_lookup)
+            for relationship, is_forward_lookup in self._relationships
+            if include(relationship.key)
+        ]
+        self.__dict__.pop('_related_logic_modules', None)
+
     @property
     def related_logic_modules(self) -> list:
         if not hasattr(self, '_related_logic_modules'):
@@ -64,9 +83,11 @@ class DataMesh:
 
     def get_related_records_meta(self, origin_pk: Any) -> Generator[tuple, None, None]:
         for relationship, is_forward_lookup in self._relationships:
-            join_records = JoinRecord.objects.get_join_records(
-                origin_pk, relationship, is_forward_lookup
-            )
+            with self._timer.phase('join-records'):
+                join_records = list(JoinRecord.objects.get_join_records(
+                    origin_pk, relationship, is_forward_lookup
+                ))
+            datamesh_join_record_queries.inc(relationship.key)
             if join_records:
                 related_model, related_record_field = prepare_lookup_kwargs(
                     is_forward_lookup, relationship, join_records[0]
@@ -82,9 +103,11 @@ class DataMesh:
 
     async def async_get_related_records_meta(self, origin_pk: Any):
         for relationship, is_forward_lookup in self._relationships:
-            join_records = await sync_to_async(JoinRecord.objects.get_join_records)(
-                origin_pk, relationship, is_forward_lookup
-            )
+            with self._timer.phase('join-records'):
+                join_records = await sync_to_async(self._get_join_records)(
+                    origin_pk, relationship, is_forward_lookup
+                )
+            datamesh_join_record_queries.inc(relationship.key)
             if join_records:
                 related_model, related_record_field = prepare_lookup_kwargs(
                     is_forward_lookup, relationship, join_records[0]
@@ -98,6 +121,11 @@ class DataMesh:
                     }
                     yield relationship, params
 
+    @staticmethod
+    def _get_join_records(origin_pk: Any, relationship: Relationship, is_forward_lookup: bool) -> list:
+        """ Evaluate join records in a sync context, so they can be iterated in async code """
+        return list(JoinRecord.objects.get_join_records(origin_pk, relationship, is_forward_lookup))
+
     def extend_data(self, data: Union[dict, list], client_map: Dict[str, Any]) -> None:
         if isinstance(data, dict):
             self._add_nested_data(data, client_map)
@@ -112,35 +140,21 @@ class DataMesh:
         elif isinstance(data, list):
             for data_item in data:
                 tasks.extend(await self._prepare_tasks(data_item, client_map))
-        await asyncio.gather(*tasks)
+        with self._timer.phase('related'):
+            await asyncio.gather(*tasks)
 
     def _extend_with_local(
         self, data_item: dict, relationship: Relationship, params: dict
     ) -> None:
         cache_key = f"{params['service']}.{params['model']}.{params['pk']}"
         if cache_key in self._cache:
+            datamesh_cache_hits.inc(relationship.key)
             data_item[relationship.key].append(self._cache[cache_key])
             return
-        try:
-            model = apps.get_model(
-                app_label=params['service'], model_name=params['model']
-            )
-        except LookupError as e:
-            raise DatameshConfigurationError(f'Data Mesh configuration error: {e}')
-        lookup = {params['pk_name']: params['pk']}
-        try:
-            obj = model.objects.get(**lookup)
-        except model.DoesNotExist as e:
-            logger.warning(f'{e}, params: {lookup}')
-        else:
-            if self._access_validator:
-                if hasattr(self._access_validator, 'validate') and callable(
-                    self._access_validator.validate
-                ):
-                    self._access_validator.validate(obj)
-                else:
-                    raise DatameshConfigurationError(f'{"DataMesh Error:Access Validator should have validate method"}')
-            obj_dict = model_to_dict(obj)
+        datamesh_related_fetches.inc(relationship.key)
+        with self._timer.phase('related'):
+            obj_dict = self._get_local_object(params)
+        if obj_dict is not None:
             data_item[relationship.key].append(obj_dict)
             self._cache[cache_key] = obj_dict
 
@@ -149,8 +163,18 @@ class DataMesh:
     ) -> None:
         cache_key = f"{params['service']}.{params['model']}.{params['pk']}"
         if cache_key in self._cache:
+            datamesh_cache_hits.inc(relationship.key)
             data_item[relationship.key].append(self._cache[cache_key])
             return
+        datamesh_related_fetches.inc(relationship.key)
+        # access validation and M2M fields of the object query the DB as well
+        obj_dict = await sync_to_async(self._get_local_object)(params)
+        if obj_dict is not None:
+            data_item[relationship.key].append(obj_dict)
+            self._cache[cache_key] = obj_dict
+
+    def _get_local_object(self, params: dict) -> Union[dict, None]:
+        """ Get the related object from the local DB, validate the access and convert it to dict """
         try:
             model = apps.get_model(
                 app_label=params['service'], model_name=params['model']
@@ -159,20 +183,18 @@ class DataMesh:
             raise DatameshConfigurationError(f'Data Mesh configuration error: {e}')
         lookup = {params['pk_name']: params['pk']}
         try:
-            obj = await sync_to_async(model.objects.get)(**lookup)
+            obj = model.objects.get(**lookup)
         except model.DoesNotExist as e:
             logger.warning(f'{e}, params: {lookup}')
-        else:
-            if self._access_validator:
-                if hasattr(self._access_validator, 'validate') and callable(
-                    self._access_validator.validate
-                ):
-                    self._access_validator.validate(obj)
-                else:
-                    raise DatameshConfigurationError(f'{"DataMesh Error:Access Validator should have validate method"}')
-            obj_dict = model_to_dict(obj)
-            data_item[relationship.key].append(obj_dict)
-            self._cache[cache_key] = obj_dict
+            return None
+        if self._access_validator:
+            if hasattr(self._access_validator, 'validate') and callable(
+                self._access_validator.validate
+            ):
+                self._access_validator.validate(obj)
+            else:
+                raise DatameshConfigurationError(f'{"DataMesh Error:Access Validator should have validate method"}')
+        return model_to_dict(obj)
 
     def _add_nested_data(self, data_item: dict, client_map: Dict[str, Any]) -> None:
         origin_pk = data_item.get(self._origin_lookup_field)
@@ -193,7 +215,14 @@ class DataMesh:
             client = client_map.get(params['service'])
 
             if hasattr(client, 'request') and callable(client.request):
-                content = client.request(**params)
+                datamesh_related_fetches.inc(relationship.key)
+                try:
+                    with self._timer.phase('related'):
+                        content = client.request(**params)
+                except ServiceUnavailable as e:
+                    # leave out the related data instead of failing the whole response
+                    logger.warning(f'{e.content}, skipping join record (request params: {params})')
+                    continue
                 if isinstance(content, tuple):
                     if content[1] == 200:
                         content = content[0]
@@ -228,6 +257,7 @@ class DataMesh:
 
             params['method'] = 'get'
             client = client_map.get(params['service'])
+            datamesh_related_fetches.inc(relationship.key)
             tasks.append(
                 self._extend_content(client, data_item[relationship.key], **params)
             )
@@ -237,7 +267,12 @@ class DataMesh:
     async def _extend_content(
         self, client: Any, placeholder: list, **request_kwargs
     ) -> None:
-        content = await client.request(**request_kwargs)
+        try:
+            content = await client.request(**request_kwargs)
+        except ServiceUnavailable as e:
+            # leave out the related data instead of failing the whole response
+            logger.warning(f'{e.content}, skipping join record (request params: {request_kwargs})')
+            return
         if isinstance(content, tuple):
             content = content[0]
         if isinstance(content, dict):
@@ -1,16 +1,25 @@
 from __future__ import absolute_import, unicode_literals
 
+# First path segments that are never forwarded to a service
 API_GATEWAY_RESERVED_NAMES = [
     'admin',
+    'batch',
     'health_check',
     'docs',
     'complete',
     'disconnect',
     'static',
     'core',
+    'coregroups',
+    'coreuser',
     'logicmodule',
+    'metrics',
     'organization',
+    'partner',
     'datamesh',
     'stripe',
     'subscription',
+    'token',
+    'o',
+    'oauth',
 ]
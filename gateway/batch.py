@@ -0,0 +1,221 @@
+import asyncio
+import io
+import logging
+from types import SimpleNamespace
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.request import Request
+
+from gateway import exceptions
+from gateway.codecs import json_codec
+from gateway.request import AsyncGatewayRequest, GatewayResponse
+
+logger = logging.getLogger(__name__)
+
+BATCH_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+# Headers of the batch request that don't apply to its sub-requests
+DROPPED_META = (
+    'CONTENT_LENGTH',
+    'CONTENT_TYPE',
+    'HTTP_CONTENT_LENGTH',
+    'HTTP_CONTENT_TYPE',
+    'HTTP_IF_NONE_MATCH',
+    'HTTP_IF_MODIFIED_SINCE',
+    'wsgi.input',
+)
+
+
+class BatchItem(NamedTuple):
+    id: str
+    method: str
+    url_kwargs: Dict[str, str]
+    query: str
+    body: bytes
+    depends_on: Tuple[str, ...]
+
+    @classmethod
+    def parse(cls, index: int, data: Any) -> 'BatchItem':
+        """ Validate a sub-request like {"method": "GET", "service": "crm", "model": "contact", "pk": 1} """
+        if not isinstance(data, dict):
+            raise exceptions.RequestValidationError(f'Sub-request {index} must be an object.', 400)
+
+        method = str(data.get('method', 'GET')).upper()
+        if method not in BATCH_METHODS:
+            raise exceptions.RequestValidationError(f'Sub-request {index} has an invalid method "{method}".', 400)
+
+        url_kwargs = {}
+        for name in ('service', 'model', 'pk'):
+            value = data.get(name)
+            if value is None or value == '':
+                continue
+            value = str(value)
+            if any(char in value for char in '/?#'):
+                raise exceptions.RequestValidationError(f'Sub-request {index} has an invalid {name}.', 400)
+            url_kwargs[name] = value
+        if 'service' not in url_kwargs or 'model' not in url_kwargs:
+            raise exceptions.RequestValidationError(f'Sub-request {index} needs a service and a model.', 400)
+
+        query = data.get('query') or ''
+        if isinstance(query, dict):
+            query = urlencode(query, doseq=True)
+
+        body = data.get('body')
+        depends_on = data.get('depends_on') or ()
+        if not isinstance(depends_on, (list, tuple)):
+            depends_on = (depends_on,)
+
+        return cls(
+            id=str(data.get('id', index)),
+            method=method,
+            url_kwargs=url_kwargs,
+            query=str(query).lstrip('?'),
+            body=b'' if body is None else json_codec.dumps(body),
+            depends_on=tuple(str(dependency) for dependency in depends_on),
+        )
+
+    @property
+    def path(self) -> str:
+        segments = (self.url_kwargs[name] for name in ('service', 'model', 'pk') if name in self.url_kwargs)
+        return '/' + ''.join(f'{segment}/' for segment in segments)
+
+
+def parse_batch(data: Any) -> List[BatchItem]:
+    """ Validate the list of sub-requests, dependencies may only refer to earlier sub-requests """
+    if not isinstance(data, list) or not data:
+        raise exceptions.RequestValidationError('The batch must be a non-empty list of sub-requests.', 400)
+    if len(data) > settings.GATEWAY_BATCH_MAX_REQUESTS:
+        raise exceptions.RequestValidationError(
+            f'The batch has more than {settings.GATEWAY_BATCH_MAX_REQUESTS} sub-requests.', 400
+        )
+
+    items = []
+    ids = set()
+    for index, item_data in enumerate(data):
+        item = BatchItem.parse(index, item_data)
+        if item.id in ids:
+            raise exceptions.RequestValidationError(f'Sub-request id "{item.id}" is not unique.', 400)
+        for dependency in item.depends_on:
+            if dependency not in ids:
+                raise exceptions.RequestValidationError(
+                    f'Sub-request "{item.id}" depends on "{dependency}", which isn\'t an earlier sub-request.', 400
+                )
+        ids.add(item.id)
+        items.append(item)
+    return items
+
+
+class BatchGatewayRequest:
+    """
+    Performs the sub-requests of a batch concurrently with the async gateway, up to
+    GATEWAY_BATCH_CONCURRENCY at once. The batch is authenticated once, each sub-request
+    is checked against the permissions and throttles of the view and waits for the
+    sub-requests it depends on. A sub-request whose dependency failed isn't made.
+    """
+
+    def __init__(self, request: Request, view):
+        self.request = request
+        self.view = view
+        self.items = parse_batch(request.data)
+
+    async def perform(self) -> GatewayResponse:
+        semaphore = asyncio.Semaphore(settings.GATEWAY_BATCH_CONCURRENCY)
+        tasks = {}
+
+        async def run(item: BatchItem) -> dict:
+            for dependency in item.depends_on:
+                result = await tasks[dependency]
+                if result['status'] >= 400:
+                    return self._get_result(
+                        item, 424, {'Content-Type': 'application/json'},
+                        json_codec.dumps({'detail': f'Sub-request "{dependency}" failed.'}),
+                    )
+            async with semaphore:
+                return await self._perform_item(item)
+
+        for item in self.items:
+            tasks[item.id] = asyncio.ensure_future(run(item))
+        results = await asyncio.gather(*tasks.values())
+        return GatewayResponse(json_codec.dumps(results), 200, {'Content-Type': 'application/json'})
+
+    def build_request(self, item: BatchItem) -> Request:
+        """ A request of the authenticated user for the sub-request """
+        environ = {key: value for key, value in self.request.META.items() if key not in DROPPED_META}
+        environ.update({
+            'REQUEST_METHOD': item.method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': item.path,
+            'QUERY_STRING': item.query,
+            'CONTENT_LENGTH': str(len(item.body)),
+            'wsgi.input': io.BytesIO(item.body),
+        })
+        environ.setdefault('wsgi.url_scheme', self.request.scheme)
+        if item.body:
+            environ['CONTENT_TYPE'] = 'application/json'
+
+        request = Request(
+            WSGIRequest(environ),
+            parsers=self.view.get_parsers(),
+            authenticators=(),
+            negotiator=self.view.get_content_negotiator(),
+        )
+        request.user = self.request.user
+        request.auth = self.request.auth
+        return request
+
+    def check_request(self, request: Request, item: BatchItem) -> Optional[GatewayResponse]:
+        """ Check the sub-request like the gateway view does, return the response if it's rejected """
+        view = SimpleNamespace(kwargs=item.url_kwargs)
+        self.view._validate_incoming_request(request, **item.url_kwargs)
+        for permission_class in self.view.sub_request_permission_classes:
+            if not permission_class().has_permission(request, view):
+                content = json_codec.dumps({'detail': str(PermissionDenied.default_detail)})
+                return GatewayResponse(content, 403, {'Content-Type': 'application/json'})
+        for throttle_class in self.view.sub_request_throttle_classes:
+            throttle = throttle_class()
+            if not throttle.allow_request(request, view):
+                content = json_codec.dumps({'detail': 'Request was throttled.'})
+                headers = {'Content-Type': 'application/json'}
+                wait = throttle.wait()
+                if wait is not None:
+                    headers['Retry-After'] = str(max(round(wait), 1))
+                return GatewayResponse(content, 429, headers)
+        return None
+
+    async def _perform_item(self, item: BatchItem) -> dict:
+        request = self.build_request(item)
+        try:
+            gw_response = await sync_to_async(self.check_request)(request, item)
+            if gw_response is None:
+                gw_response = await AsyncGatewayRequest(request, **item.url_kwargs).perform()
+        except exceptions.GatewayError as e:
+            return self._get_result(item, e.status, {'Content-Type': e.content_type}, e.content)
+        except Exception:
+            logger.exception(f'Sub-request "{item.id}" of a batch failed')
+            content = json_codec.dumps({'detail': 'The sub-request failed.'})
+            return self._get_result(item, 500, {'Content-Type': 'application/json'}, content)
+        return self._get_result(item, gw_response.status_code, gw_response.headers, gw_response.content)
+
+    @staticmethod
+    def _get_result(item: BatchItem, status: int, headers, content: Any) -> dict:
+        """ Status, headers and body of a sub-request, JSON bodies are embedded as they are """
+        content_type = headers.get('Content-Type') or ''
+        result_headers = {'Content-Type': content_type} if content_type else {}
+        if headers.get('Retry-After'):
+            result_headers['Retry-After'] = headers['Retry-After']
+
+        body = content
+        if isinstance(body, str):
+            body = body.encode()
+        if not body:
+            body = None
+        elif isinstance(body, bytes):
+            try:
+                body = json_codec.loads(body) if 'json' in content_type else body.decode()
+            except ValueError:
+                body = body.decode(errors='replace')
+        return {'id': item.id, 'status': status, 'headers': result_headers, 'body': body}
@@ -0,0 +1,437 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import json
+import math
+import subprocess
+import threading
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+from aiohttp import web
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.models import CoreUser, LogicModule
+
+from .sessions import async_session_manager
+
+STUB_MODEL = 'items'
+STUB_ENDPOINT_NAME = 'benchmark{index}'
+SCENARIO_PATHS = {
+    'list': f'/{STUB_MODEL}/',
+    'detail': f'/{STUB_MODEL}/1/',
+}
+SCENARIO_MODES = ('sync', 'async')
+COMPARED_METRICS = ('rps', 'p50_ms', 'p95_ms', 'p99_ms', 'db_queries_per_request')
+
+
+def get_stub_spec(title: str, host: str) -> dict:
+    """ Swagger spec of a stub service with list and detail operations of `/items/` """
+    item_id = {'name': f'{STUB_MODEL}_id', 'in': 'path', 'required': True, 'type': 'integer'}
+    body = {'name': 'data', 'in': 'body', 'required': True, 'schema': {'$ref': '#/definitions/Item'}}
+    item = {'200': {'description': '', 'schema': {'$ref': '#/definitions/Item'}}}
+    return {
+        'swagger': '2.0',
+        'info': {'title': title, 'version': 'latest'},
+        'host': host,
+        'schemes': ['http'],
+        'basePath': '/',
+        'consumes': ['application/json'],
+        'produces': ['application/json'],
+        'paths': {
+            f'/{STUB_MODEL}/': {
+                'get': {
+                    'operationId': f'{STUB_MODEL}_list',
+                    'parameters': [{'name': 'page_size', 'in': 'query', 'required': False, 'type': 'integer'}],
+                    'responses': {'200': {'description': '', 'schema': {
+                        'type': 'object',
+                        'properties': {
+                            'count': {'type': 'integer'},
+                            'results': {'type': 'array', 'items': {'$ref': '#/definitions/Item'}},
+                        },
+                    }}},
+                },
+                'post': {
+                    'operationId': f'{STUB_MODEL}_create',
+                    'parameters': [body],
+                    'responses': {'201': item['200']},
+                },
+            },
+            f'/{STUB_MODEL}/{{{STUB_MODEL}_id}}/': {
+                'get': {'operationId': f'{STUB_MODEL}_read', 'parameters': [item_id], 'responses': item},
+                'put': {'operationId': f'{STUB_MODEL}_update', 'parameters': [item_id, body], 'responses': item},
+                'patch': {
+                    'operationId': f'{STUB_MODEL}_partial_update', 'parameters': [item_id, body], 'responses': item,
+                },
+                'delete': {
+                    'operationId': f'{STUB_MODEL}_delete',
+                    'parameters': [item_id],
+                    'responses': {'204': {'description': ''}},
+                },
+            },
+        },
+        'definitions': {
+            'Item': {
+                'type': 'object',
+                'properties': {
+                    'id': {'type': 'integer'},
+                    'name': {'type': 'string'},
+                    'data': {'type': 'string'},
+                },
+            },
+        },
+    }
+
+
+class StubService:
+    """
+    Local stand-in of a logic module: serves its swagger spec and CRUD endpoints of
+    `/items/`, each response waits `latency` seconds and items carry `payload_size`
+    bytes of data.
+    """
+
+    def __init__(self, name: str, latency: float = 0.0, payload_size: int = 256, page_size: int = 10):
+        self.name = name
+        self.latency = latency
+        self.payload_size = payload_size
+        self.page_size = page_size
+        self.endpoint: Optional[str] = None
+        self._runner: Optional[web.AppRunner] = None
+
+        self._spec = b''
+        self._item = json.dumps(self.get_item(1)).encode()
+        self._page = json.dumps({
+            'count': page_size,
+            'results': [self.get_item(i) for i in range(1, page_size + 1)],
+        }).encode()
+
+    def get_item(self, pk: int) -> dict:
+        return {'id': pk, 'name': f'{self.name} item {pk}', 'data': 'x' * self.payload_size}
+
+    def get_application(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/docs/swagger.json', self.get_spec)
+        app.router.add_get(f'/{STUB_MODEL}/', self.list_items)
+        app.router.add_post(f'/{STUB_MODEL}/', self.create_item)
+        app.router.add_get(f'/{STUB_MODEL}/{{pk}}/', self.get_item_detail)
+        app.router.add_put(f'/{STUB_MODEL}/{{pk}}/', self.update_item)
+        app.router.add_patch(f'/{STUB_MODEL}/{{pk}}/', self.update_item)
+        app.router.add_delete(f'/{STUB_MODEL}/{{pk}}/', self.delete_item)
+        return app
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.get_application(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.endpoint = f'http://{host}:{port}'
+        self._spec = json.dumps(get_stub_spec(self.name, f'{host}:{port}')).encode()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _respond(self, body: bytes, status: int = 200) -> web.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.Response(body=body, status=status, content_type='application/json')
+
+    async def get_spec(self, request: web.Request) -> web.Response:
+        return web.Response(body=self._spec, content_type='application/json')
+
+    async def list_items(self, request: web.Request) -> web.Response:
+        return await self._respond(self._page)
+
+    async def get_item_detail(self, request: web.Request) -> web.Response:
+        return await self._respond(self._item)
+
+    async def create_item(self, request: web.Request) -> web.Response:
+        await request.read()
+        return await self._respond(self._item, status=201)
+
+    async def update_item(self, request: web.Request) -> web.Response:
+        await request.read()
+        return await self._respond(self._item)
+
+    async def delete_item(self, request: web.Request) -> web.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.Response(status=204)
+
+
+class StubFleet:
+    """ Stub services running on an event loop of a background thread """
+
+    def __init__(self, services: int = 1, **kwargs):
+        self.services = [StubService(STUB_ENDPOINT_NAME.format(index=i), **kwargs) for i in range(1, services + 1)]
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='benchmark-stub-fleet', daemon=True)
+        self._thread.start()
+        for service in self.services:
+            asyncio.run_coroutine_threadsafe(service.start(), self._loop).result()
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        for service in self.services:
+            asyncio.run_coroutine_threadsafe(service.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def __enter__(self) -> 'StubFleet':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+@contextlib.contextmanager
+def registered_fleet(fleet: StubFleet) -> Iterator[List[LogicModule]]:
+    """ Register the stub services as logic modules for the duration of the benchmark """
+    logic_modules = [
+        LogicModule.objects.create(
+            name=service.name,
+            endpoint=service.endpoint,
+            endpoint_name=service.name,
+        )
+        for service in fleet.services
+    ]
+    try:
+        yield logic_modules
+    finally:
+        for logic_module in logic_modules:
+            logic_module.delete()
+
+
+class LoadResult(NamedTuple):
+    latencies: List[float]
+    errors: int
+    elapsed: float
+
+    def summarize(self) -> Dict[str, float]:
+        latencies = sorted(self.latencies)
+        return {
+            'requests': len(latencies) + self.errors,
+            'errors': self.errors,
+            'rps': round(len(latencies) / self.elapsed, 1) if self.elapsed else 0.0,
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
+
+
+def percentile(sorted_values: Sequence[float], percent: float) -> float:
+    """ Nearest-rank percentile of already sorted values """
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def run_sync_load(urls: Sequence[str], concurrency: int, headers: dict) -> LoadResult:
+    """ Request the urls through the WSGI handler from `concurrency` threads """
+    local = threading.local()
+
+    def send(url: str):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = Client()
+        started = time.perf_counter()
+        response = client.get(url, headers=headers)
+        return time.perf_counter() - started, response.status_code
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(send, urls))
+    return get_load_result(outcomes, time.perf_counter() - started)
+
+
+async def run_async_load(urls: Sequence[str], concurrency: int, headers: dict) -> LoadResult:
+    """ Request the urls through the ASGI handler with at most `concurrency` requests in flight """
+    client = AsyncClient()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(url: str):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(url, headers=headers)
+            return time.perf_counter() - started, response.status_code
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(send(url) for url in urls))
+    return get_load_result(outcomes, time.perf_counter() - started)
+
+
+def get_load_result(outcomes, elapsed: float) -> LoadResult:
+    latencies = [duration for duration, status_code in outcomes if status_code < 400]
+    return LoadResult(latencies=latencies, errors=len(outcomes) - len(latencies), elapsed=elapsed)
+
+
+class QueryCounter:
+    """
+    Count the DB queries of all threads while active. Connections opened meanwhile are
+    counted as well, the ORM calls of ASGI requests run on a thread of their own.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender=None, connection=None, **kwargs) -> None:
+        """ Count the queries of the connection, of the current thread by default """
+        connection = connection or connections[DEFAULT_DB_ALIAS]
+        with self._lock:
+            if self not in connection.execute_wrappers:
+                connection.execute_wrappers.append(self)
+                self._connections.append(connection)
+
+    def __enter__(self) -> 'QueryCounter':
+        self.install()
+        connection_created.connect(self.install)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        connection_created.disconnect(self.install)
+        with self._lock:
+            for connection in self._connections:
+                connection.execute_wrappers.remove(self)
+            self._connections.clear()
+
+    def get_per_request(self, requests: int) -> float:
+        return round(self.count / requests, 2) if requests else 0.0
+
+
+def run_sync_scenario(urls: Sequence[str], warmup: int, concurrency: int, query_sample: int, headers: dict) -> dict:
+    run_sync_load(urls[:warmup], concurrency, headers)
+    load = run_sync_load(urls, concurrency, headers)
+    # DB queries are counted on requests made one after another
+    sample = urls[:query_sample]
+    with QueryCounter() as queries:
+        run_sync_load(sample, 1, headers)
+    return {**load.summarize(), 'db_queries_per_request': queries.get_per_request(len(sample))}
+
+
+async def run_async_scenario(
+    urls: Sequence[str], warmup: int, concurrency: int, query_sample: int, headers: dict
+) -> dict:
+    """ Async counterpart of `run_sync_scenario`, on one event loop so the requests reuse its upstream session """
+    sample = urls[:query_sample]
+    # like an ASGI server's application loop after lifespan startup
+    async_session_manager.open()
+    try:
+        await run_async_load(urls[:warmup], concurrency, headers)
+        load = await run_async_load(urls, concurrency, headers)
+        with QueryCounter() as queries:
+            # the thread of thread-sensitive calls outside of a request context is already connected
+            await sync_to_async(queries.install)()
+            await run_async_load(sample, 1, headers)
+    finally:
+        await async_session_manager.close()
+    return {**load.summarize(), 'db_queries_per_request': queries.get_per_request(len(sample))}
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    user: CoreUser,
+    services: int = 2,
+    latency: float = 0.0,
+    payload_size: int = 256,
+    page_size: int = 10,
+    requests: int = 200,
+    concurrency: int = 10,
+    warmup: int = 10,
+    query_sample: int = 10,
+    paths: Sequence[str] = tuple(SCENARIO_PATHS),
+    modes: Sequence[str] = SCENARIO_MODES,
+) -> dict:
+    """
+    Boot a stub fleet, register it and drive the sync and async gateway paths at a
+    fixed concurrency. Requests go round-robin over the services, every scenario is
+    warmed up first so specs and connections are in place.
+    """
+    parameters = {
+        'services': services,
+        'latency': latency,
+        'payload_size': payload_size,
+        'page_size': page_size,
+        'requests': requests,
+        'concurrency': concurrency,
+        'warmup': warmup,
+        'query_sample': query_sample,
+    }
+    headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+    results = {}
+    # the clients are not bound to the test environment, debug cursors would skew the numbers
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], DEBUG=False), \
+            StubFleet(services, latency=latency, payload_size=payload_size, page_size=page_size) as fleet, \
+            registered_fleet(fleet) as logic_modules:
+        for mode in modes:
+            prefix = '/async' if mode == 'async' else ''
+            for path in paths:
+                urls = [
+                    f'{prefix}/{logic_modules[i % services].endpoint_name}{SCENARIO_PATHS[path]}'
+                    for i in range(requests)
+                ]
+                if mode == 'async':
+                    result = asyncio.run(run_async_scenario(urls, warmup, concurrency, query_sample, headers))
+                else:
+                    result = run_sync_scenario(urls, warmup, concurrency, query_sample, headers)
+                results[f'{mode}-{path}'] = result
+
+    return {
+        'commit': get_commit(),
+        'created': timezone.now().isoformat(),
+        'parameters': parameters,
+        'results': results,
+    }
+
+
+def compare_results(baseline: dict, current: dict) -> List[dict]:
+    """ Changes of the metrics of the scenarios both runs have, in percent of the baseline """
+    rows = []
+    for scenario, result in current['results'].items():
+        base = baseline['results'].get(scenario)
+        if base is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if metric not in base or metric not in result:
+                continue
+            change = (result[metric] - base[metric]) / base[metric] * 100 if base[metric] else None
+            rows.append({
+                'scenario': scenario,
+                'metric': metric,
+                'baseline': base[metric],
+                'current': result[metric],
+                'change': round(change, 1) if change is not None else None,
+            })
+    return rows
@@ -0,0 +1,152 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from django.conf import settings
+
+from core.models import LogicModule
+
+from . import exceptions
+from .sessions import get_upstream_key
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """
+    Health of a service as seen by this worker. Calls that fail, answer with a server
+    error or take longer than the slow call duration count as errors. When the error
+    rate over the recent calls reaches the threshold the circuit opens and calls fail
+    fast. After the open duration a few trial calls are let through (half-open), their
+    outcome closes or opens the circuit again.
+    """
+
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self.state = STATE_CLOSED
+        self._calls: Deque[Tuple[float, bool]] = deque()
+        self._opened_at = 0.0
+        self._trial_calls = 0
+        self._lock = threading.Lock()
+        self.times_opened = 0
+
+    def allow_request(self) -> bool:
+        if not self.enabled or not settings.GATEWAY_CIRCUIT_BREAKER_ENABLED:
+            return True
+        with self._lock:
+            if self.state == STATE_OPEN:
+                if time.monotonic() - self._opened_at < settings.GATEWAY_CIRCUIT_BREAKER_OPEN_DURATION:
+                    return False
+                logger.info(f'Circuit breaker of {self.name} is half-open, letting trial requests through')
+                self.state = STATE_HALF_OPEN
+                self._trial_calls = 0
+            if self.state == STATE_HALF_OPEN:
+                if self._trial_calls >= settings.GATEWAY_CIRCUIT_BREAKER_HALF_OPEN_REQUESTS:
+                    return False
+                self._trial_calls += 1
+            return True
+
+    def check(self) -> None:
+        """ Raise ServiceUnavailable if the service may not be called """
+        if not self.allow_request():
+            raise exceptions.ServiceUnavailable(
+                f'Service "{self.name}" is temporarily unavailable.',
+                headers={'Retry-After': str(self.get_retry_after())},
+            )
+
+    def get_retry_after(self) -> int:
+        remaining = settings.GATEWAY_CIRCUIT_BREAKER_OPEN_DURATION - (time.monotonic() - self._opened_at)
+        return max(math.ceil(remaining), 1)
+
+    def record(self, status_code: int, duration: float) -> None:
+        """ Record the outcome of a call that got a response """
+        failed = status_code >= 500 or duration > settings.GATEWAY_CIRCUIT_BREAKER_SLOW_CALL_DURATION
+        self._record(failed)
+
+    def record_failure(self) -> None:
+        """ Record a call that didn't get a response """
+        self._record(True)
+
+    def release(self) -> None:
+        """ Give back the trial slot of a call that ended without an outcome, e.g. when it was cancelled """
+        with self._lock:
+            if self.state == STATE_HALF_OPEN and self._trial_calls > 0:
+                self._trial_calls -= 1
+
+    def _record(self, failed: bool) -> None:
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self.state == STATE_HALF_OPEN:
+                if failed:
+                    self._open(now)
+                else:
+                    logger.info(f'Circuit breaker of {self.name} is closed')
+                    self.state = STATE_CLOSED
+                    self._calls.clear()
+                return
+
+            self._calls.append((now, failed))
+            while self._calls and now - self._calls[0][0] > settings.GATEWAY_CIRCUIT_BREAKER_WINDOW:
+                self._calls.popleft()
+            if self.state == STATE_CLOSED and len(self._calls) >= settings.GATEWAY_CIRCUIT_BREAKER_MIN_REQUESTS:
+                error_rate = sum(1 for _, call_failed in self._calls if call_failed) / len(self._calls)
+                if error_rate >= settings.GATEWAY_CIRCUIT_BREAKER_ERROR_RATE:
+                    self._open(now)
+
+    def _open(self, now: float) -> None:
+        logger.warning(f'Circuit breaker of {self.name} is open')
+        self.state = STATE_OPEN
+        self._opened_at = now
+        self._calls.clear()
+        self.times_opened += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'state': self.state,
+                'calls': len(self._calls),
+                'errors': sum(1 for _, failed in self._calls if failed),
+                'times_opened': self.times_opened,
+            }
+
+
+class CircuitBreakerRegistry:
+    """ Circuit breakers of this worker, keyed like the upstream sessions """
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, logic_module: Optional[LogicModule] = None, url: Optional[str] = None) -> CircuitBreaker:
+        key = get_upstream_key(logic_module, url)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(key)
+                if breaker is None:
+                    name = getattr(logic_module, 'endpoint_name', None) or key
+                    breaker = self._breakers[key] = CircuitBreaker(name)
+        return breaker
+
+    def is_open(self, logic_module: Optional[LogicModule] = None, url: Optional[str] = None) -> bool:
+        return self.get(logic_module, url).state == STATE_OPEN
+
+    def get_stats(self) -> Dict[str, dict]:
+        return {breaker.name: breaker.get_stats() for breaker in list(self._breakers.values())}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._breakers.clear()
+
+
+circuit_breakers = CircuitBreakerRegistry()
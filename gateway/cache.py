@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from requests.structures import CaseInsensitiveDict
+from rest_framework.request import Request
+
+from core.models import LogicModule
+
+logger = logging.getLogger(__name__)
+
+# Headers describing the transfer of the body between the service and the gateway
+# rather than the body itself, so they aren't stored with a cached response
+NOT_CACHED_HEADERS = frozenset((
+    'connection', 'content-encoding', 'content-length', 'keep-alive', 'set-cookie', 'transfer-encoding',
+))
+
+
+def get_scope(logic_module: LogicModule, request: Request) -> Optional[str]:
+    """ Authorization scope of the caller, None when a response can't be shared """
+    user = request.user
+    if not user or not user.is_authenticated:
+        return None
+    if logic_module.cache_scope == LogicModule.CACHE_SCOPE_ORGANIZATION:
+        organization_id = getattr(user, 'organization_id', None)
+        return None if organization_id is None else f'organization:{organization_id}'
+    return f'user:{user.pk}'
+
+
+def get_shared_request_key(logic_module: LogicModule, request: Request, url: str) -> Optional[str]:
+    """
+    Identify a GET request to the URL by the service, the URL, the normalized query string
+    and the authorization scope of the caller, so its response can be shared with identical
+    requests. None if the response can't be shared.
+    """
+    if request.method != 'GET':
+        return None
+    scope = get_scope(logic_module, request)
+    if scope is None:
+        return None
+    query = '&'.join(
+        f'{key}={value}'
+        for key, values in sorted(request.query_params.lists())
+        for value in sorted(values)
+    )
+    digest = hashlib.sha256(f'{url}?{query}|{scope}'.encode()).hexdigest()
+    return f'{logic_module.endpoint_name}:{digest}'
+
+
+class CachedResponse(NamedTuple):
+    status_code: int
+    headers: Dict[str, str]
+    body: bytes
+    expires: float
+
+    @property
+    def is_stale(self) -> bool:
+        return time.time() >= self.expires
+
+    def get_headers(self) -> CaseInsensitiveDict:
+        return CaseInsensitiveDict(self.headers)
+
+
+class ResponseCache:
+    """
+    Cache of GET responses of the services shared by the gateway workers through
+    Django's cache framework (eviction is left to the backend, e.g. LRU culling).
+    Responses are cached for the TTL of the logic module per authorization scope,
+    so callers never get data fetched with the credentials of another user or
+    organization. Expired responses are served for a grace period while one
+    worker fetches a fresh one.
+    """
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._stats_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._revalidation_tasks = set()
+
+    @property
+    def cache(self):
+        return caches[settings.GATEWAY_RESPONSE_CACHE_ALIAS]
+
+    @staticmethod
+    def is_enabled(logic_module: Optional[LogicModule]) -> bool:
+        return bool(getattr(logic_module, 'cache_ttl', None))
+
+    def get_key(self, logic_module: LogicModule, request: Request, url: str) -> Optional[str]:
+        """
+        Cache key of the response of a GET request to the URL, None if the request can't be cached
+        """
+        if not self.is_enabled(logic_module):
+            return None
+        request_key = get_shared_request_key(logic_module, request, url)
+        return None if request_key is None else f'gateway:response:{request_key}'
+
+    def _prepare_entry(
+        self, logic_module: LogicModule, status_code: int, headers, body: bytes
+    ) -> Optional[CachedResponse]:
+        service = logic_module.endpoint_name
+        if status_code != 200 or 'no-store' in headers.get('Cache-Control', ''):
+            return None
+        if len(body) > settings.GATEWAY_RESPONSE_CACHE_MAX_ENTRY_SIZE:
+            self._count(service, 'too_large')
+            return None
+        return CachedResponse(
+            status_code=status_code,
+            headers={key: value for key, value in headers.items() if key.lower() not in NOT_CACHED_HEADERS},
+            body=body,
+            expires=time.time() + logic_module.cache_ttl,
+        )
+
+    @staticmethod
+    def _get_timeout(logic_module: LogicModule) -> int:
+        return logic_module.cache_ttl + settings.GATEWAY_RESPONSE_CACHE_STALE_TTL
+
+    def _count_lookup(self, service: str, entry: Optional[CachedResponse]) -> None:
+        if entry is None:
+            self._count(service, 'misses')
+        elif entry.is_stale:
+            self._count(service, 'stale_hits')
+        else:
+            self._count(service, 'hits')
+
+    def get(self, logic_module: LogicModule, key: str) -> Optional[CachedResponse]:
+        entry = self.cache.get(key)
+        self._count_lookup(logic_module.endpoint_name, entry)
+        return entry
+
+    def set(self, logic_module: LogicModule, key: str, status_code: int, headers, body: bytes) -> None:
+        entry = self._prepare_entry(logic_module, status_code, headers, body)
+        if entry is not None:
+            self.cache.set(key, entry, self._get_timeout(logic_module))
+
+    async def aget(self, logic_module: LogicModule, key: str) -> Optional[CachedResponse]:
+        entry = await self.cache.aget(key)
+        self._count_lookup(logic_module.endpoint_name, entry)
+        return entry
+
+    async def aset(self, logic_module: LogicModule, key: str, status_code: int, headers, body: bytes) -> None:
+        entry = self._prepare_entry(logic_module, status_code, headers, body)
+        if entry is not None:
+            await self.cache.aset(key, entry, self._get_timeout(logic_module))
+
+    def revalidate(self, logic_module: LogicModule, key: str, fetch: Callable[[], None]) -> None:
+        """ Refresh a stale response in the background, only one worker at a time does it """
+        if not self.cache.add(f'{key}:revalidate', 1, settings.GATEWAY_RESPONSE_CACHE_STALE_TTL):
+            return
+        self._count(logic_module.endpoint_name, 'revalidations')
+        self._get_executor().submit(self._run_revalidation, key, fetch)
+
+    async def arevalidate(self, logic_module: LogicModule, key: str, fetch: Callable[[], Awaitable[None]]) -> None:
+        if not await self.cache.aadd(f'{key}:revalidate', 1, settings.GATEWAY_RESPONSE_CACHE_STALE_TTL):
+            return
+        self._count(logic_module.endpoint_name, 'revalidations')
+        task = asyncio.ensure_future(self._arun_revalidation(key, fetch))
+        # keep a reference, the event loop only keeps weak references to tasks
+        self._revalidation_tasks.add(task)
+        task.add_done_callback(self._revalidation_tasks.discard)
+
+    def _run_revalidation(self, key: str, fetch: Callable[[], None]) -> None:
+        try:
+            fetch()
+        except Exception as e:
+            logger.warning(f'Revalidation of the cached response {key} failed: {e}')
+        finally:
+            self.cache.delete(f'{key}:revalidate')
+
+    async def _arun_revalidation(self, key: str, fetch: Callable[[], Awaitable[None]]) -> None:
+        try:
+            await fetch()
+        except Exception as e:
+            logger.warning(f'Revalidation of the cached response {key} failed: {e}')
+        finally:
+            await self.cache.adelete(f'{key}:revalidate')
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=settings.GATEWAY_RESPONSE_CACHE_REVALIDATION_WORKERS,
+                        thread_name_prefix='gateway-revalidation',
+                    )
+        return self._executor
+
+    def _count(self, service: str, counter: str) -> None:
+        with self._stats_lock:
+            self._stats[service][counter] += 1
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """ Hit/miss counters of this worker per service """
+        with self._stats_lock:
+            return {service: dict(counters) for service, counters in self._stats.items()}
+
+    def reset_stats(self) -> None:
+        with self._stats_lock:
+            self._stats.clear()
+
+
+response_cache = ResponseCache()
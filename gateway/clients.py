@@ -1,31 +1,73 @@
+import asyncio
+import contextlib
+import functools
 import logging
-import json
-from typing import Any, Dict, Tuple
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple, Union
 
-import requests
 import aiohttp
+import requests
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
 from django.http.request import QueryDict
 from bravado_core.spec import Spec
 from rest_framework.request import Request
 from rest_framework.authentication import get_authorization_header
 
+from core.compression import UPSTREAM_ACCEPT_ENCODING
+from core.models import LogicModule
+
 from . import exceptions
 from . import utils
+from .cache import response_cache
+from .codecs import json_codec
+from .coalescing import SharedResponse, request_coalescer
+from .multipart import MultipartStream
+from .routing import Route, get_route_table
+from .sessions import async_session_manager
+from .upstream import send_async_request, send_request
 
 logger = logging.getLogger(__name__)
 
+CONDITIONAL_REQUEST_HEADERS = ('If-None-Match', 'If-Modified-Since')
+# Validators are only forwarded for reads, the gateway doesn't handle 304/412 answers to writes
+CONDITIONAL_REQUEST_METHODS = ('GET', 'HEAD')
+
 
 class BaseSwaggerClient:
     """ Base for client class that is responsible for retrieving data from the service with Swagger spec"""
 
-    def __init__(self, spec: Spec, incoming_request: Request):
+    def __init__(self, spec: Spec, incoming_request: Request, logic_module: LogicModule = None):
         self._spec = spec
         self._in_request = incoming_request
+        self._logic_module = logic_module
         self._data = dict()
 
     def request(self, **kwargs):
         raise NotImplementedError()
 
+    @staticmethod
+    def decode_body(body: bytes, passthrough: bool = False) -> Any:
+        """ Decode a JSON response body, other bodies and passed through ones are left as they are """
+        if passthrough:
+            return body
+        try:
+            return json_codec.loads(body)
+        except ValueError:
+            return body
+
+    @staticmethod
+    def should_stream(content_length: Optional[str]) -> bool:
+        """
+        Stream the response body to the client when its size is unknown or above
+        the threshold, smaller bodies are cheaper to read at once
+        """
+        if content_length is None:
+            return True
+        try:
+            return int(content_length) > settings.GATEWAY_STREAMING_THRESHOLD
+        except ValueError:
+            return True
+
     def is_valid_for_cache(self) -> bool:
         """ Checks if request is valid for caching operations """
         return (
@@ -33,53 +75,36 @@ class BaseSwaggerClient:
             and not self._in_request.query_params
         )
 
-    def prepare_data(self, spec: Spec, **kwargs) -> Tuple[str, str]:
-        """ Parse request URL, validates operation, and returns method and URL for outgoing request"""
-
-        # Parse URL kwargs
+    def get_route(self, spec: Spec, **kwargs) -> Optional[Route]:
+        """ Find the operation of the spec for the incoming request and the URL kwargs """
         pk = kwargs.get('pk')
         model = kwargs.get('model', '').lower()
-        path_kwargs = {}
-        if kwargs.get('pk') is None:
-            path = f'/{model}/'
-        else:
-            pk_name = 'uuid' if utils.valid_uuid4(pk) else 'id'
-
-            # update path kwargs key name
-            # example: {"product_uuid" :"db827034-30bb-4062-ac35-f8c24e8f81ad"}
-            path_kwargs = {f'{model}_{pk_name}': pk}
+        pk_kind = None if pk is None else utils.get_pk_kind(pk)
+        return get_route_table(spec).get_route(self._in_request.method, model, pk_kind)
 
-            # create path for retrieving individual data example : /product/{{product_uuid}}/
-            path_parameter_name = f'{model}_{pk_name}'
-            path = f'/{model}/{{{path_parameter_name}}}/'
+    def prepare_data(self, spec: Spec, **kwargs) -> Tuple[str, str]:
+        """ Parse request URL, validates operation, and returns method and URL for outgoing request"""
 
         # Check that operation is valid according to spec
-        request_method = self._in_request.method
-        operation = spec.get_op_for_request(request_method, path)
-        if not operation:
-            if request_method == 'OPTIONS':
-                operation = spec.get_op_for_request('GET', path)
-                operation.http_method = request_method
-            else:
-                raise exceptions.EndpointNotFound(f'Endpoint not found: {self._in_request.method} {path}')
-        method = operation.http_method.lower()
-        path_name = operation.path_name
+        route = self.get_route(spec, **kwargs)
+        if route is None:
+            pk = kwargs.get('pk')
+            model = kwargs.get('model', '').lower()
+            path = f'/{model}/' if pk is None else f'/{model}/{{{model}_{utils.get_pk_kind(pk)}}}/'
+            raise exceptions.EndpointNotFound(f'Endpoint not found: {self._in_request.method} {path}')
 
         # Build URL for the operation to request data from the service
-        url = spec.api_url.rstrip('/') + path_name
-        for k, v in path_kwargs.items():
-            url = url.replace(f'{{{k}}}', v)
+        return route.http_method, route.build_url(kwargs.get('pk'))
 
-        return method, url
-
-    def get_request_data(self) -> dict:
+    def get_request_data(self) -> Union[bytes, dict, MultipartStream]:
         """
         Create the data structure to be used in Swagger request. GET and  DELETE
         requests do not require body, so the data structure will have just
-        query parameters if passed to swagger request.
+        query parameters if passed to swagger request. Requests with uploaded files
+        get a multipart body streaming the files and every value of the other fields.
         """
         if self._in_request.content_type == 'application/json':
-            return json.dumps(self._in_request.data)
+            return json_codec.dumps(self._in_request.data)
 
         method = self._in_request.META['REQUEST_METHOD'].lower()
 
@@ -93,6 +118,21 @@ class BaseSwaggerClient:
             query_dict_body = (
                 self._in_request.data if hasattr(self._in_request, 'data') else dict()
             )
+
+            # handle uploaded files, the parsed body has them among the fields
+            if self._in_request.FILES:
+                body_fields = (
+                    [(key, value) for key, values in query_dict_body.lists() for value in values]
+                    if isinstance(query_dict_body, QueryDict)
+                    else list(query_dict_body.items())
+                )
+                body_fields = [(key, value) for key, value in body_fields if not isinstance(value, UploadedFile)]
+                body_keys = {key for key, _ in body_fields}
+                return MultipartStream(
+                    fields=[(key, value) for key, value in data.items() if key not in body_keys] + body_fields,
+                    files=[(key, file) for key, files in self._in_request.FILES.lists() for file in files],
+                )
+
             body = (
                 query_dict_body.dict()
                 if isinstance(query_dict_body, QueryDict)
@@ -101,33 +141,40 @@ class BaseSwaggerClient:
 
             data.update(body)
 
-            # handle uploaded files
-            if self._in_request.FILES:
-                for key, value in self._in_request.FILES.items():
-                    data[key] = {
-                        'header': {'Content-Type': value.content_type},
-                        'data': value,
-                        'filename': value.name,
-                    }
-
         return data
 
-    def get_headers(self) -> dict:
-        """Get data and headers from the incoming request."""
+    def get_headers(self, conditional: bool = False) -> dict:
+        """
+        Get data and headers from the incoming request. With `conditional` the validators
+        of an incoming GET or HEAD request are forwarded, so the service can skip sending an
+        unchanged body.
+        """
         headers = {
-            'Authorization': get_authorization_header(self._in_request).decode('utf-8')
+            'Authorization': get_authorization_header(self._in_request).decode('utf-8'),
+            # the response is decoded by the HTTP client, compression only saves bandwidth in the cluster
+            'Accept-Encoding': UPSTREAM_ACCEPT_ENCODING,
         }
         if self._in_request.content_type == 'application/json':
             headers['content-type'] = 'application/json'
+        if conditional and self._in_request.method in CONDITIONAL_REQUEST_METHODS:
+            for header in CONDITIONAL_REQUEST_HEADERS:
+                value = self._in_request.headers.get(header)
+                if value is not None:
+                    headers[header] = value
         return headers
 
 
 class SwaggerClient(BaseSwaggerClient):
     """ Synchronous implementation of Swagger client using requests lib """
 
-    def request(self, **kwargs) -> Tuple[Any, int, Dict[str, str]]:
+    def request(
+        self, passthrough: bool = False, streaming: bool = False, **kwargs
+    ) -> Tuple[Any, int, Dict[str, str]]:
         """
-        Perform request to the service, use Swagger spec for validating operation
+        Perform request to the service, use Swagger spec for validating operation.
+        With `passthrough` the response body is returned as raw bytes instead of
+        being decoded, with `streaming` a large body is returned as an iterator
+        of chunks instead of being read into memory.
         """
 
         method, url = self.prepare_data(self._spec, **kwargs)
@@ -137,16 +184,71 @@ class SwaggerClient(BaseSwaggerClient):
             logger.debug(f'Taking data from cache: {url}')
             return self._data[url]
 
-        # Make request to the service
-        method = getattr(requests, method)
+        # Check the response cache shared between requests, a stale response is refreshed in background
+        cache_key = response_cache.get_key(self._logic_module, self._in_request, url)
+        if cache_key is not None:
+            cached = response_cache.get(self._logic_module, cache_key)
+            if cached is not None:
+                if cached.is_stale:
+                    # the query params are copied now, joins replace them before the refresh runs
+                    fetch = functools.partial(self._fetch, method, url, cache_key, self._in_request.query_params.copy())
+                    response_cache.revalidate(self._logic_module, cache_key, fetch)
+                return self.decode_body(cached.body, passthrough), cached.status_code, cached.get_headers()
+
+        # Share the response of an identical request in flight, such responses aren't streamed
+        coalescing_key = request_coalescer.get_key(self._logic_module, self._in_request, url)
+        if coalescing_key is not None:
+            shared = request_coalescer.run(
+                self._logic_module, coalescing_key, functools.partial(self._fetch, method, url, cache_key)
+            )
+            return_data = (self.decode_body(shared.body, passthrough), shared.status_code, shared.get_headers())
+        else:
+            # the validators of the client are only meaningful to the service for its own body,
+            # a response for the shared cache needs the body anyway
+            response = self._send(method, url, streaming, conditional=passthrough and cache_key is None)
+            if streaming and self.should_stream(response.headers.get('Content-Length')):
+                return self._iter_content(response), response.status_code, response.headers
+
+            if cache_key is not None:
+                response_cache.set(
+                    self._logic_module, cache_key, response.status_code, response.headers, response.content
+                )
+            return_data = (self.decode_body(response.content, passthrough), response.status_code, response.headers)
+
+        # Cache data if request is cache-valid
+        if self.is_valid_for_cache():
+            self._data[url] = return_data
+
+        return return_data
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        streaming: bool = False,
+        conditional: bool = False,
+        params: Optional[QueryDict] = None,
+    ) -> requests.Response:
+        """
+        Make request to the service using the keep-alive session and the retry policy of the service,
+        with the query params of the incoming request unless `params` are given
+        """
+        data = self.get_request_data()
+        headers = self.get_headers(conditional)
+        if isinstance(data, MultipartStream):
+            headers.update(data.headers)
         try:
-            response = method(
+            return send_request(
+                method,
                 url,
-                headers=self.get_headers(),
-                params=self._in_request.query_params,
-                data=self.get_request_data(),
-                files=self._in_request.FILES,
+                self._logic_module,
+                headers=headers,
+                params=self._in_request.query_params if params is None else params,
+                data=data,
+                stream=streaming,
             )
+        except exceptions.GatewayError:
+            raise
         except Exception as e:
             error_msg = (
                 f'An error occurred when redirecting the request to '
@@ -155,23 +257,30 @@ class SwaggerClient(BaseSwaggerClient):
             )
             raise exceptions.GatewayError(error_msg)
 
+    def _fetch(
+        self, method: str, url: str, cache_key: Optional[str], params: Optional[QueryDict] = None
+    ) -> SharedResponse:
+        """ Get the response to be shared with other requests, refresh the cached response with it """
+        response = self._send(method, url, params=params)
+        if cache_key is not None:
+            response_cache.set(self._logic_module, cache_key, response.status_code, response.headers, response.content)
+        return SharedResponse.from_response(response.status_code, response.headers, response.content)
+
+    @staticmethod
+    def _iter_content(response: requests.Response) -> Iterator[bytes]:
+        """ Yield the body in chunks, the connection goes back to the pool once the body is consumed """
         try:
-            content = response.json()
-        except ValueError:
-            content = response.content
-        return_data = (content, response.status_code, response.headers)
-
-        # Cache data if request is cache-valid
-        if self.is_valid_for_cache():
-            self._data[url] = return_data
-
-        return return_data
+            yield from response.iter_content(chunk_size=settings.GATEWAY_STREAMING_CHUNK_SIZE)
+        finally:
+            response.close()
 
 
 class AsyncSwaggerClient(BaseSwaggerClient):
     """ Asynchronous implementation of Swagger client using aiohttp lib """
 
-    async def request(self, **kwargs) -> Tuple[Any, int, Dict[str, str]]:
+    async def request(
+        self, passthrough: bool = False, streaming: bool = False, **kwargs
+    ) -> Tuple[Any, int, Dict[str, str]]:
         method, url = self.prepare_data(self._spec, **kwargs)
 
         # Check request cache if applicable
@@ -179,30 +288,113 @@ class AsyncSwaggerClient(BaseSwaggerClient):
             logger.debug(f'Taking data from cache: {url}')
             return self._data[url]
 
-        # Make request to the service
-        async with aiohttp.ClientSession() as session:
-            method = getattr(session, method)
-            if self._in_request.FILES:
-                request_data = self.get_request_data()
-                data = aiohttp.FormData()
-                for field in request_data:
-                    if field == 'file':
-                        data.add_field('file', request_data['file']['data'].file)
-                    else:
-                        data.add_field(field, request_data[field])
-            else:
-                data = self.get_request_data()
-
-            async with method(url, data=data, headers=self.get_headers()) as response:
-                try:
-                    content = await response.json()
-                except (json.JSONDecodeError, aiohttp.ContentTypeError):
-                    content = await response.read()
-
-            return_data = (content, response.status, response.headers)
+        # Check the response cache shared between requests, a stale response is refreshed in background
+        cache_key = response_cache.get_key(self._logic_module, self._in_request, url)
+        if cache_key is not None:
+            cached = await response_cache.aget(self._logic_module, cache_key)
+            if cached is not None:
+                if cached.is_stale:
+                    # the query params are copied now, joins replace them before the refresh runs
+                    fetch = functools.partial(self._fetch, method, url, cache_key, self._in_request.query_params.copy())
+                    await response_cache.arevalidate(self._logic_module, cache_key, fetch)
+                return self.decode_body(cached.body, passthrough), cached.status_code, cached.get_headers()
+
+        # Share the response of an identical request in flight, such responses aren't streamed
+        coalescing_key = request_coalescer.get_key(self._logic_module, self._in_request, url)
+        if coalescing_key is not None:
+            shared = await request_coalescer.arun(
+                self._logic_module, coalescing_key, functools.partial(self._fetch, method, url, cache_key)
+            )
+            return_data = (self.decode_body(shared.body, passthrough), shared.status_code, shared.get_headers())
+            if self.is_valid_for_cache():
+                self._data[url] = return_data
+            return return_data
+
+        response_context = contextlib.AsyncExitStack()
+        # the validators of the client are only meaningful to the service for its own body,
+        # a response for the shared cache needs the body anyway
+        response = await self._send(response_context, method, url, conditional=passthrough and cache_key is None)
+        if streaming and self.should_stream(response.headers.get('Content-Length')):
+            # the response is released by the iterator once the body is consumed
+            return self._iter_content(response_context, response), response.status, response.headers
+
+        async with response_context:
+            body = await self._read(response)
+
+        if cache_key is not None:
+            await response_cache.aset(self._logic_module, cache_key, response.status, response.headers, body)
+
+        return_data = (self.decode_body(body, passthrough), response.status, response.headers)
 
         # Cache data if request is cache-valid
         if self.is_valid_for_cache():
             self._data[url] = return_data
 
         return return_data
+
+    async def _send(
+        self,
+        response_context: contextlib.AsyncExitStack,
+        method: str,
+        url: str,
+        conditional: bool = False,
+        params: Optional[QueryDict] = None,
+    ) -> aiohttp.ClientResponse:
+        """
+        Make request to the service using the application-wide session,
+        the response is released when the response context exits.
+        The query params of the incoming request are sent unless `params` are given.
+        """
+        if params is None:
+            params = self._in_request.query_params
+        data = self.get_request_data()
+        headers = self.get_headers(conditional)
+        if isinstance(data, MultipartStream):
+            headers.update(data.headers)
+        try:
+            return await send_async_request(
+                response_context,
+                async_session_manager.get_session(),
+                method,
+                url,
+                self._logic_module,
+                params=[(key, value) for key, values in params.lists() for value in values],
+                data=data,
+                headers=headers,
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise self._get_gateway_error(e)
+
+    async def _read(self, response: aiohttp.ClientResponse) -> bytes:
+        try:
+            return await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise self._get_gateway_error(e)
+
+    @staticmethod
+    def _get_gateway_error(e: Exception) -> exceptions.GatewayError:
+        error_msg = (
+            f'An error occurred when redirecting the request to '
+            f'or receiving the response from the service.\n'
+            f'Origin: ({e.__class__.__name__}: {e})'
+        )
+        return exceptions.GatewayError(error_msg)
+
+    async def _fetch(
+        self, method: str, url: str, cache_key: Optional[str], params: Optional[QueryDict] = None
+    ) -> SharedResponse:
+        """ Get the response to be shared with other requests, refresh the cached response with it """
+        async with contextlib.AsyncExitStack() as response_context:
+            response = await self._send(response_context, method, url, params=params)
+            body = await self._read(response)
+        if cache_key is not None:
+            await response_cache.aset(self._logic_module, cache_key, response.status, response.headers, body)
+        return SharedResponse.from_response(response.status, response.headers, body)
+
+    @staticmethod
+    async def _iter_content(
+        response_context: contextlib.AsyncExitStack, response: aiohttp.ClientResponse
+    ) -> AsyncIterator[bytes]:
+        async with response_context:
+            async for chunk in response.content.iter_chunked(settings.GATEWAY_STREAMING_CHUNK_SIZE):
+                yield chunk
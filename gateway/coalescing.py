@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+import weakref
+from collections import defaultdict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from requests.structures import CaseInsensitiveDict
+from rest_framework.request import Request
+
+from core.models import LogicModule
+
+from .cache import get_shared_request_key
+
+logger = logging.getLogger(__name__)
+
+
+class SharedResponse(NamedTuple):
+    """ Response of a service shared by identical concurrent requests """
+    status_code: int
+    headers: Dict[str, str]
+    body: bytes
+
+    @classmethod
+    def from_response(cls, status_code: int, headers, body: bytes) -> 'SharedResponse':
+        return cls(status_code=status_code, headers=dict(headers.items()), body=body)
+
+    def get_headers(self) -> CaseInsensitiveDict:
+        return CaseInsensitiveDict(self.headers)
+
+
+class RequestCoalescer:
+    """
+    Single-flight execution of identical concurrent GET requests to a service.
+    Within a worker, followers wait for the future of the request in flight and make
+    the request themselves if it takes longer than GATEWAY_COALESCING_TIMEOUT. Across
+    workers, the leader takes a short-lived lock in the shared cache and publishes
+    the response under the lock's token, other workers poll for it and make the
+    request themselves if it doesn't show up in time.
+    """
+
+    def __init__(self):
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._async_futures: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Future]]' = \
+            weakref.WeakKeyDictionary()
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._stats_lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[settings.GATEWAY_RESPONSE_CACHE_ALIAS]
+
+    @staticmethod
+    def is_enabled(logic_module: Optional[LogicModule]) -> bool:
+        return bool(getattr(logic_module, 'coalesce_requests', False))
+
+    def get_key(self, logic_module: LogicModule, request: Request, url: str) -> Optional[str]:
+        """ Key of identical requests, None if the request can't be coalesced """
+        if not self.is_enabled(logic_module):
+            return None
+        request_key = get_shared_request_key(logic_module, request, url)
+        return None if request_key is None else f'gateway:coalesce:{request_key}'
+
+    def run(
+        self, logic_module: LogicModule, key: str, fetch: Callable[[], SharedResponse]
+    ) -> SharedResponse:
+        """ Fetch the response, or wait for an identical request in flight to fetch it """
+        service = logic_module.endpoint_name
+        self._count(service, 'requests')
+        with self._lock:
+            future = self._futures.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = self._futures[key] = Future()
+
+        if not is_leader:
+            try:
+                response = future.result(timeout=settings.GATEWAY_COALESCING_TIMEOUT)
+            except FutureTimeoutError:
+                # the request in flight takes too long, waiting is bounded but doesn't fail the request
+                logger.debug(f'The request in flight for {key} takes too long, requesting it')
+                self._count(service, 'upstream')
+                return fetch()
+            self._count(service, 'coalesced')
+            return response
+
+        try:
+            response = self._run_across_workers(service, key, fetch)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
+
+    async def arun(
+        self, logic_module: LogicModule, key: str, fetch: Callable[[], Awaitable[SharedResponse]]
+    ) -> SharedResponse:
+        service = logic_module.endpoint_name
+        self._count(service, 'requests')
+        loop = asyncio.get_running_loop()
+        futures = self._async_futures.setdefault(loop, {})
+        future = futures.get(key)
+        if future is not None:
+            try:
+                response = await asyncio.wait_for(asyncio.shield(future), settings.GATEWAY_COALESCING_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.debug(f'The request in flight for {key} takes too long, requesting it')
+                self._count(service, 'upstream')
+                return await fetch()
+            self._count(service, 'coalesced')
+            return response
+
+        future = futures[key] = loop.create_future()
+        try:
+            response = await self._arun_across_workers(service, key, fetch)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            # the exception is raised to the leader, followers may not exist
+            future.exception()
+            raise
+        finally:
+            futures.pop(key, None)
+
+    def _run_across_workers(self, service: str, key: str, fetch: Callable[[], SharedResponse]) -> SharedResponse:
+        token = uuid.uuid4().hex
+        if self.cache.add(f'{key}:lock', token, settings.GATEWAY_COALESCING_TIMEOUT):
+            try:
+                self._count(service, 'upstream')
+                response = fetch()
+                if len(response.body) <= settings.GATEWAY_RESPONSE_CACHE_MAX_ENTRY_SIZE:
+                    self.cache.set(f'{key}:{token}', response, settings.GATEWAY_COALESCING_TIMEOUT)
+                return response
+            finally:
+                # a lock that expired meanwhile may belong to another worker now
+                if self.cache.get(f'{key}:lock') == token:
+                    self.cache.delete(f'{key}:lock')
+
+        # the leader publishes the response before releasing the lock
+        token = self.cache.get(f'{key}:lock')
+        deadline = time.monotonic() + settings.GATEWAY_COALESCING_TIMEOUT
+        while token is not None and time.monotonic() < deadline:
+            current_token = self.cache.get(f'{key}:lock')
+            response = self.cache.get(f'{key}:{token}')
+            if response is not None:
+                self._count(service, 'coalesced_remote')
+                return response
+            if current_token != token:
+                break
+            time.sleep(settings.GATEWAY_COALESCING_POLL_INTERVAL)
+
+        logger.debug(f'No shared response for {key}, requesting it')
+        self._count(service, 'upstream')
+        return fetch()
+
+    async def _arun_across_workers(
+        self, service: str, key: str, fetch: Callable[[], Awaitable[SharedResponse]]
+    ) -> SharedResponse:
+        token = uuid.uuid4().hex
+        if await self.cache.aadd(f'{key}:lock', token, settings.GATEWAY_COALESCING_TIMEOUT):
+            try:
+                self._count(service, 'upstream')
+                response = await fetch()
+                if len(response.body) <= settings.GATEWAY_RESPONSE_CACHE_MAX_ENTRY_SIZE:
+                    await self.cache.aset(f'{key}:{token}', response, settings.GATEWAY_COALESCING_TIMEOUT)
+                return response
+            finally:
+                # a lock that expired meanwhile may belong to another worker now
+                if await self.cache.aget(f'{key}:lock') == token:
+                    await self.cache.adelete(f'{key}:lock')
+
+        # the leader publishes the response before releasing the lock
+        token = await self.cache.aget(f'{key}:lock')
+        deadline = time.monotonic() + settings.GATEWAY_COALESCING_TIMEOUT
+        while token is not None and time.monotonic() < deadline:
+            current_token = await self.cache.aget(f'{key}:lock')
+            response = await self.cache.aget(f'{key}:{token}')
+            if response is not None:
+                self._count(service, 'coalesced_remote')
+                return response
+            if current_token != token:
+                break
+            await asyncio.sleep(settings.GATEWAY_COALESCING_POLL_INTERVAL)
+
+        logger.debug(f'No shared response for {key}, requesting it')
+        self._count(service, 'upstream')
+        return await fetch()
+
+    def _count(self, service: str, counter: str) -> None:
+        with self._stats_lock:
+            self._stats[service][counter] += 1
+
+    def get_stats(self) -> Dict[str, dict]:
+        """ Counters of this worker per service, with the share of requests served by another one """
+        with self._stats_lock:
+            stats = {service: dict(counters) for service, counters in self._stats.items()}
+        for counters in stats.values():
+            coalesced = counters.get('coalesced', 0) + counters.get('coalesced_remote', 0)
+            counters['coalescing_ratio'] = coalesced / counters['requests'] if counters.get('requests') else 0.0
+        return stats
+
+    def reset_stats(self) -> None:
+        with self._stats_lock:
+            self._stats.clear()
+
+
+request_coalescer = RequestCoalescer()
@@ -0,0 +1,73 @@
+import json
+import logging
+from typing import Any, Union
+
+from django.conf import settings
+
+from . import utils
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+class JSONCodec:
+    """ Standard library codec, the reference for the output of the other codecs """
+    name = 'json'
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, cls=utils.GatewayJSONEncoder).encode()
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    orjson serializes datetimes and UUIDs natively like GatewayJSONEncoder does, the
+    other types go through its `default` hook. Whatever orjson can't handle (integers
+    beyond 64 bits, NaN) falls back to the standard library.
+    """
+    name = 'orjson'
+
+    def __init__(self):
+        self._encoder = utils.GatewayJSONEncoder()
+
+    def _default(self, obj: Any) -> Any:
+        try:
+            return self._encoder.default(obj)
+        except TypeError:
+            # orjson only accepts its own TypeError subclass from the hook
+            raise orjson.JSONEncodeError(f'Type is not JSON serializable: {type(obj).__name__}')
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return orjson.dumps(obj, default=self._default, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            return super().dumps(obj)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return super().loads(data)
+
+
+CODECS = {JSONCodec.name: JSONCodec, OrjsonCodec.name: OrjsonCodec}
+
+
+def get_codec(name: str = None) -> JSONCodec:
+    """ Codec of GATEWAY_JSON_CODEC, 'auto' takes the fastest installed one """
+    name = name or settings.GATEWAY_JSON_CODEC
+    if name == 'auto':
+        name = OrjsonCodec.name if orjson is not None else JSONCodec.name
+    if name == OrjsonCodec.name and orjson is None:
+        logger.warning('orjson is not installed, falling back to the standard library JSON codec')
+        name = JSONCodec.name
+    return CODECS[name]()
+
+
+json_codec = get_codec()
@@ -4,11 +4,12 @@ import json
 class GatewayError(Exception):
     default_status_code = 500
 
-    def __init__(self, msg, status: int = None):
+    def __init__(self, msg, status: int = None, headers: dict = None):
         content = {'detail': msg}
         self.content = json.dumps(content)
         self.status = status or self.default_status_code
         self.content_type = 'application/json'
+        self.headers = headers or {}
 
 
 class EndpointNotFound(GatewayError):
@@ -33,3 +34,7 @@ class PermissionDenied(GatewayError):
 
 class DataMeshError(GatewayError):
     pass
+
+
+class ServiceUnavailable(GatewayError):
+    default_status_code = 503
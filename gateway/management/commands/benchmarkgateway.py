@@ -0,0 +1,110 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import CoreUser
+from gateway.benchmark import SCENARIO_MODES, SCENARIO_PATHS, compare_results, run_benchmark
+
+
+class Command(BaseCommand):
+    help = """
+    Benchmark the gateway against a fleet of local stub services.
+
+    The stub services are registered as logic modules for the duration of the run,
+    the sync and async gateway paths are driven at a fixed concurrency and RPS,
+    p50/p95/p99 latency and DB queries per request are reported. Store the results
+    of a commit with --output and compare another run to them with --compare.
+
+    Example:
+    python manage.py benchmarkgateway --services=3 --latency=0.02 --output=before.json
+    python manage.py benchmarkgateway --services=3 --latency=0.02 --compare=before.json
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--services', type=int, default=2, help='Number of stub services.')
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds each stub response takes.')
+        parser.add_argument('--payload-size', type=int, default=256, help='Bytes of data of each stub item.')
+        parser.add_argument('--page-size', type=int, default=10, help='Items of the list responses.')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=10, help='Requests in flight at once.')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests before each scenario.')
+        parser.add_argument(
+            '--query-sample', type=int, default=10, help='Sequential requests the DB queries are counted on.',
+        )
+        parser.add_argument(
+            '--paths', nargs='+', choices=tuple(SCENARIO_PATHS), default=tuple(SCENARIO_PATHS),
+            help='Stub endpoints to request.',
+        )
+        parser.add_argument(
+            '--modes', nargs='+', choices=SCENARIO_MODES, default=SCENARIO_MODES, help='Gateway paths to drive.',
+        )
+        parser.add_argument(
+            '--username', default=None, help='User the requests are made as, the first superuser by default.',
+        )
+        parser.add_argument('--output', default=None, help='Path of the JSON file to store the results in.')
+        parser.add_argument('--compare', default=None, help='Path of the JSON results of a baseline run.')
+
+    def handle(self, *args, **options):
+        if options['services'] < 1 or options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--services, --requests and --concurrency have to be positive.')
+
+        users = CoreUser.objects.filter(is_active=True)
+        if options['username']:
+            user = users.filter(username=options['username']).first()
+        else:
+            user = users.filter(is_superuser=True).order_by('pk').first()
+        if user is None:
+            raise CommandError('No user to make the requests as, create one or pass --username.')
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        report = run_benchmark(
+            user,
+            services=options['services'],
+            latency=options['latency'],
+            payload_size=options['payload_size'],
+            page_size=options['page_size'],
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            warmup=options['warmup'],
+            query_sample=options['query_sample'],
+            paths=options['paths'],
+            modes=options['modes'],
+        )
+        self.print_results(report)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+        if baseline is not None:
+            self.print_comparison(baseline, report)
+
+    def print_results(self, report: dict) -> None:
+        self.stdout.write(f'Commit {report["commit"] or "unknown"}, {report["parameters"]}')
+        self.stdout.write(
+            f'{"scenario":<16}{"requests":>10}{"errors":>8}{"rps":>10}{"p50 ms":>10}'
+            f'{"p95 ms":>10}{"p99 ms":>10}{"queries":>10}'
+        )
+        for scenario, result in report['results'].items():
+            self.stdout.write(
+                f'{scenario:<16}{result["requests"]:>10}{result["errors"]:>8}{result["rps"]:>10}'
+                f'{result["p50_ms"]:>10}{result["p95_ms"]:>10}{result["p99_ms"]:>10}'
+                f'{result["db_queries_per_request"]:>10}'
+            )
+            if result['errors']:
+                self.stderr.write(f'{scenario}: {result["errors"]} requests failed')
+
+    def print_comparison(self, baseline: dict, report: dict) -> None:
+        self.stdout.write(f'Compared to commit {baseline.get("commit") or "unknown"}:')
+        if baseline.get('parameters') != report['parameters']:
+            self.stderr.write('The parameters of the runs differ, the results may not be comparable.')
+        for row in compare_results(baseline, report):
+            change = 'n/a' if row['change'] is None else f'{row["change"]:+.1f}%'
+            self.stdout.write(
+                f'{row["scenario"]:<16}{row["metric"]:<24}{row["baseline"]:>10} -> {row["current"]:<10}{change:>10}'
+            )
@@ -0,0 +1,221 @@
+import logging
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+WORKERS_KEY = 'gateway:metrics:workers'
+SAMPLES_KEY = 'gateway:metrics:samples:{worker}'
+# Label of services and models that aren't known, so clients can't create label series
+UNKNOWN_LABEL = 'unknown'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Samples = Dict[Tuple[str, ...], List[float]]
+
+
+class Metric:
+    """
+    Samples of a metric in this worker, keyed by their label values. Recording is a
+    no-op unless GATEWAY_METRICS_ENABLED is set.
+    """
+
+    type = None
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, documentation: str, labelnames: Sequence[str]):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._samples: Samples = {}
+        self._lock = threading.Lock()
+
+    def get_samples(self) -> Samples:
+        with self._lock:
+            return {labels: list(values) for labels, values in self._samples.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+    def render(self, samples: Samples) -> Iterable[str]:
+        raise NotImplementedError()
+
+    def _add(self, labels: Tuple, increments: Tuple[Tuple[int, float], ...], size: int) -> None:
+        labels = tuple(str(label) for label in labels)
+        with self._lock:
+            values = self._samples.get(labels)
+            if values is None:
+                values = self._samples[labels] = [0] * size
+            for index, value in increments:
+                values[index] += value
+        self.registry.push()
+
+    def _format_labels(self, labels: Tuple[str, ...], **extra: str) -> str:
+        pairs = list(zip(self.labelnames, labels)) + list(extra.items())
+        if not pairs:
+            return ''
+        escaped = (
+            f'{name}="' + value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') + '"'
+            for name, value in pairs
+        )
+        return '{' + ','.join(escaped) + '}'
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, value: float = 1) -> None:
+        if settings.GATEWAY_METRICS_ENABLED:
+            self._add(labels, ((0, value),), 1)
+
+    def render(self, samples: Samples) -> Iterable[str]:
+        for labels, (value,) in sorted(samples.items()):
+            yield f'{self.name}{self._format_labels(labels)} {float(value)!r}'
+
+
+class Histogram(Metric):
+    """ Observations are counted in the bucket of their upper bound, the last value is their sum """
+
+    type = 'histogram'
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(*args)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels) -> None:
+        if settings.GATEWAY_METRICS_ENABLED:
+            sum_index = len(self.buckets) + 1
+            self._add(labels, ((bisect_left(self.buckets, value), 1), (sum_index, value)), sum_index + 1)
+
+    def render(self, samples: Samples) -> Iterable[str]:
+        for labels, values in sorted(samples.items()):
+            count = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), values):
+                count += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                yield f'{self.name}_bucket{self._format_labels(labels, le=le)} {float(count)!r}'
+            yield f'{self.name}_sum{self._format_labels(labels)} {float(values[-1])!r}'
+            yield f'{self.name}_count{self._format_labels(labels)} {float(count)!r}'
+
+
+class MetricsRegistry:
+    """
+    Metrics of the gateway in Prometheus text format. Every worker records into its
+    own memory and pushes its samples to the shared cache at most every
+    GATEWAY_METRICS_PUSH_INTERVAL seconds, under a key of its own, so workers never
+    write the same key. Rendering adds up the samples of all workers that pushed.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._pushed_at = 0.0
+        self._push_lock = threading.Lock()
+        self.worker = f'{socket.gethostname()}:{os.getpid()}'
+
+    @property
+    def cache(self):
+        return caches[settings.GATEWAY_METRICS_CACHE_ALIAS]
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(self, name, documentation, labelnames, buckets=buckets))
+
+    def push(self, force: bool = False) -> None:
+        """ Put the samples of this worker into the shared cache when the interval passed """
+        now = time.monotonic()
+        if not force and now - self._pushed_at < settings.GATEWAY_METRICS_PUSH_INTERVAL:
+            return
+        if not self._push_lock.acquire(blocking=force):
+            return
+        try:
+            self._pushed_at = now
+            # the worker list is updated without a lock, a worker lost by a concurrent update adds itself again
+            workers = self.cache.get(WORKERS_KEY) or []
+            if self.worker not in workers:
+                self.cache.set(WORKERS_KEY, workers + [self.worker], None)
+            samples = {name: metric.get_samples() for name, metric in self._metrics.items()}
+            self.cache.set(SAMPLES_KEY.format(worker=self.worker), samples, None)
+        except Exception:
+            logger.exception('Failed to push the metrics')
+        finally:
+            self._push_lock.release()
+
+    def collect(self) -> Dict[str, Samples]:
+        """ Samples of all workers added up """
+        self.push(force=True)
+        workers = self.cache.get(WORKERS_KEY) or []
+        worker_samples = self.cache.get_many([SAMPLES_KEY.format(worker=worker) for worker in workers])
+
+        collected = {name: {} for name in self._metrics}
+        for samples in worker_samples.values():
+            for name, metric_samples in samples.items():
+                if name not in collected:
+                    continue
+                for labels, values in metric_samples.items():
+                    total = collected[name].get(labels)
+                    if total is None or len(total) != len(values):
+                        collected[name][labels] = list(values)
+                    else:
+                        collected[name][labels] = [a + b for a, b in zip(total, values)]
+        return collected
+
+    def render(self) -> str:
+        lines = []
+        for name, samples in self.collect().items():
+            metric = self._metrics[name]
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            lines.extend(metric.render(samples))
+        return '\n'.join(lines) + '\n'
+
+    def clear(self) -> None:
+        """ Drop the samples of this worker """
+        for metric in self._metrics.values():
+            metric.clear()
+        self.cache.delete(SAMPLES_KEY.format(worker=self.worker))
+        self._pushed_at = 0.0
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric "{metric.name}" is already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+
+metrics_registry = MetricsRegistry()
+
+gateway_requests = metrics_registry.counter(
+    'gateway_requests_total', 'Gateway requests by service, model, method and status',
+    ('service', 'model', 'method', 'status'),
+)
+gateway_request_duration = metrics_registry.histogram(
+    'gateway_request_duration_seconds', 'Duration of gateway requests', ('service', 'method'),
+)
+upstream_request_duration = metrics_registry.histogram(
+    'gateway_upstream_request_duration_seconds', 'Duration of requests to the services', ('service',),
+)
+upstream_errors = metrics_registry.counter(
+    'gateway_upstream_errors_total', 'Requests to the services that failed or got a server error',
+    ('service', 'error'),
+)
+datamesh_join_record_queries = metrics_registry.counter(
+    'datamesh_join_record_queries_total', 'Join record queries of datamesh by relationship', ('relationship',),
+)
+datamesh_related_fetches = metrics_registry.counter(
+    'datamesh_related_fetches_total', 'Related records fetched by datamesh by relationship', ('relationship',),
+)
+datamesh_cache_hits = metrics_registry.counter(
+    'datamesh_related_cache_hits_total', 'Related records datamesh took from its cache by relationship',
+    ('relationship',),
+)
@@ -0,0 +1,88 @@
+import functools
+import uuid
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Tuple, Union
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+
+CRLF = b'\r\n'
+
+
+def quote_header_value(value: str) -> str:
+    """ Escape a name or filename of Content-Disposition the way browsers do """
+    return value.replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+class MultipartStream:
+    """
+    multipart/form-data body of form fields and uploaded files, generated chunk by chunk.
+    Django's upload handlers spool large uploads to temporary files, the files are read
+    from there in chunks of GATEWAY_STREAMING_CHUNK_SIZE while the body is sent, so memory
+    stays the same whatever the size of the files. The length is known upfront, so the
+    body is sent with a Content-Length, which more services accept than chunked encoding.
+    The body can be iterated by `requests` and by `aiohttp`, files are read again from
+    the start on every iteration.
+    """
+
+    def __init__(self, fields: Iterable[Tuple[str, str]], files: Iterable[Tuple[str, UploadedFile]]):
+        self.boundary = uuid.uuid4().hex
+        self._parts: List[Tuple[bytes, Union[bytes, UploadedFile]]] = []
+        for name, value in fields:
+            head = f'Content-Disposition: form-data; name="{quote_header_value(name)}"'
+            self._parts.append((self._get_part_head(head), str(value).encode()))
+        for name, file in files:
+            head = (
+                f'Content-Disposition: form-data; name="{quote_header_value(name)}"; '
+                f'filename="{quote_header_value(file.name or name)}"\r\n'
+                f'Content-Type: {file.content_type or "application/octet-stream"}'
+            )
+            self._parts.append((self._get_part_head(head), file))
+        self._tail = b'--' + self.boundary.encode() + b'--' + CRLF
+        self._length = len(self._tail) + sum(
+            len(head) + (len(body) if isinstance(body, bytes) else body.size) + len(CRLF)
+            for head, body in self._parts
+        )
+
+    def _get_part_head(self, headers: str) -> bytes:
+        return f'--{self.boundary}\r\n{headers}\r\n\r\n'.encode()
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {
+            'Content-Type': f'multipart/form-data; boundary={self.boundary}',
+            'Content-Length': str(self._length),
+        }
+
+    def __iter__(self) -> Iterator[bytes]:
+        for head, body in self._parts:
+            if isinstance(body, bytes):
+                yield head + body + CRLF
+                continue
+            yield head
+            yield from body.chunks(settings.GATEWAY_STREAMING_CHUNK_SIZE)
+            yield CRLF
+        yield self._tail
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for head, body in self._parts:
+            if isinstance(body, bytes):
+                yield head + body + CRLF
+                continue
+            yield head
+            chunks = body.chunks(settings.GATEWAY_STREAMING_CHUNK_SIZE)
+            if hasattr(body, 'temporary_file_path'):
+                # the file is on disk, don't block the event loop reading it
+                read_chunk = sync_to_async(functools.partial(next, chunks, None), thread_sensitive=False)
+                chunk = await read_chunk()
+                while chunk is not None:
+                    yield chunk
+                    chunk = await read_chunk()
+            else:
+                for chunk in chunks:
+                    yield chunk
+            yield CRLF
+        yield self._tail
@@ -0,0 +1,125 @@
+from typing import Any, Container, Dict, Iterable, Optional, Tuple
+
+from django.http.request import QueryDict
+
+FIELDS_PARAM = 'fields'
+EXCLUDE_PARAM = 'exclude'
+
+# field name -> projection of its value, None for the whole value
+Tree = Dict[str, Optional['Tree']]
+
+
+def parse_paths(values: Iterable[str]) -> Optional[Tree]:
+    """
+    Parse comma separated field paths like `id,name,contacts.first_name` into a tree,
+    a path ending at a field covers all of its nested fields.
+    """
+    tree: Tree = {}
+    for value in values:
+        for path in value.split(','):
+            names = [name for name in path.strip().split('.') if name]
+            if not names:
+                continue
+            node = tree
+            for name in names[:-1]:
+                if name in node and node[name] is None:
+                    break
+                node = node.setdefault(name, {})
+            else:
+                node[names[-1]] = None
+    return tree or None
+
+
+def project(value: Any, fields: Optional[Tree], exclude: Optional[Tree]) -> Any:
+    """ Copy of the value with the fields of the tree and without the excluded ones """
+    if isinstance(value, list):
+        return [project(item, fields, exclude) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    projected = {}
+    for key in (value if fields is None else fields):
+        if key not in value:
+            continue
+        nested_fields = None if fields is None else fields[key]
+        nested_exclude = None
+        if exclude is not None and key in exclude:
+            nested_exclude = exclude[key]
+            if nested_exclude is None:
+                continue
+        if nested_fields is None and nested_exclude is None:
+            projected[key] = value[key]
+        else:
+            projected[key] = project(value[key], nested_fields, nested_exclude)
+    return projected
+
+
+class Projection:
+    """
+    Fields of the gateway response a client asked for with `?fields=` and `?exclude=`.
+    Paths are comma separated and go into nested objects and relationship keys with
+    dots, e.g. `?fields=id,name,contacts.first_name&exclude=contacts.notes`.
+    """
+
+    def __init__(self, fields: Optional[Tree] = None, exclude: Optional[Tree] = None):
+        self.fields = fields
+        self.exclude = exclude
+
+    @classmethod
+    def from_query_params(cls, query_params: QueryDict) -> Optional['Projection']:
+        fields = parse_paths(query_params.getlist(FIELDS_PARAM))
+        exclude = parse_paths(query_params.getlist(EXCLUDE_PARAM))
+        if fields is None and exclude is None:
+            return None
+        return cls(fields, exclude)
+
+    def includes(self, key: str) -> bool:
+        """ Whether the top level field is (partly) part of the response, e.g. a relationship key """
+        if self.fields is not None and key not in self.fields:
+            return False
+        return self.exclude is None or key not in self.exclude or self.exclude[key] is not None
+
+    def apply(self, data: Any, keep: Iterable[str] = ()) -> None:
+        """
+        Project the items of the response in place, the items of a paginated response
+        are in its `results`. The top level fields in `keep` are left, e.g. the lookup
+        field a datamesh join needs.
+        """
+        fields, exclude = self.fields, self.exclude
+        if keep:
+            if fields is not None:
+                fields = {**fields, **{key: None for key in keep}}
+            if exclude is not None:
+                exclude = {key: value for key, value in exclude.items() if key not in keep}
+
+        if isinstance(data, dict) and isinstance(data.get('results'), list):
+            data = data['results']
+        if isinstance(data, list):
+            data[:] = project(data, fields, exclude)
+        elif isinstance(data, dict):
+            projected = project(data, fields, exclude)
+            data.clear()
+            data.update(projected)
+
+    def get_upstream_params(self, supported: Container[str]) -> Tuple[Dict[str, str], bool]:
+        """
+        Query parameters passing the projection on to a service that supports them, and
+        whether the service applies it completely. Services only know their top level
+        fields, the nested paths are left to the gateway.
+        """
+        params = {}
+        complete = True
+        if self.fields is not None:
+            if FIELDS_PARAM in supported:
+                params[FIELDS_PARAM] = ','.join(self.fields)
+                complete = all(nested is None for nested in self.fields.values())
+            else:
+                complete = False
+        if self.exclude is not None:
+            excluded = [key for key, nested in self.exclude.items() if nested is None]
+            if EXCLUDE_PARAM in supported and excluded:
+                params[EXCLUDE_PARAM] = ','.join(excluded)
+                complete = complete and len(excluded) == len(self.exclude)
+            else:
+                complete = False
+        return params, complete
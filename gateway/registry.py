@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from core.models import CoreGroup, LogicModule
+from core.permissions import get_effective_permissions
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'gateway:logic-modules:version'
+
+
+class RegistryEntries(NamedTuple):
+    # logic modules by endpoint name
+    modules: Dict[str, LogicModule]
+    # CRUD permission masks by endpoint name and organization, computed on first use
+    permissions: Dict[Tuple[str, Optional[int]], int]
+    # throttle rates of the groups that have one, usually none
+    group_throttle_rates: Dict[int, str]
+    # throttle rates of the groups of a user by user, computed on first use
+    user_throttle_rates: Dict[int, Tuple[str, ...]]
+
+
+class LogicModuleRegistry:
+    """
+    Worker-wide registry of logic modules keyed by endpoint name, with their groups
+    prefetched, so resolving a service takes no DB queries. The effective permissions
+    of each organization on a logic module and the throttle rates of users' groups are
+    computed once and kept alongside.
+
+    Saving or deleting a logic module or a group, and changing the members of a
+    throttled group, invalidates the registry of this
+    worker and replaces the version stamp in the shared cache. Other workers compare
+    their stamp at most every GATEWAY_LOGIC_MODULE_REGISTRY_CHECK_INTERVAL seconds
+    and reload the logic modules when it changed.
+    """
+
+    def __init__(self):
+        # the logic modules and everything computed from them are replaced together
+        self._entries: Optional[RegistryEntries] = None
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, endpoint_name: str) -> Optional[LogicModule]:
+        return self._get_entries().modules.get(endpoint_name)
+
+    async def aget(self, endpoint_name: str) -> Optional[LogicModule]:
+        entries = self._entries
+        if entries is None or self._is_outdated():
+            entries = await sync_to_async(self._load)()
+        return entries.modules.get(endpoint_name)
+
+    def is_loaded(self, endpoint_name: str) -> bool:
+        """ Whether the service is in the loaded registry, doesn't load it or check for changes """
+        entries = self._entries
+        return entries is not None and endpoint_name in entries.modules
+
+    def get_permissions(self, endpoint_name: str, organization_id: Optional[int]) -> Optional[int]:
+        """ CRUD permission mask of the organization's users on the service, None if it doesn't exist """
+        entries = self._get_entries()
+        key = (endpoint_name, organization_id)
+        mask = entries.permissions.get(key)
+        if mask is None:
+            logic_module = entries.modules.get(endpoint_name)
+            if logic_module is None:
+                return None
+            mask = entries.permissions[key] = get_effective_permissions(logic_module.core_groups.all(), organization_id)
+        return mask
+
+    def get_group_throttle_rates(self, user_id: Optional[int]) -> Tuple[str, ...]:
+        """ Throttle rates of the user's groups, without a query unless a group has a rate """
+        entries = self._get_entries()
+        if not entries.group_throttle_rates or user_id is None:
+            return ()
+        rates = entries.user_throttle_rates.get(user_id)
+        if rates is None:
+            group_ids = CoreGroup.objects.filter(
+                user=user_id, pk__in=entries.group_throttle_rates,
+            ).values_list('pk', flat=True)
+            rates = entries.user_throttle_rates[user_id] = tuple(
+                entries.group_throttle_rates[group_id] for group_id in group_ids
+            )
+        return rates
+
+    def has_throttled_groups(self, group_ids: Optional[Iterable[int]]) -> bool:
+        """ Whether any of the groups, all groups for None, has a throttle rate """
+        groups = CoreGroup.objects.exclude(throttle_rate='')
+        if group_ids is not None:
+            groups = groups.filter(pk__in=group_ids)
+        return groups.exists()
+
+    def all(self) -> List[LogicModule]:
+        return list(self._get_entries().modules.values())
+
+    def invalidate(self) -> None:
+        """ Drop the logic modules of this worker and make the other workers reload theirs """
+        cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = None
+            self._version = None
+
+    def _get_entries(self) -> RegistryEntries:
+        entries = self._entries
+        if entries is None or self._is_outdated():
+            entries = self._load()
+        return entries
+
+    def _is_outdated(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked_at < settings.GATEWAY_LOGIC_MODULE_REGISTRY_CHECK_INTERVAL:
+            return False
+        self._checked_at = now
+        return cache.get(VERSION_KEY) != self._version
+
+    def _load(self) -> RegistryEntries:
+        with self._lock:
+            # the version is read first, so a change during the load triggers another one
+            version = cache.get(VERSION_KEY)
+            if version is None:
+                version = uuid.uuid4().hex
+                if not cache.add(VERSION_KEY, version, None):
+                    version = cache.get(VERSION_KEY)
+
+            if self._entries is not None and version == self._version:
+                return self._entries
+
+            logger.debug('Loading logic modules')
+            modules = {
+                logic_module.endpoint_name: logic_module
+                for logic_module in LogicModule.objects.prefetch_related('core_groups')
+                if logic_module.endpoint_name
+            }
+            group_throttle_rates = dict(
+                CoreGroup.objects.exclude(throttle_rate='').values_list('pk', 'throttle_rate')
+            )
+            self._entries = RegistryEntries(modules, {}, group_throttle_rates, {})
+            self._version = version
+            self._checked_at = time.monotonic()
+            return self._entries
+
+
+logic_module_registry = LogicModuleRegistry()
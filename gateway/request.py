@@ -1,8 +1,6 @@
 import logging
-import json
 import asyncio
-from urllib.error import URLError
-from typing import Any, Dict, Union
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Union
 
 import aiohttp
 
@@ -10,6 +8,7 @@ from bravado_core.spec import Spec
 
 from asgiref.sync import sync_to_async
 
+from django.core.handlers.asgi import ASGIRequest
 from django.http.request import QueryDict
 from rest_framework.request import Request
 
@@ -18,7 +17,12 @@ from datamesh.utils import delete_join_record
 from gateway import exceptions
 from gateway import utils
 from core.models import LogicModule
-from gateway.clients import SwaggerClient, AsyncSwaggerClient
+from gateway.clients import BaseSwaggerClient, SwaggerClient, AsyncSwaggerClient
+from gateway.codecs import json_codec
+from gateway.projection import EXCLUDE_PARAM, FIELDS_PARAM, Projection
+from gateway.registry import logic_module_registry
+from gateway.specs import SWAGGER_CONFIG, spec_registry
+from gateway.timing import RequestTimer
 from datamesh.services import DataMesh
 
 
@@ -30,10 +34,21 @@ class GatewayResponse(object):
     Response object used with GatewayRequest
     """
 
-    def __init__(self, content: Any, status_code: int, headers: Dict[str, str]):
+    def __init__(
+        self,
+        content: Any,
+        status_code: int,
+        headers: Dict[str, str],
+        streaming: bool = False,
+        passthrough: bool = False,
+    ):
         self.content = content
         self.status_code = status_code
         self.headers = headers
+        # content is an iterator of body chunks passed through from the service
+        self.streaming = streaming
+        # content is the body of the service as is, so are its validators
+        self.passthrough = passthrough
 
 
 class BaseGatewayRequest(object):
@@ -43,35 +58,78 @@ class BaseGatewayRequest(object):
     to validate incoming request's operation against it.
     """
 
-    SWAGGER_CONFIG = {
-        'validate_requests': False,
-        'validate_responses': False,
-        'use_models': False,
-        'validate_swagger_spec': False,
-    }
+    SWAGGER_CONFIG = SWAGGER_CONFIG
 
-    def __init__(self, request: Request, **kwargs):
+    def __init__(self, request: Request, timer: Optional[RequestTimer] = None, **kwargs):
         self.request = request
         self.url_kwargs = kwargs
+        self.timer = timer or RequestTimer()
+        self.projection = Projection.from_query_params(request.query_params)
+        self._projection_forwarded = False
         self._logic_modules = dict()
-        self._specs = dict()
         self._data = dict()
 
     def perform(self):
         raise NotImplementedError('You need to implement this method')
 
+    def is_passthrough_allowed(self) -> bool:
+        """
+        The service response can be passed through without decoding and encoding
+        it again when it doesn't get aggregated
+        """
+        query_params = self.request.query_params
+        if self.projection is not None and not self._projection_forwarded:
+            return False
+        return 'join' not in query_params and 'extend' not in query_params
+
+    def is_streaming_allowed(self) -> bool:
+        """ A passed through response body doesn't have to be read into memory """
+        return self.is_passthrough_allowed()
+
+    def forward_projection(self, client: BaseSwaggerClient, spec: Spec) -> None:
+        """
+        Pass the field projection on to the service as far as its spec advertises the
+        parameters, the gateway projects the response otherwise. Joined items need
+        their lookup field, so the projection of joined responses is left to the gateway.
+        """
+        query_params = self.request.query_params
+        if self.projection is None:
+            return
+
+        params = {}
+        if 'join' not in query_params and 'extend' not in query_params:
+            route = client.get_route(spec, **self.url_kwargs)
+            if route is not None:
+                params, self._projection_forwarded = self.projection.get_upstream_params(route.query_parameters)
+
+        forwarded_params = query_params.copy()
+        forwarded_params.pop(FIELDS_PARAM, None)
+        forwarded_params.pop(EXCLUDE_PARAM, None)
+        forwarded_params.update(params)
+        self.request._request.GET = forwarded_params
+
+    def apply_projection(self, content: Any, status_code: int) -> None:
+        """ Project the response when the service didn't """
+        if self.projection is None or self._projection_forwarded:
+            return
+        if status_code in [200, 201] and type(content) in [dict, list]:
+            with self.timer.phase('projection'):
+                self.projection.apply(content)
+
+    def _project_before_join(self, datamesh: DataMesh, resp_data: Union[dict, list]) -> None:
+        """ Skip the relationships the projection leaves out and prune the items before joining """
+        if self.projection is None:
+            return
+        datamesh.select_relationships(self.projection.includes)
+        with self.timer.phase('projection'):
+            self.projection.apply(resp_data, keep=(datamesh.origin_lookup_field,))
+
     def _get_logic_module(self, service_name: str) -> LogicModule:
         """ Retrieve LogicModule by service name. """
-        if service_name not in self._logic_modules:
-            try:
-                self._logic_modules[service_name] = LogicModule.objects.get(
-                    endpoint_name=service_name
-                )
-            except LogicModule.DoesNotExist:
-                raise exceptions.ServiceDoesNotExist(
-                    f'Service "{service_name}" not found.'
-                )
-        return self._logic_modules[service_name]
+        logic_module = logic_module_registry.get(service_name)
+        if logic_module is None:
+            raise exceptions.ServiceDoesNotExist(f'Service "{service_name}" not found.')
+        return logic_module
 
     def get_datamesh(self) -> DataMesh:
         """ Get DataMesh object for the top level model """
@@ -84,7 +142,8 @@ class BaseGatewayRequest(object):
         endpoint = endpoint[:endpoint.index('/', 1) + 1]
         return DataMesh(logic_module_endpoint=logic_module.endpoint_name,
                         model_endpoint=endpoint,
-                        access_validator=utils.ObjectAccessValidator(self.request))
+                        access_validator=utils.ObjectAccessValidator(self.request),
+                        timer=self.timer)
 
 
 class GatewayRequest(BaseGatewayRequest):
@@ -98,59 +157,53 @@ class GatewayRequest(BaseGatewayRequest):
         """
         # init swagger spec from the service swagger doc file
         try:
-            spec = self._get_swagger_spec(self.url_kwargs['service'])
+            with self.timer.phase('spec'):
+                spec = self._get_swagger_spec(self.url_kwargs['service'])
         except exceptions.ServiceDoesNotExist as e:
             return GatewayResponse(
                 e.content, e.status, {'Content-Type': e.content_type}
             )
 
         # create a client for performing data requests
-        client = SwaggerClient(spec, self.request)
+        client = SwaggerClient(spec, self.request, self._get_logic_module(self.url_kwargs['service']))
+        self.forward_projection(client, spec)
 
         # perform a service data request
-        content, status_code, headers = client.request(**self.url_kwargs)
+        passthrough = self.is_passthrough_allowed()
+        with self.timer.phase('upstream'):
+            content, status_code, headers = client.request(
+                passthrough=passthrough,
+                streaming=self.is_streaming_allowed(),
+                **self.url_kwargs,
+            )
+        if isinstance(content, Iterator):
+            return GatewayResponse(content, status_code, headers, streaming=True, passthrough=True)
 
         # calls to individual service as per relationship
         # call to join record insertion method
         # aggregate/join with the JoinRecord-models
         if ("join" or "extend") in self.request.query_params and status_code in [200, 201] and type(content) in [dict, list]:
             try:
-                self._join_response_data(resp_data=content, query_params=self.request.query_params)
+                with self.timer.phase('datamesh'):
+                    self._join_response_data(resp_data=content, query_params=self.request.query_params)
             except exceptions.ServiceDoesNotExist as e:
                 logger.error(e.content)
 
         if 'join' in self.request.query_params and self.request.method == 'DELETE' and status_code == 204:
             delete_join_record(pk=self.url_kwargs['pk'], previous_pk=None)  # delete join record
 
+        self.apply_projection(content, status_code)
+
         if type(content) in [dict, list]:
-            content = json.dumps(content, cls=utils.GatewayJSONEncoder)
+            with self.timer.phase('encode'):
+                content = json_codec.dumps(content)
 
-        return GatewayResponse(content, status_code, headers)
+        return GatewayResponse(content, status_code, headers, passthrough=passthrough)
 
     def _get_swagger_spec(self, endpoint_name: str) -> Spec:
         """Get Swagger spec of specified service."""
         logic_module = self._get_logic_module(endpoint_name)
-        schema_url = utils.get_swagger_url_by_logic_module(logic_module)
-
-        if schema_url not in self._specs:
-            try:
-                # Use stored specification of the module
-                spec_dict = logic_module.api_specification
-
-                # Pull specification of the module from its service and store it
-                if spec_dict is None:
-                    response = utils.get_swagger_from_url(schema_url)
-                    spec_dict = response.json()
-                    logic_module.api_specification = spec_dict
-                    logic_module.save()
-
-            except URLError:
-                raise URLError(f'Make sure that {schema_url} is accessible.')
-
-            swagger_spec = Spec.from_dict(spec_dict, config=self.SWAGGER_CONFIG)
-            self._specs[schema_url] = swagger_spec
-
-        return self._specs[schema_url]
+        return spec_registry.get_spec(logic_module)
 
     def _join_response_data(self, resp_data: Union[dict, list], query_params: str) -> None:
         """
@@ -191,10 +244,11 @@ class GatewayRequest(BaseGatewayRequest):
             resp_data.update(response)
 
         else:
+            self._project_before_join(datamesh, resp_data)
 
             for service in datamesh.related_logic_modules:
                 spec = self._get_swagger_spec(service)
-                client_map[service] = SwaggerClient(spec, self.request)
+                client_map[service] = SwaggerClient(spec, self.request, self._get_logic_module(service))
 
             datamesh.extend_data(resp_data, client_map)
 
@@ -206,64 +260,71 @@ class AsyncGatewayRequest(BaseGatewayRequest):
     """
 
     async def perform(self) -> GatewayResponse:
-        # Example: wrap any sync client or ORM calls with sync_to_async
-        content, status_code, headers = await sync_to_async(self._client_request, thread_sensitive=False)()
+        """
+        Make request to underlying service(s) and returns aggregated response.
+        """
+        # init swagger spec from the service swagger doc file
+        try:
+            with self.timer.phase('spec'):
+                spec = await self._get_swagger_spec(self.url_kwargs['service'])
+        except exceptions.ServiceDoesNotExist as e:
+            return GatewayResponse(
+                e.content, e.status, {'Content-Type': e.content_type}
+            )
+
+        # create a client for performing data requests
+        logic_module = await self._get_logic_module(self.url_kwargs['service'])
+        client = AsyncSwaggerClient(spec, self.request, logic_module)
+        self.forward_projection(client, spec)
+
+        # perform a service data request
+        passthrough = self.is_passthrough_allowed()
+        with self.timer.phase('upstream'):
+            content, status_code, headers = await client.request(
+                passthrough=passthrough,
+                streaming=self.is_streaming_allowed(),
+                **self.url_kwargs,
+            )
+        if isinstance(content, AsyncIterator):
+            return GatewayResponse(content, status_code, headers, streaming=True, passthrough=True)
 
         # Handle join/extend logic
         if ("join" in self.request.query_params or "extend" in self.request.query_params) and status_code in [200, 201] and type(content) in [dict, list]:
             try:
-                await self._join_response_data(resp_data=content, query_params=self.request.query_params)
+                with self.timer.phase('datamesh'):
+                    await self._join_response_data(resp_data=content, query_params=self.request.query_params)
             except exceptions.ServiceDoesNotExist as e:
                 logger.error(e.content)
 
         if 'join' in self.request.query_params and self.request.method == 'DELETE' and status_code == 204:
             await sync_to_async(delete_join_record)(pk=self.url_kwargs['pk'], previous_pk=None)
 
+        self.apply_projection(content, status_code)
+
         if type(content) in [dict, list]:
-            content = json.dumps(content, cls=utils.GatewayJSONEncoder)
+            with self.timer.phase('encode'):
+                content = json_codec.dumps(content)
 
-        return GatewayResponse(content, status_code, headers)
+        return GatewayResponse(content, status_code, headers, passthrough=passthrough)
 
-    async def _client_request(self):
-        # This wraps the sync client.request call
-        return self.client.request(**self.url_kwargs)
+    def is_streaming_allowed(self) -> bool:
+        # Under WSGI the async view runs in a temporary event loop, which is gone by the
+        # time the response body is consumed, so only ASGI requests are streamed
+        return isinstance(self.request._request, ASGIRequest) and super().is_streaming_allowed()
 
     async def _get_swagger_spec(self, endpoint_name: str) -> Spec:
         """Get Swagger spec of specified service, async-safe."""
         logic_module = await self._get_logic_module(endpoint_name)
-        schema_url = utils.get_swagger_url_by_logic_module(logic_module)
-
-        if schema_url not in self._specs:
-            try:
-                # Use stored specification of the module
-                spec_dict = logic_module.api_specification
-
-                # Pull specification of the module from its service and store it
-                if spec_dict is None:
-                    response = await sync_to_async(utils.get_swagger_from_url)(schema_url)
-                    spec_dict = response.json()
-                    logic_module.api_specification = spec_dict
-                    await sync_to_async(logic_module.save)()
-
-            except URLError:
-                raise URLError(f'Make sure that {schema_url} is accessible.')
+        if logic_module.api_specification is None:
+            # pulling the specification from the service requires network and DB calls
+            return await sync_to_async(spec_registry.get_spec)(logic_module)
+        return spec_registry.get_spec(logic_module)
 
-            swagger_spec = Spec.from_dict(spec_dict, config=self.SWAGGER_CONFIG)
-            self._specs[schema_url] = swagger_spec
-
-        return self._specs[schema_url]
-
-    async def _get_logic_module(self, service_name: str):
-        if service_name not in self._logic_modules:
-            try:
-                self._logic_modules[service_name] = await sync_to_async(
-                    LogicModule.objects.get
-                )(endpoint_name=service_name)
-            except LogicModule.DoesNotExist:
-                raise exceptions.ServiceDoesNotExist(
-                    f'Service \"{service_name}\" not found.'
-                )
-        return self._logic_modules[service_name]
+    async def _get_logic_module(self, service_name: str) -> LogicModule:
+        logic_module = await logic_module_registry.aget(service_name)
+        if logic_module is None:
+            raise exceptions.ServiceDoesNotExist(f'Service \"{service_name}\" not found.')
+        return logic_module
 
     async def _join_response_data(self, resp_data: Union[dict, list], query_params: str) -> None:
         """
@@ -280,7 +341,8 @@ class AsyncGatewayRequest(BaseGatewayRequest):
         datamesh = await DataMesh.async_create(
             logic_module_endpoint=self.url_kwargs['service'],
             model_endpoint=self._extract_model_endpoint(),
-            access_validator=utils.ObjectAccessValidator(self.request)
+            access_validator=utils.ObjectAccessValidator(self.request),
+            timer=self.timer,
         )
         client_map = {}
 
@@ -307,10 +369,12 @@ class AsyncGatewayRequest(BaseGatewayRequest):
                 resp_data.clear()
                 resp_data.update(response)
         else:
+            self._project_before_join(datamesh, resp_data)
+
             # GET: build client_map and extend data async
             for service in datamesh.related_logic_modules:
                 spec = await self._get_swagger_spec(service)
-                client_map[service] = SwaggerClient(spec, self.request)
+                client_map[service] = AsyncSwaggerClient(spec, self.request, await self._get_logic_module(service))
 
             await datamesh.async_extend_data(resp_data, client_map)
 
@@ -0,0 +1,54 @@
+from typing import Iterable, Optional, Tuple
+
+from django.urls import URLPattern
+from django.urls.resolvers import RegexPattern
+
+GATEWAY_PATH_REGEX = (
+    r'(?P<service>[^/?#]+)/'
+    r'(?P<model>[^/?#]+)'
+    r'(?:/(?P<pk>[^?#/]+))?/?'
+    r'(?:\?(?P<query>[^#]*))?'
+    r'(?:#(?P<fragment>.*))?'
+)
+
+
+class GatewayPattern(RegexPattern):
+    """
+    Matches `<prefix><service>/<model>/<pk>/` paths of the gateway by splitting the path
+    instead of running a regex, paths whose first segment is reserved for the core
+    URLs are left to the other patterns, so the cost stays constant however many names
+    are reserved. The regex is only used for reversing URLs.
+    """
+
+    def __init__(self, reserved_names: Iterable[str], prefix: str = '', name: Optional[str] = None):
+        super().__init__(f'^{prefix}{GATEWAY_PATH_REGEX}', name=name)
+        self.reserved_names = frozenset(reserved_names)
+        self.prefix = prefix
+
+    def match(self, path: str) -> Optional[Tuple[str, tuple, dict]]:
+        if self.prefix:
+            if not path.startswith(self.prefix):
+                return None
+            path = path[len(self.prefix):]
+        elif path.partition('/')[0] in self.reserved_names:
+            return None
+
+        kwargs = {}
+        path, has_fragment, fragment = path.partition('#')
+        path, has_query, query = path.partition('?')
+        parts = path.split('/', 3)
+        if len(parts) < 2 or not parts[0] or not parts[1]:
+            return None
+
+        kwargs['service'], kwargs['model'] = parts[0], parts[1]
+        if len(parts) > 2 and parts[2]:
+            kwargs['pk'] = parts[2]
+        if has_query:
+            kwargs['query'] = query
+        if has_fragment:
+            kwargs['fragment'] = fragment
+        return '', (), kwargs
+
+
+def gateway_path(view, reserved_names: Iterable[str], prefix: str = '', name: Optional[str] = None) -> URLPattern:
+    return URLPattern(GatewayPattern(reserved_names, prefix=prefix, name=name), view, name=name)
@@ -0,0 +1,94 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Deque, NamedTuple, Optional
+
+from django.conf import settings
+
+from core.models import LogicModule
+
+# Methods that can be repeated without changing the result, RFC 9110 section 9.2.2
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+RETRYABLE_STATUS_CODES = frozenset((502, 503, 504))
+
+
+class RetryPolicy(NamedTuple):
+    max_retries: int
+    backoff: float
+    backoff_max: float
+
+    @classmethod
+    def from_logic_module(cls, logic_module: Optional[LogicModule] = None) -> 'RetryPolicy':
+        """ Take the policy of the logic module, fall back to gateway settings """
+        max_retries = getattr(logic_module, 'max_retries', None)
+        return cls(
+            max_retries=settings.GATEWAY_UPSTREAM_MAX_RETRIES if max_retries is None else max_retries,
+            backoff=getattr(logic_module, 'retry_backoff', None) or settings.GATEWAY_UPSTREAM_RETRY_BACKOFF,
+            backoff_max=settings.GATEWAY_UPSTREAM_RETRY_BACKOFF_MAX,
+        )
+
+    def get_max_retries(self, method: str, has_body_stream: bool = False) -> int:
+        """ Only idempotent requests are retried, uploaded files can't be sent twice """
+        if method.upper() not in IDEMPOTENT_METHODS or has_body_stream:
+            return 0
+        return self.max_retries
+
+    def get_backoff(self, attempt: int) -> float:
+        """ Exponential backoff with full jitter """
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+
+# Policy of requests that are retried elsewhere, e.g. datamesh requests through the gateway itself
+NO_RETRIES = RetryPolicy(max_retries=0, backoff=0, backoff_max=0)
+
+
+class RetryBudget:
+    """
+    Limit of the retries of this worker over all services: within the window there
+    may be GATEWAY_RETRY_BUDGET_MIN_RETRIES retries plus GATEWAY_RETRY_BUDGET_RATIO
+    of the requests, so retries can't multiply the load on a failing service.
+    """
+
+    def __init__(self):
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float) -> None:
+        for calls in (self._requests, self._retries):
+            while calls and now - calls[0] > settings.GATEWAY_RETRY_BUDGET_WINDOW:
+                calls.popleft()
+
+    def record_request(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            self._requests.append(now)
+
+    def can_retry(self) -> bool:
+        """ Withdraw a retry from the budget if there is one left """
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            allowed = (
+                settings.GATEWAY_RETRY_BUDGET_MIN_RETRIES
+                + settings.GATEWAY_RETRY_BUDGET_RATIO * len(self._requests)
+            )
+            if len(self._retries) >= allowed:
+                return False
+            self._retries.append(now)
+            return True
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            self._prune(time.monotonic())
+            return {'requests': len(self._requests), 'retries': len(self._retries)}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._requests.clear()
+            self._retries.clear()
+
+
+retry_budget = RetryBudget()
@@ -0,0 +1,95 @@
+import weakref
+from typing import Dict, FrozenSet, NamedTuple, Optional, Tuple
+
+from bravado_core.spec import Spec
+
+PK_KIND_ID = 'id'
+PK_KIND_UUID = 'uuid'
+PK_KINDS = (PK_KIND_ID, PK_KIND_UUID)
+
+
+class Route(NamedTuple):
+    """ Operation of the service resolved for a (method, model, pk kind) combination """
+    http_method: str
+    path_name: str
+    url_template: str
+    path_parameter: Optional[str]
+    query_parameters: FrozenSet[str] = frozenset()
+
+    def build_url(self, pk: Optional[str] = None) -> str:
+        if self.path_parameter is None:
+            return self.url_template
+        return self.url_template.replace(f'{{{self.path_parameter}}}', pk)
+
+
+class RouteTable:
+    """
+    Index of the operations of a Swagger spec by HTTP method, model and kind of pk,
+    so routing of a gateway request is a single dict lookup.
+    Only paths the gateway can route to are indexed: `/{model}/`, `/{model}/{model_id}/`
+    and `/{model}/{model_uuid}/`.
+    """
+
+    def __init__(self, spec: Spec):
+        self._routes: Dict[Tuple[str, str, Optional[str]], Route] = {}
+        base_path = spec.spec_dict.get('basePath', '').rstrip('/')
+        api_url = (spec.api_url or '').rstrip('/')
+        for resource in spec.resources.values():
+            for operation in resource.operations.values():
+                key = self._parse_path(base_path + operation.path_name)
+                if key is None:
+                    continue
+                model, pk_kind = key
+                path_parameter = f'{model}_{pk_kind}' if pk_kind else None
+                self._routes[(operation.http_method.lower(), model, pk_kind)] = Route(
+                    http_method=operation.http_method.lower(),
+                    path_name=operation.path_name,
+                    url_template=api_url + operation.path_name,
+                    path_parameter=path_parameter,
+                    query_parameters=frozenset(
+                        name for name, param in operation.params.items() if param.location == 'query'
+                    ),
+                )
+
+    def __len__(self):
+        return len(self._routes)
+
+    @staticmethod
+    def _parse_path(path: str) -> Optional[Tuple[str, Optional[str]]]:
+        if not (path.startswith('/') and path.endswith('/')):
+            return None
+        parts = path[1:-1].split('/')
+        model = parts[0]
+        if not model or '{' in model:
+            return None
+        if len(parts) == 1:
+            return model, None
+        if len(parts) == 2:
+            for pk_kind in PK_KINDS:
+                if parts[1] == f'{{{model}_{pk_kind}}}':
+                    return model, pk_kind
+        return None
+
+    def get_route(self, http_method: str, model: str, pk_kind: Optional[str] = None) -> Optional[Route]:
+        """
+        Find the route for the request, OPTIONS requests fall back to the GET operation.
+        """
+        http_method = http_method.lower()
+        route = self._routes.get((http_method, model, pk_kind))
+        if route is None and http_method == 'options':
+            route = self._routes.get(('get', model, pk_kind))
+            if route is not None:
+                route = route._replace(http_method=http_method)
+        return route
+
+
+_route_tables: 'weakref.WeakKeyDictionary[Spec, RouteTable]' = weakref.WeakKeyDictionary()
+
+
+def get_route_table(spec: Spec) -> RouteTable:
+    """ Get the route table of the spec, it is built once per compiled spec """
+    try:
+        return _route_tables[spec]
+    except KeyError:
+        route_table = _route_tables[spec] = RouteTable(spec)
+        return route_table
@@ -0,0 +1,225 @@
+import asyncio
+import atexit
+import contextlib
+import contextvars
+import logging
+import threading
+import weakref
+from typing import AsyncIterator, Dict, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from core.models import LogicModule
+
+logger = logging.getLogger(__name__)
+
+
+def get_upstream_key(logic_module: Optional[LogicModule] = None, url: Optional[str] = None) -> str:
+    """ Identify the service by the endpoint of the logic module or, without it, by the URL's origin """
+    if logic_module is not None and logic_module.endpoint:
+        return logic_module.endpoint.rstrip('/')
+    parts = urlsplit(url or '')
+    return f'{parts.scheme}://{parts.netloc}'
+
+
+class UpstreamPoolConfig(NamedTuple):
+    pool_size: int
+    keep_alive: bool
+    connect_timeout: Optional[float]
+    read_timeout: Optional[float]
+
+    @classmethod
+    def from_logic_module(cls, logic_module: Optional[LogicModule] = None) -> 'UpstreamPoolConfig':
+        """ Take the configuration of the logic module, fall back to gateway settings """
+        return cls(
+            pool_size=getattr(logic_module, 'pool_size', None) or settings.GATEWAY_UPSTREAM_POOL_SIZE,
+            keep_alive=getattr(logic_module, 'keep_alive', True),
+            connect_timeout=getattr(logic_module, 'connect_timeout', None) or settings.GATEWAY_UPSTREAM_CONNECT_TIMEOUT,
+            read_timeout=getattr(logic_module, 'read_timeout', None) or settings.GATEWAY_UPSTREAM_READ_TIMEOUT,
+        )
+
+    @property
+    def timeout(self) -> Tuple[Optional[float], Optional[float]]:
+        return self.connect_timeout, self.read_timeout
+
+    @property
+    def client_timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+
+
+class UpstreamPool:
+    """ Keep-alive HTTP session to a service with its connection pool configuration """
+
+    def __init__(self, config: UpstreamPoolConfig):
+        self.config = config
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not config.keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    @property
+    def timeout(self) -> Tuple[Optional[float], Optional[float]]:
+        return self.config.timeout
+
+    def get_stats(self) -> dict:
+        """ Usage of the connection pools of the session, summed over hosts """
+        stats = {
+            'pool_size': self.config.pool_size,
+            'keep_alive': self.config.keep_alive,
+            'connections_opened': 0,
+            'requests': 0,
+            'in_use': 0,
+            'idle': 0,
+        }
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                stats['connections_opened'] += pool.num_connections
+                stats['requests'] += pool.num_requests
+                if pool.pool is not None:
+                    free_slots = pool.pool.qsize()
+                    stats['in_use'] += max(pool.pool.maxsize - free_slots, 0)
+                    stats['idle'] += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        return stats
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class SessionRegistry:
+    """
+    Per-worker registry of keep-alive HTTP sessions to the services, keyed by
+    the endpoint of the logic module. Requests to an upstream reuse pooled TCP/TLS
+    connections instead of opening a new connection per call.
+    """
+
+    def __init__(self):
+        self._pools: Dict[str, UpstreamPool] = {}
+        self._lock = threading.Lock()
+
+    def get_pool(self, logic_module: Optional[LogicModule] = None, url: Optional[str] = None) -> UpstreamPool:
+        """ Get the session pool of the logic module or, without it, of the URL's origin """
+        key = get_upstream_key(logic_module, url)
+        config = UpstreamPoolConfig.from_logic_module(logic_module)
+        pool = self._pools.get(key)
+        if pool is not None and (logic_module is None or pool.config == config):
+            return pool
+
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None or (logic_module is not None and pool.config != config):
+                if pool is not None:
+                    logger.debug(f'Upstream pool configuration of {key} changed, recreating the session')
+                    pool.close()
+                pool = self._pools[key] = UpstreamPool(config)
+            return pool
+
+    def get_stats(self) -> Dict[str, dict]:
+        """ Connection pool usage per upstream endpoint """
+        return {key: pool.get_stats() for key, pool in list(self._pools.items())}
+
+    def close(self, endpoint: str) -> None:
+        pool = self._pools.pop(endpoint.rstrip('/'), None)
+        if pool is not None:
+            pool.close()
+
+    def close_all(self) -> None:
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+
+
+class AsyncSessionManager:
+    """
+    aiohttp sessions of the async clients and the datamesh fan-out. Sessions are bound
+    to an event loop. The application loop of an ASGI server, marked with `open()` on
+    lifespan startup, shares one long-lived session whose connector limits connections
+    per host and caches DNS lookups. Under WSGI every async request runs in a loop of
+    its own, so requests get a session for their `scope()` that is closed with it.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+        self._shared_loops: 'weakref.WeakSet[asyncio.AbstractEventLoop]' = weakref.WeakSet()
+        self._scope_session: contextvars.ContextVar[Optional[aiohttp.ClientSession]] = \
+            contextvars.ContextVar('scope_session', default=None)
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=settings.GATEWAY_ASYNC_CONNECTION_LIMIT,
+            limit_per_host=settings.GATEWAY_ASYNC_CONNECTION_LIMIT_PER_HOST,
+            ttl_dns_cache=settings.GATEWAY_ASYNC_DNS_CACHE_TTL,
+            keepalive_timeout=settings.GATEWAY_ASYNC_KEEPALIVE_TIMEOUT,
+        )
+        return aiohttp.ClientSession(connector=connector)
+
+    def open(self) -> None:
+        """ Share a session in the running event loop for its lifetime, e.g. on ASGI lifespan startup """
+        self._shared_loops.add(asyncio.get_running_loop())
+
+    @contextlib.asynccontextmanager
+    async def scope(self) -> AsyncIterator[None]:
+        """
+        Session of a request: outside of a shared loop a session is created for the
+        scope and closed when it exits, so short-lived loops don't leave connections behind
+        """
+        if asyncio.get_running_loop() in self._shared_loops or self._scope_session.get() is not None:
+            yield
+            return
+        session = self._create_session()
+        token = self._scope_session.set(session)
+        try:
+            yield
+        finally:
+            self._scope_session.reset(token)
+            await session.close()
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """
+        Get the session of the current scope or else of the running event loop, create it on
+        first use. A loop's session is kept until `close()`.
+        """
+        session = self._scope_session.get()
+        if session is not None:
+            return session
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = self._sessions[loop] = self._create_session()
+        return session
+
+    async def close(self) -> None:
+        """ Close the session of the running event loop, e.g. on ASGI lifespan shutdown """
+        loop = asyncio.get_running_loop()
+        self._shared_loops.discard(loop)
+        session = self._sessions.pop(loop, None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    def close_all(self) -> None:
+        """ Close sessions whose event loops are not running anymore, e.g. at interpreter exit """
+        for loop, session in list(self._sessions.items()):
+            if session.closed or loop.is_running():
+                continue
+            if loop.is_closed():
+                # the connections died with the loop, only release the connector
+                session.detach()
+            else:
+                loop.run_until_complete(session.close())
+            self._sessions.pop(loop, None)
+
+
+session_registry = SessionRegistry()
+async_session_manager = AsyncSessionManager()
+atexit.register(session_registry.close_all)
+atexit.register(async_session_manager.close_all)
@@ -0,0 +1,45 @@
+from django.dispatch import receiver
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from core.models import CoreGroup, CoreUser, LogicModule
+from gateway.models import SwaggerVersionHistory
+from gateway.registry import logic_module_registry
+from gateway.sessions import session_registry
+from gateway.specs import spec_registry
+
+
+@receiver(post_save, sender=LogicModule)
+@receiver(post_delete, sender=LogicModule)
+def invalidate_logic_module_spec(sender, instance, **kwargs):
+    spec_registry.invalidate(instance)
+
+
+@receiver(post_save, sender=LogicModule)
+@receiver(post_delete, sender=LogicModule)
+@receiver(post_save, sender=CoreGroup)
+@receiver(post_delete, sender=CoreGroup)
+@receiver(m2m_changed, sender=LogicModule.core_groups.through)
+def invalidate_logic_module_registry(sender, **kwargs):
+    logic_module_registry.invalidate()
+
+
+@receiver(m2m_changed, sender=CoreUser.core_groups.through)
+def invalidate_user_throttle_rates(sender, instance, action, reverse, pk_set, **kwargs):
+    """ The registry keeps the throttle rates of users' groups, most groups have none """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    group_ids = [instance.pk] if reverse else pk_set
+    if logic_module_registry.has_throttled_groups(group_ids):
+        logic_module_registry.invalidate()
+
+
+@receiver(post_delete, sender=LogicModule)
+def close_logic_module_session(sender, instance, **kwargs):
+    if instance.endpoint:
+        session_registry.close(instance.endpoint)
+
+
+@receiver(post_save, sender=SwaggerVersionHistory)
+def invalidate_spec_on_version_change(sender, instance, created, **kwargs):
+    if created:
+        spec_registry.invalidate_endpoint(instance.endpoint_name)
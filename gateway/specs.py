@@ -0,0 +1,162 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Dict, NamedTuple, Optional
+from urllib.error import URLError
+
+from bravado_core.spec import Spec
+from django.conf import settings
+from django.core.cache import cache
+
+from core.models import LogicModule
+from gateway import utils
+
+logger = logging.getLogger(__name__)
+
+SWAGGER_CONFIG = {
+    'validate_requests': False,
+    'validate_responses': False,
+    'use_models': False,
+    'validate_swagger_spec': False,
+}
+
+SPEC_FETCH_LOCK_PREFIX = 'gateway:spec-fetch:'
+SPEC_FETCH_POLL_INTERVAL = 0.1
+
+
+def get_spec_fingerprint(spec_dict: dict) -> str:
+    """ Generate a SHA-256 hash of the specification, independent of key order """
+    return hashlib.sha256(json.dumps(spec_dict, sort_keys=True).encode()).hexdigest()
+
+
+class CompiledSpec(NamedTuple):
+    endpoint_name: str
+    fingerprint: str
+    edit_date: Any
+    spec: Spec
+
+
+class SpecRegistry:
+    """
+    Worker-wide registry of compiled Swagger specs of logic modules.
+
+    Compiled specs are keyed by LogicModule and the hash of its `api_specification`,
+    so a spec changed by another worker process is recompiled on the next lookup.
+    Fetching a missing specification from the service is single-flighted per
+    logic module: within a process by a lock and across processes by a short-lived
+    lock in the shared cache backend.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Any, CompiledSpec] = {}
+        self._lock = threading.Lock()
+        self._fetch_locks: Dict[Any, threading.Lock] = {}
+
+    def get_spec(self, logic_module: LogicModule) -> Spec:
+        """ Get compiled Swagger spec of the logic module, compile it if needed """
+        key = self._get_key(logic_module)
+        entry = self._entries.get(key)
+        if (
+            entry is not None
+            and entry.edit_date is not None
+            and entry.edit_date == logic_module.edit_date
+            and logic_module.api_specification is not None
+        ):
+            return entry.spec
+
+        spec_dict = logic_module.api_specification
+        if spec_dict is None:
+            spec_dict = self._fetch_specification(logic_module)
+
+        fingerprint = get_spec_fingerprint(spec_dict)
+        if entry is None or entry.fingerprint != fingerprint:
+            logger.debug(f'Compiling Swagger spec of {logic_module.endpoint_name}')
+            spec = Spec.from_dict(spec_dict, config=SWAGGER_CONFIG)
+        else:
+            spec = entry.spec
+        self._entries[key] = CompiledSpec(
+            logic_module.endpoint_name, fingerprint, logic_module.edit_date, spec
+        )
+        return spec
+
+    def invalidate(self, logic_module: LogicModule) -> None:
+        self._entries.pop(self._get_key(logic_module), None)
+
+    def invalidate_endpoint(self, endpoint_name: str) -> None:
+        for key, entry in list(self._entries.items()):
+            if entry.endpoint_name == endpoint_name:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    @staticmethod
+    def _get_key(logic_module: LogicModule) -> Any:
+        return logic_module.pk if logic_module.pk is not None else logic_module.endpoint_name
+
+    def _get_fetch_lock(self, key: Any) -> threading.Lock:
+        with self._lock:
+            return self._fetch_locks.setdefault(key, threading.Lock())
+
+    def _fetch_specification(self, logic_module: LogicModule) -> dict:
+        """
+        Pull specification of the module from its service and store it.
+        Only one thread per process and one process per cluster pulls it at a time,
+        the others wait for the stored specification.
+        """
+        key = self._get_key(logic_module)
+        with self._get_fetch_lock(key):
+            # the specification could be stored while waiting for the lock
+            spec_dict = self._get_stored_specification(logic_module)
+            if spec_dict is not None:
+                logic_module.api_specification = spec_dict
+                return spec_dict
+
+            lock_key = f'{SPEC_FETCH_LOCK_PREFIX}{key}'
+            lock_timeout = settings.GATEWAY_SPEC_FETCH_LOCK_TIMEOUT
+            # the lock holds a token of its owner, so only the owner releases it
+            token = uuid.uuid4().hex
+            owned = cache.add(lock_key, token, timeout=lock_timeout)
+            if not owned:
+                # another process is pulling the specification, wait for it
+                deadline = time.monotonic() + lock_timeout
+                while time.monotonic() < deadline:
+                    time.sleep(SPEC_FETCH_POLL_INTERVAL)
+                    spec_dict = self._get_stored_specification(logic_module)
+                    if spec_dict is not None:
+                        logic_module.api_specification = spec_dict
+                        return spec_dict
+                logger.warning(f'Timed out waiting for Swagger spec of {logic_module.endpoint_name}')
+                # take the lock over if it expired, else pull the specification without it
+                owned = cache.add(lock_key, token, timeout=lock_timeout)
+
+            try:
+                schema_url = utils.get_swagger_url_by_logic_module(logic_module)
+                try:
+                    response = utils.get_swagger_from_url(schema_url)
+                    spec_dict = response.json()
+                except URLError:
+                    raise URLError(f'Make sure that {schema_url} is accessible.')
+                logic_module.api_specification = spec_dict
+                logic_module.save()
+            finally:
+                # a lock that expired meanwhile may belong to another process now
+                if owned and cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+            return spec_dict
+
+    @staticmethod
+    def _get_stored_specification(logic_module: LogicModule) -> Optional[dict]:
+        if logic_module.pk is None:
+            return None
+        return (
+            LogicModule.objects.filter(pk=logic_module.pk)
+            .values_list('api_specification', flat=True)
+            .first()
+        )
+
+
+spec_registry = SpecRegistry()
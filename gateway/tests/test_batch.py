@@ -0,0 +1,185 @@
+import asyncio
+import json
+import os
+from unittest.mock import patch
+
+import httpretty
+import pytest
+from rest_framework.test import APIClient
+
+import factories
+from core.tests.fixtures import auth_api_client, logic_module, org, org_member
+from .utils import AiohttpResponseMock, create_aiohttp_session_mock
+
+CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def register_swagger_mock(logic_module):
+    """ Swagger specs are pulled with requests by the spec registry """
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json'), 'rb') as r:
+        body = r.read()
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{logic_module.endpoint}/docs/swagger.json',
+        body=body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+
+
+class SlowResponseMock(AiohttpResponseMock):
+    """ Response mock keeping track of the bodies read at the same time """
+
+    in_flight = 0
+    max_in_flight = 0
+
+    async def read(self):
+        SlowResponseMock.in_flight += 1
+        SlowResponseMock.max_in_flight = max(SlowResponseMock.max_in_flight, SlowResponseMock.in_flight)
+        await asyncio.sleep(0.01)
+        SlowResponseMock.in_flight -= 1
+        return await super().read()
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+@patch('gateway.clients.async_session_manager.get_session')
+def test_batch_performs_sub_requests(client_session_mock, auth_api_client, logic_module):
+    register_swagger_mock(logic_module)
+    session = create_aiohttp_session_mock([
+        AiohttpResponseMock(
+            method='GET',
+            url=f'{logic_module.endpoint}/documents/',
+            status=200,
+            body=b'{"results": [{"id": 1}]}',
+            headers={'Content-Type': 'application/json'},
+        ),
+        AiohttpResponseMock(
+            method='GET',
+            url=f'{logic_module.endpoint}/thumbnail/1/',
+            status=200,
+            body=b'IT IS A TEST',
+            headers={'Content-Type': 'text/plain'},
+        ),
+        AiohttpResponseMock(
+            method='POST',
+            url=f'{logic_module.endpoint}/documents/',
+            status=201,
+            body=b'{"id": 2, "name": "report"}',
+            headers={'Content-Type': 'application/json'},
+        ),
+    ])
+    client_session_mock.return_value = session
+
+    response = auth_api_client.post('/batch/', [
+        {'id': 'list', 'service': 'documents', 'model': 'documents', 'query': {'page': 2}},
+        {'service': 'documents', 'model': 'thumbnail', 'pk': 1},
+        {'method': 'POST', 'service': 'documents', 'model': 'documents', 'body': {'name': 'report'},
+         'depends_on': ['list']},
+    ], format='json')
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {'id': 'list', 'status': 200, 'headers': {'Content-Type': 'application/json'}, 'body': {'results': [{'id': 1}]}},
+        {'id': '1', 'status': 200, 'headers': {'Content-Type': 'text/plain'}, 'body': 'IT IS A TEST'},
+        {'id': '2', 'status': 201, 'headers': {'Content-Type': 'application/json'}, 'body': {'id': 2, 'name': 'report'}},
+    ]
+    requests = {(method, url): kwargs for method, url, kwargs in session.requests}
+    assert requests[('get', f'{logic_module.endpoint}/documents/')]['params'] == [('page', '2')]
+    assert json.loads(requests[('post', f'{logic_module.endpoint}/documents/')]['data']) == {'name': 'report'}
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+@patch('gateway.clients.async_session_manager.get_session')
+def test_batch_skips_sub_requests_of_failed_dependencies(
+    client_session_mock, auth_api_client, logic_module
+):
+    register_swagger_mock(logic_module)
+    session = create_aiohttp_session_mock([])
+    client_session_mock.return_value = session
+
+    response = auth_api_client.post('/batch/', [
+        {'id': 'missing', 'service': 'documents', 'model': 'nowhere'},
+        {'id': 'dependent', 'service': 'documents', 'model': 'documents', 'depends_on': 'missing'},
+        {'id': 'unknown', 'service': 'unknown', 'model': 'documents'},
+        {'id': 'no-pk', 'method': 'DELETE', 'service': 'documents', 'model': 'documents'},
+    ], format='json')
+
+    assert response.status_code == 200
+    assert [(result['id'], result['status']) for result in response.json()] == [
+        ('missing', 404), ('dependent', 424), ('unknown', 404), ('no-pk', 400),
+    ]
+    assert response.json()[1]['body'] == {'detail': 'Sub-request "missing" failed.'}
+    assert session.requests == []
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+@patch('gateway.clients.async_session_manager.get_session')
+def test_batch_checks_permissions_per_sub_request(
+    client_session_mock, logic_module, org, org_member
+):
+    register_swagger_mock(logic_module)
+    logic_module.core_groups.add(factories.CoreGroup(organization=org, is_org_level=True, permissions=4))
+    client_session_mock.return_value = create_aiohttp_session_mock([
+        AiohttpResponseMock(
+            method='GET',
+            url=f'{logic_module.endpoint}/documents/1/',
+            status=200,
+            body=b'{"id": 1}',
+            headers={'Content-Type': 'application/json'},
+        ),
+    ])
+    client = APIClient()
+    client.force_authenticate(user=org_member)
+
+    response = client.post('/batch/', [
+        {'service': 'documents', 'model': 'documents', 'pk': 1},
+        {'method': 'DELETE', 'service': 'documents', 'model': 'documents', 'pk': 1},
+    ], format='json')
+
+    assert response.status_code == 200
+    assert [result['status'] for result in response.json()] == [200, 403]
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+@patch('gateway.clients.async_session_manager.get_session')
+def test_batch_concurrency_is_capped(client_session_mock, auth_api_client, logic_module, settings):
+    register_swagger_mock(logic_module)
+    settings.GATEWAY_BATCH_CONCURRENCY = 2
+    SlowResponseMock.in_flight = SlowResponseMock.max_in_flight = 0
+    client_session_mock.return_value = create_aiohttp_session_mock([
+        SlowResponseMock(
+            method='GET',
+            url=f'{logic_module.endpoint}/documents/{pk}/',
+            status=200,
+            body=b'{}',
+            headers={'Content-Type': 'application/json'},
+        )
+        for pk in range(6)
+    ])
+
+    response = auth_api_client.post('/batch/', [
+        {'service': 'documents', 'model': 'documents', 'pk': pk} for pk in range(6)
+    ], format='json')
+
+    assert [result['status'] for result in response.json()] == [200] * 6
+    assert SlowResponseMock.max_in_flight == 2
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize('data', [
+    {'service': 'documents', 'model': 'documents'},
+    [],
+    [{'service': 'documents'}],
+    [{'method': 'TRACE', 'service': 'documents', 'model': 'documents'}],
+    [{'service': 'documents', 'model': 'documents', 'depends_on': ['1']},
+     {'service': 'documents', 'model': 'documents'}],
+    [{'id': 'a', 'service': 'documents', 'model': 'documents'}] * 2,
+    [{'service': 'documents', 'model': 'documents'}] * 51,
+])
+def test_batch_validation(auth_api_client, data):
+    response = auth_api_client.post('/batch/', data, format='json')
+    assert response.status_code == 400
+    assert 'detail' in response.json()
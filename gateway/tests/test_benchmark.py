@@ -0,0 +1,79 @@
+import json
+
+import pytest
+import requests
+from django.core.management import call_command
+
+import factories
+from core.models import LogicModule
+from gateway.benchmark import COMPARED_METRICS, LoadResult, StubFleet, compare_results, percentile
+
+
+def test_stub_fleet_serves_spec_and_items():
+    with StubFleet(2, payload_size=100, page_size=3) as fleet:
+        first, second = fleet.services
+        assert first.endpoint != second.endpoint
+
+        response = requests.get(f'{first.endpoint}/docs/swagger.json')
+        assert response.status_code == 200
+        assert set(response.json()['paths']) == {'/items/', '/items/{items_id}/'}
+
+        response = requests.get(f'{second.endpoint}/items/')
+        assert [item['id'] for item in response.json()['results']] == [1, 2, 3]
+
+        response = requests.get(f'{second.endpoint}/items/1/')
+        assert response.json()['data'] == 'x' * 100
+        assert requests.post(f'{second.endpoint}/items/', json={'name': 'new'}).status_code == 201
+        assert requests.delete(f'{second.endpoint}/items/1/').status_code == 204
+
+    with pytest.raises(requests.ConnectionError):
+        requests.get(f'{first.endpoint}/items/')
+
+
+def test_load_result_summary():
+    assert percentile([], 50) == 0.0
+    assert percentile([0.1, 0.2, 0.3, 0.4], 50) == 0.2
+    assert percentile([0.1, 0.2, 0.3, 0.4], 99) == 0.4
+
+    summary = LoadResult(latencies=[0.04, 0.01, 0.02, 0.03], errors=1, elapsed=0.5).summarize()
+    assert summary == {
+        'requests': 5, 'errors': 1, 'rps': 8.0, 'mean_ms': 25.0, 'p50_ms': 20.0, 'p95_ms': 40.0, 'p99_ms': 40.0,
+    }
+
+
+def test_compare_results():
+    baseline = {'results': {
+        'sync-list': {'rps': 100.0, 'p50_ms': 10.0, 'p95_ms': 20.0, 'p99_ms': 0, 'db_queries_per_request': 2.0},
+    }}
+    current = {'results': {
+        'sync-list': {'rps': 150.0, 'p50_ms': 8.0, 'p95_ms': 20.0, 'p99_ms': 30.0, 'db_queries_per_request': 1.0},
+        'async-list': {'rps': 300.0},
+    }}
+
+    rows = compare_results(baseline, current)
+    assert [row['metric'] for row in rows] == list(COMPARED_METRICS)
+    assert [row['change'] for row in rows] == [50.0, -20.0, 0.0, None, -50.0]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_benchmark_command(tmp_path):
+    factories.CoreUser(username='benchmark', is_superuser=True)
+    output = tmp_path / 'results.json'
+    call_command(
+        'benchmarkgateway', '--services=2', '--requests=6', '--concurrency=3', '--warmup=2', '--query-sample=2',
+        f'--output={output}',
+    )
+
+    report = json.loads(output.read_text())
+    assert report['parameters']['services'] == 2
+    assert set(report['results']) == {'sync-list', 'sync-detail', 'async-list', 'async-detail'}
+    for result in report['results'].values():
+        assert result['requests'] == 6
+        assert result['errors'] == 0
+        assert result['db_queries_per_request'] > 0
+    assert not LogicModule.objects.filter(endpoint_name__startswith='benchmark').exists()
+
+    call_command(
+        'benchmarkgateway', '--services=1', '--requests=2', '--concurrency=1', '--warmup=0', '--query-sample=1',
+        '--modes=sync', '--paths=detail', f'--compare={output}',
+    )
@@ -0,0 +1,204 @@
+import asyncio
+import contextlib
+import os
+from unittest.mock import Mock, patch
+
+import pytest
+import httpretty
+
+import factories
+from core.tests.fixtures import auth_api_client, logic_module
+from gateway import exceptions
+from gateway.breakers import CircuitBreaker, STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, circuit_breakers
+from gateway.upstream import send_async_request, send_request
+from .fixtures import datamesh
+
+CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture()
+def breaker_settings(settings):
+    settings.GATEWAY_CIRCUIT_BREAKER_MIN_REQUESTS = 4
+    settings.GATEWAY_CIRCUIT_BREAKER_ERROR_RATE = 0.5
+    settings.GATEWAY_CIRCUIT_BREAKER_OPEN_DURATION = 30
+    settings.GATEWAY_CIRCUIT_BREAKER_SLOW_CALL_DURATION = 1
+    return settings
+
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(4):
+        breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+
+
+def test_breaker_opens_on_error_rate(breaker_settings):
+    breaker = CircuitBreaker('documents')
+
+    breaker.record(200, 0.1)
+    breaker.record(200, 0.1)
+    breaker.record(502, 0.1)
+    assert breaker.state == STATE_CLOSED
+    breaker.record_failure()
+
+    assert breaker.state == STATE_OPEN
+    assert not breaker.allow_request()
+    with pytest.raises(exceptions.ServiceUnavailable) as e:
+        breaker.check()
+    assert e.value.status == 503
+    assert 0 < int(e.value.headers['Retry-After']) <= 30
+
+
+def test_breaker_counts_slow_calls(breaker_settings):
+    breaker = CircuitBreaker('documents')
+
+    for _ in range(4):
+        breaker.record(200, 2)
+
+    assert breaker.state == STATE_OPEN
+
+
+def test_breaker_half_open(breaker_settings):
+    breaker = CircuitBreaker('documents')
+    open_breaker(breaker)
+
+    with patch('gateway.breakers.time.monotonic', return_value=breaker._opened_at + 31):
+        # a single trial request is let through
+        assert breaker.allow_request()
+        assert breaker.state == STATE_HALF_OPEN
+        assert not breaker.allow_request()
+
+        # it failed, so the circuit opens again
+        breaker.record_failure()
+        assert breaker.state == STATE_OPEN
+        assert breaker.times_opened == 2
+
+    with patch('gateway.breakers.time.monotonic', return_value=breaker._opened_at + 31):
+        assert breaker.allow_request()
+        breaker.record(200, 0.1)
+        assert breaker.state == STATE_CLOSED
+        assert breaker.allow_request()
+
+
+def test_breaker_release_trial_call(breaker_settings):
+    breaker = CircuitBreaker('documents')
+    open_breaker(breaker)
+
+    with patch('gateway.breakers.time.monotonic', return_value=breaker._opened_at + 31):
+        assert breaker.allow_request()
+        assert not breaker.allow_request()
+        # the trial call ended without an outcome, another one is let through
+        breaker.release()
+        assert breaker.state == STATE_HALF_OPEN
+        assert breaker.allow_request()
+
+
+@pytest.mark.parametrize('exception', [RuntimeError, asyncio.CancelledError])
+def test_send_request_releases_trial_call(breaker_settings, exception):
+    url = 'http://documentservice:8080/documents/1/'
+    breaker = circuit_breakers.get(url=url)
+    open_breaker(breaker)
+    session = Mock(request=Mock(side_effect=exception))
+
+    with patch('gateway.breakers.time.monotonic', return_value=breaker._opened_at + 31):
+        with patch('gateway.upstream.session_registry.get_pool', return_value=Mock(session=session, timeout=None)):
+            with pytest.raises(exception):
+                send_request('get', url)
+        with pytest.raises(exception):
+            asyncio.run(send_async_request(contextlib.AsyncExitStack(), session, 'get', url))
+
+        assert breaker.state == STATE_HALF_OPEN
+        assert breaker.allow_request()
+
+
+def test_breaker_disabled(breaker_settings):
+    breaker_settings.GATEWAY_CIRCUIT_BREAKER_ENABLED = False
+    breaker = CircuitBreaker('documents')
+    open_breaker(breaker)
+
+    assert breaker.allow_request()
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_make_service_request_fails_fast_with_open_circuit(auth_api_client, logic_module, breaker_settings):
+    url = f'/{logic_module.endpoint_name}/thumbnail/1/'
+
+    # mock requests
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        swagger_body = r.read()
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{logic_module.endpoint}/docs/swagger.json',
+        body=swagger_body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{logic_module.endpoint}/thumbnail/1/',
+        body='{"details": "Service Unavailable"}',
+        status=503,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+
+    for _ in range(4):
+        response = auth_api_client.get(url)
+        assert response.status_code == 503
+    upstream_requests = len(httpretty.latest_requests())
+
+    # make api request
+    response = auth_api_client.get(url)
+
+    assert response.status_code == 503
+    assert response.json() == {'detail': 'Service "documents" is temporarily unavailable.'}
+    assert response.has_header('Retry-After')
+    assert len(httpretty.latest_requests()) == upstream_requests
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_make_service_request_skips_join_with_open_circuit(auth_api_client, datamesh, breaker_settings):
+    lm1, lm2, relationship = datamesh
+    factories.JoinRecord(
+        relationship=relationship,
+        record_id=None,
+        record_uuid='19a7f600-74a0-4123-9be5-dfa69aa172cc',
+        related_record_id=1,
+        related_record_uuid=None,
+    )
+    open_breaker(circuit_breakers.get(lm2))
+
+    url = f'/{lm1.endpoint_name}/siteprofiles/19a7f600-74a0-4123-9be5-dfa69aa172cc/'
+
+    # mock requests
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_location.json')) as r:
+        swagger_location_body = r.read()
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        swagger_documents_body = r.read()
+    with open(os.path.join(CURRENT_PATH, 'fixtures/data_detail_siteprofile.json')) as r:
+        data_location_body = r.read()
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{lm1.endpoint}/docs/swagger.json',
+        body=swagger_location_body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{lm2.endpoint}/docs/swagger.json',
+        body=swagger_documents_body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{lm1.endpoint}/siteprofiles/19a7f600-74a0-4123-9be5-dfa69aa172cc/',
+        body=data_location_body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+
+    # make api request
+    response = auth_api_client.get(url, {'join': 'true'})
+
+    # the related data of the unavailable service is left out
+    assert response.status_code == 200
+    assert response.json()[relationship.key] == []
+    assert not any(request.path == '/documents/1/' for request in httpretty.latest_requests())
@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import asyncio
+from unittest.mock import patch
+
+import pytest
+import httpretty
+from bravado_core.spec import Spec
+from django.core.cache import cache
+from django.http.request import QueryDict
+from rest_framework.request import Request
+
+import factories
+from core.models import LogicModule
+from core.tests.fixtures import org, org_member
+from gateway.cache import response_cache
+from gateway.clients import AsyncSwaggerClient, SwaggerClient
+from gateway.specs import SWAGGER_CONFIG
+from .utils import AiohttpResponseMock, create_aiohttp_session_mock
+
+CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(scope='module')
+def documents_spec():
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        return Spec.from_dict(json.load(r), config=SWAGGER_CONFIG)
+
+
+@pytest.fixture()
+def cached_logic_module():
+    return factories.LogicModule.create(
+        name='documents',
+        endpoint_name='documents',
+        endpoint='http://documentservice:8080',
+        cache_ttl=60,
+    )
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    cache.clear()
+    response_cache.reset_stats()
+    yield
+    cache.clear()
+
+
+def make_request(rf, user, path='/documents/documents/', params=None):
+    request = Request(rf.get(path, params))
+    request.user = user
+    return request
+
+
+def register_documents(logic_module, body=b'[{"documents_id": 1}]', headers=None):
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{logic_module.endpoint}/documents/',
+        body=body,
+        adding_headers={'Content-Type': 'application/json', **(headers or {})},
+    )
+
+
+@pytest.mark.django_db()
+def test_cache_key_scope(rf, cached_logic_module, org_member):
+    url = f'{cached_logic_module.endpoint}/documents/'
+    colleague = factories.CoreUser(organization=org_member.organization, username='colleague')
+
+    key = response_cache.get_key(cached_logic_module, make_request(rf, org_member), url)
+    assert key is not None
+    assert key == response_cache.get_key(cached_logic_module, make_request(rf, org_member), url)
+    assert key != response_cache.get_key(cached_logic_module, make_request(rf, colleague), url)
+
+    cached_logic_module.cache_scope = LogicModule.CACHE_SCOPE_ORGANIZATION
+    assert (
+        response_cache.get_key(cached_logic_module, make_request(rf, org_member), url)
+        == response_cache.get_key(cached_logic_module, make_request(rf, colleague), url)
+    )
+
+
+@pytest.mark.django_db()
+def test_cache_key_normalizes_query(rf, cached_logic_module, org_member):
+    url = f'{cached_logic_module.endpoint}/documents/'
+
+    key1 = response_cache.get_key(cached_logic_module, make_request(rf, org_member, params={'a': 1, 'b': 2}), url)
+    key2 = response_cache.get_key(cached_logic_module, make_request(rf, org_member, params={'b': 2, 'a': 1}), url)
+    key3 = response_cache.get_key(cached_logic_module, make_request(rf, org_member, params={'a': 2}), url)
+
+    assert key1 == key2
+    assert key1 != key3
+
+
+@pytest.mark.django_db()
+def test_cache_key_disabled(rf, cached_logic_module, org_member):
+    url = f'{cached_logic_module.endpoint}/documents/'
+    request = Request(rf.post('/documents/documents/'))
+    request.user = org_member
+    assert response_cache.get_key(cached_logic_module, request, url) is None
+
+    cached_logic_module.cache_ttl = None
+    assert response_cache.get_key(cached_logic_module, make_request(rf, org_member), url) is None
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_client_shares_cached_response(rf, cached_logic_module, org_member, documents_spec):
+    register_documents(cached_logic_module)
+
+    for _ in range(3):
+        client = SwaggerClient(documents_spec, make_request(rf, org_member), cached_logic_module)
+        content, status_code, headers = client.request(service='documents', model='documents')
+        assert content == [{'documents_id': 1}]
+        assert status_code == 200
+        assert headers['Content-Type'] == 'application/json'
+
+    assert len(httpretty.latest_requests()) == 1
+    assert response_cache.get_stats() == {'documents': {'misses': 1, 'hits': 2}}
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_client_does_not_share_response_between_users(rf, cached_logic_module, org_member, documents_spec):
+    register_documents(cached_logic_module)
+    colleague = factories.CoreUser(organization=org_member.organization, username='colleague')
+
+    for user in (org_member, colleague):
+        client = SwaggerClient(documents_spec, make_request(rf, user), cached_logic_module)
+        client.request(service='documents', model='documents')
+
+    assert len(httpretty.latest_requests()) == 2
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_client_does_not_cache_large_response(rf, cached_logic_module, org_member, documents_spec, settings):
+    settings.GATEWAY_RESPONSE_CACHE_MAX_ENTRY_SIZE = 10
+    register_documents(cached_logic_module)
+
+    for _ in range(2):
+        client = SwaggerClient(documents_spec, make_request(rf, org_member), cached_logic_module)
+        client.request(service='documents', model='documents')
+
+    assert len(httpretty.latest_requests()) == 2
+    assert response_cache.get_stats()['documents']['too_large'] == 2
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_client_does_not_cache_no_store_response(rf, cached_logic_module, org_member, documents_spec):
+    register_documents(cached_logic_module, headers={'Cache-Control': 'no-store'})
+
+    for _ in range(2):
+        client = SwaggerClient(documents_spec, make_request(rf, org_member), cached_logic_module)
+        client.request(service='documents', model='documents')
+
+    assert len(httpretty.latest_requests()) == 2
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_client_serves_stale_response_while_revalidating(rf, cached_logic_module, org_member, documents_spec):
+    register_documents(cached_logic_module)
+    client = SwaggerClient(documents_spec, make_request(rf, org_member), cached_logic_module)
+    client.request(service='documents', model='documents')
+
+    # let the response expire and change it upstream
+    register_documents(cached_logic_module, body=b'[{"documents_id": 2}]')
+    with patch('gateway.cache.time.time', return_value=time.time() + 61), \
+            patch.object(response_cache, '_get_executor') as executor_mock:
+        executor_mock.return_value.submit.side_effect = lambda fn, *args: fn(*args)
+        client = SwaggerClient(documents_spec, make_request(rf, org_member), cached_logic_module)
+        content, _, _ = client.request(service='documents', model='documents')
+
+    # the stale response is served, while the fresh one replaces it in the cache
+    assert content == [{'documents_id': 1}]
+    assert len(httpretty.latest_requests()) == 2
+    client = SwaggerClient(documents_spec, make_request(rf, org_member), cached_logic_module)
+    content, _, _ = client.request(service='documents', model='documents')
+    assert content == [{'documents_id': 2}]
+    assert response_cache.get_stats() == {
+        'documents': {'misses': 1, 'stale_hits': 1, 'revalidations': 1, 'hits': 1},
+    }
+
+
+@pytest.mark.django_db()
+def test_async_client_shares_cached_response(rf, cached_logic_module, org_member, documents_spec):
+    responses = [
+        AiohttpResponseMock(
+            method='GET',
+            url=f'{cached_logic_module.endpoint}/documents/',
+            status=200,
+            body=b'[{"documents_id": 1}]',
+            headers={'Content-Type': 'application/json'},
+        ),
+    ]
+    session_mock = create_aiohttp_session_mock(responses)
+
+    async def request():
+        client = AsyncSwaggerClient(documents_spec, make_request(rf, org_member), cached_logic_module)
+        return await client.request(service='documents', model='documents')
+
+    with patch('gateway.clients.async_session_manager.get_session', return_value=session_mock):
+        results = [asyncio.run(request()) for _ in range(2)]
+
+    assert [content for content, _, _ in results] == [[{'documents_id': 1}]] * 2
+    assert len(session_mock.requests) == 1
+    assert response_cache.get_stats() == {'documents': {'misses': 1, 'hits': 1}}
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_client_revalidates_with_query_of_cached_request(rf, cached_logic_module, org_member, documents_spec):
+    register_documents(cached_logic_module)
+    params = {'page': 2, 'join': 'true'}
+    client = SwaggerClient(documents_spec, make_request(rf, org_member, params=params), cached_logic_module)
+    client.request(service='documents', model='documents')
+
+    submitted = []
+    with patch('gateway.cache.time.time', return_value=time.time() + 61), \
+            patch.object(response_cache, '_get_executor') as executor_mock:
+        executor_mock.return_value.submit.side_effect = lambda fn, *args: submitted.append((fn, args))
+        request = make_request(rf, org_member, params=params)
+        client = SwaggerClient(documents_spec, request, cached_logic_module)
+        client.request(service='documents', model='documents')
+        # the join replaces the query params before the refresh runs in background
+        request._request.GET = QueryDict(mutable=True)
+        (fn, args), = submitted
+        fn(*args)
+
+    assert httpretty.last_request().querystring == {'page': ['2'], 'join': ['true']}
+
+
+@pytest.mark.django_db()
+def test_async_client_revalidates_with_query_of_cached_request(rf, cached_logic_module, org_member, documents_spec):
+    responses = [
+        AiohttpResponseMock(
+            method='GET',
+            url=f'{cached_logic_module.endpoint}/documents/',
+            status=200,
+            body=b'[{"documents_id": 1}]',
+            headers={'Content-Type': 'application/json'},
+        ),
+    ]
+    session_mock = create_aiohttp_session_mock(responses)
+    params = {'page': 2, 'join': 'true'}
+
+    async def request():
+        request = make_request(rf, org_member, params=params)
+        client = AsyncSwaggerClient(documents_spec, request, cached_logic_module)
+        await client.request(service='documents', model='documents')
+        # the join replaces the query params before the refresh runs in background
+        request._request.GET = QueryDict(mutable=True)
+        await asyncio.gather(*response_cache._revalidation_tasks)
+
+    with patch('gateway.clients.async_session_manager.get_session', return_value=session_mock):
+        asyncio.run(request())
+        with patch('gateway.cache.time.time', return_value=time.time() + 61):
+            asyncio.run(request())
+
+    assert response_cache.get_stats()['documents']['revalidations'] == 1
+    assert [kwargs['params'] for _, _, kwargs in session_mock.requests] == [[('page', '2'), ('join', 'true')]] * 2
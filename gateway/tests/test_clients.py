@@ -0,0 +1,88 @@
+import os
+import json
+import timeit
+
+import pytest
+import httpretty
+import requests
+from bravado_core.spec import Spec
+from rest_framework.request import Request
+
+from core.tests.fixtures import logic_module
+from gateway.clients import SwaggerClient
+from gateway.specs import SWAGGER_CONFIG
+from gateway.utils import GatewayJSONEncoder
+
+CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(scope='module')
+def documents_spec():
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        return Spec.from_dict(json.load(r), config=SWAGGER_CONFIG)
+
+
+def make_json_body(size: int) -> bytes:
+    """ Build a JSON list of documents of about the given size in bytes """
+    with open(os.path.join(CURRENT_PATH, 'fixtures/data_detail_document.json'), 'rb') as r:
+        document = json.loads(r.read())
+    document_size = len(json.dumps(document)) + 2
+    return json.dumps([document] * max(size // document_size, 1)).encode()
+
+
+def make_response(body: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = 'application/json'
+    response._content = body
+    return response
+
+
+@pytest.mark.parametrize('passthrough', [True, False])
+@pytest.mark.django_db()
+@httpretty.activate
+def test_swagger_client_passthrough(rf, logic_module, documents_spec, passthrough):
+    body = b'{"documents_id":  1, "file_name": "test.jpg"}'
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{logic_module.endpoint}/documents/1/',
+        body=body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+    request = Request(rf.get('/documents/documents/1/'))
+    client = SwaggerClient(documents_spec, request, logic_module)
+
+    content, status_code, headers = client.request(
+        passthrough=passthrough, service='documents', model='documents', pk='1'
+    )
+
+    assert status_code == 200
+    if passthrough:
+        # the body is left untouched
+        assert content == body
+    else:
+        assert content == {'documents_id': 1, 'file_name': 'test.jpg'}
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('size', [1024, 100 * 1024, 5 * 1024 * 1024])
+def test_benchmark_passthrough_vs_reencode(size):
+    body = make_json_body(size)
+    response = make_response(body)
+
+    def reencode():
+        return json.dumps(response.json(), cls=GatewayJSONEncoder)
+
+    def passthrough():
+        return response.content
+
+    assert json.loads(reencode()) == json.loads(passthrough())
+
+    number = max(10 * 1024 * 1024 // size, 1)
+    reencode_time = min(timeit.repeat(reencode, number=number, repeat=3)) / number
+    passthrough_time = min(timeit.repeat(passthrough, number=number, repeat=3)) / number
+    print(
+        f'\nResponse of {len(body) / 1024:.0f}KB: decode and encode {reencode_time * 1e6:.1f}us, '
+        f'passthrough {passthrough_time * 1e6:.1f}us, saved {(reencode_time - passthrough_time) * 1e6:.1f}us '
+        f'of CPU per request'
+    )
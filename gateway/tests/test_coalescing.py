@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+import httpretty
+from bravado_core.spec import Spec
+from django.core.cache import cache
+from rest_framework.request import Request
+
+import factories
+from core.tests.fixtures import org, org_member
+from gateway.clients import AsyncSwaggerClient, SwaggerClient
+from gateway.coalescing import SharedResponse, request_coalescer
+from gateway.specs import SWAGGER_CONFIG
+from .utils import AiohttpResponseMock, create_aiohttp_session_mock
+
+CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(scope='module')
+def documents_spec():
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        return Spec.from_dict(json.load(r), config=SWAGGER_CONFIG)
+
+
+@pytest.fixture()
+def coalesced_logic_module():
+    return factories.LogicModule.create(
+        name='documents',
+        endpoint_name='documents',
+        endpoint='http://documentservice:8080',
+        coalesce_requests=True,
+    )
+
+
+@pytest.fixture(autouse=True)
+def clear_coalescer():
+    cache.clear()
+    request_coalescer.reset_stats()
+    yield
+    cache.clear()
+
+
+def make_request(rf, user):
+    request = Request(rf.get('/documents/documents/'))
+    request.user = user
+    return request
+
+
+class SlowAiohttpResponseMock(AiohttpResponseMock):
+    async def read(self):
+        await asyncio.sleep(0.1)
+        return await super().read()
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_client_coalesces_concurrent_requests(rf, coalesced_logic_module, org_member, documents_spec):
+    def slow_response(request, uri, response_headers):
+        time.sleep(0.2)
+        return [200, response_headers, '[{"documents_id": 1}]']
+
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{coalesced_logic_module.endpoint}/documents/',
+        body=slow_response,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+
+    def request_documents(_):
+        client = SwaggerClient(documents_spec, make_request(rf, org_member), coalesced_logic_module)
+        return client.request(service='documents', model='documents')
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        results = list(executor.map(request_documents, range(5)))
+
+    assert [content for content, _, _ in results] == [[{'documents_id': 1}]] * 5
+    assert all(status_code == 200 for _, status_code, _ in results)
+    assert len(httpretty.latest_requests()) == 1
+    stats = request_coalescer.get_stats()['documents']
+    assert stats['requests'] == 5
+    assert stats['upstream'] == 1
+    assert stats['coalesced'] == 4
+    assert stats['coalescing_ratio'] == 0.8
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_client_takes_response_of_other_worker(rf, coalesced_logic_module, org_member, documents_spec):
+    request = make_request(rf, org_member)
+    key = request_coalescer.get_key(coalesced_logic_module, request, f'{coalesced_logic_module.endpoint}/documents/')
+    # another worker has the request in flight and publishes its response
+    cache.set(f'{key}:lock', 'token')
+    cache.set(f'{key}:token', SharedResponse(200, {'Content-Type': 'application/json'}, b'[{"documents_id": 2}]'))
+
+    client = SwaggerClient(documents_spec, request, coalesced_logic_module)
+    content, status_code, headers = client.request(service='documents', model='documents')
+
+    assert content == [{'documents_id': 2}]
+    assert headers['Content-Type'] == 'application/json'
+    assert len(httpretty.latest_requests()) == 0
+    assert request_coalescer.get_stats()['documents']['coalesced_remote'] == 1
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_client_requests_when_other_worker_fails(rf, coalesced_logic_module, org_member, documents_spec, settings):
+    settings.GATEWAY_COALESCING_POLL_INTERVAL = 0.01
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{coalesced_logic_module.endpoint}/documents/',
+        body='[{"documents_id": 1}]',
+        adding_headers={'Content-Type': 'application/json'},
+    )
+    request = make_request(rf, org_member)
+    key = request_coalescer.get_key(coalesced_logic_module, request, f'{coalesced_logic_module.endpoint}/documents/')
+    cache.set(f'{key}:lock', 'token', 0.05)
+
+    client = SwaggerClient(documents_spec, request, coalesced_logic_module)
+    content, _, _ = client.request(service='documents', model='documents')
+
+    # the lock of the other worker expired without a response
+    assert content == [{'documents_id': 1}]
+    assert len(httpretty.latest_requests()) == 1
+
+
+@pytest.mark.django_db()
+def test_async_client_coalesces_concurrent_requests(rf, coalesced_logic_module, org_member, documents_spec):
+    responses = [
+        SlowAiohttpResponseMock(
+            method='GET',
+            url=f'{coalesced_logic_module.endpoint}/documents/',
+            status=200,
+            body=b'[{"documents_id": 1}]',
+            headers={'Content-Type': 'application/json'},
+        ),
+    ]
+    session_mock = create_aiohttp_session_mock(responses)
+
+    async def request_documents():
+        client = AsyncSwaggerClient(documents_spec, make_request(rf, org_member), coalesced_logic_module)
+        return await client.request(service='documents', model='documents')
+
+    async def request_concurrently():
+        return await asyncio.gather(*[request_documents() for _ in range(5)])
+
+    with patch('gateway.clients.async_session_manager.get_session', return_value=session_mock):
+        results = asyncio.run(request_concurrently())
+
+    assert [content for content, _, _ in results] == [[{'documents_id': 1}]] * 5
+    assert len(session_mock.requests) == 1
+    assert request_coalescer.get_stats()['documents']['coalesced'] == 4
+
+
+@pytest.mark.django_db()
+def test_leader_keeps_lock_taken_over_by_other_worker(coalesced_logic_module):
+    key = 'gateway:coalesce:documents:key'
+    response = SharedResponse(200, {}, b'[]')
+
+    def fetch():
+        # the lock expired during the request and another worker took it
+        cache.set(f'{key}:lock', 'other')
+        return response
+
+    async def afetch():
+        return fetch()
+
+    assert request_coalescer.run(coalesced_logic_module, key, fetch) == response
+    assert cache.get(f'{key}:lock') == 'other'
+
+    cache.delete(f'{key}:lock')
+    assert asyncio.run(request_coalescer.arun(coalesced_logic_module, key, afetch)) == response
+    assert cache.get(f'{key}:lock') == 'other'
+
+
+@pytest.mark.django_db()
+def test_follower_requests_when_leader_is_slow(coalesced_logic_module, settings):
+    settings.GATEWAY_COALESCING_TIMEOUT = 0.1
+    key = 'gateway:coalesce:documents:key'
+    leader_response = SharedResponse(200, {}, b'[{"documents_id": 1}]')
+    follower_response = SharedResponse(200, {}, b'[{"documents_id": 2}]')
+
+    def slow_fetch():
+        time.sleep(0.3)
+        return leader_response
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        leader = executor.submit(request_coalescer.run, coalesced_logic_module, key, slow_fetch)
+        time.sleep(0.05)
+        assert request_coalescer.run(coalesced_logic_module, key, lambda: follower_response) == follower_response
+        assert leader.result() == leader_response
+
+    stats = request_coalescer.get_stats()['documents']
+    assert stats['upstream'] == 2
+    assert 'coalesced' not in stats
+
+
+@pytest.mark.django_db()
+def test_async_follower_requests_when_leader_is_slow(coalesced_logic_module, settings):
+    settings.GATEWAY_COALESCING_TIMEOUT = 0.1
+    key = 'gateway:coalesce:documents:key'
+    leader_response = SharedResponse(200, {}, b'[{"documents_id": 1}]')
+    follower_response = SharedResponse(200, {}, b'[{"documents_id": 2}]')
+
+    async def slow_fetch():
+        await asyncio.sleep(0.3)
+        return leader_response
+
+    async def fetch():
+        return follower_response
+
+    async def request_concurrently():
+        leader = asyncio.ensure_future(request_coalescer.arun(coalesced_logic_module, key, slow_fetch))
+        await asyncio.sleep(0.05)
+        return await asyncio.gather(leader, request_coalescer.arun(coalesced_logic_module, key, fetch))
+
+    assert asyncio.run(request_concurrently()) == [leader_response, follower_response]
+    assert request_coalescer.get_stats()['documents']['upstream'] == 2
@@ -0,0 +1,98 @@
+import datetime
+import json
+import timeit
+import uuid
+
+import pytest
+
+import factories
+from gateway.codecs import JSONCodec, OrjsonCodec, get_codec, orjson
+
+requires_orjson = pytest.mark.skipif(orjson is None, reason='orjson is not installed')
+
+
+class Primitive:
+    """ Stand-in for pyswagger primitives """
+
+    def to_json(self):
+        return {'primitive': True}
+
+
+def make_joined_payload(size: int) -> list:
+    """ A list of site profiles, each joined with its documents """
+    return [
+        {
+            'id': i,
+            'uuid': str(uuid.UUID(int=i)),
+            'name': f'Site profile {i}',
+            'create_date': '2020-01-01T10:00:00.123456Z',
+            'latitude': 52.520008,
+            'longitude': 13.404954,
+            'is_active': True,
+            'documents': [
+                {'documents_id': j, 'file_name': f'document-{j}.pdf', 'tags': ['report', 'site'], 'size': 1024 * j}
+                for j in range(5)
+            ],
+        }
+        for i in range(size)
+    ]
+
+
+@pytest.mark.django_db()
+@requires_orjson
+def test_orjson_codec_output_matches_json_codec():
+    organization = factories.Organization(name='Buildly')
+    content = {
+        'naive': datetime.datetime(2020, 1, 1, 10, 0, 0, 123456),
+        'aware': datetime.datetime(2020, 1, 1, 10, 0, tzinfo=datetime.timezone.utc),
+        'uuid': uuid.UUID('19a7f600-74a0-4123-9be5-dfa69aa172cc'),
+        'organization': organization,
+        'primitive': Primitive(),
+        'nested': [{'unicode': 'Grüße', 'float': 0.1, 'none': None}],
+    }
+
+    assert json.loads(OrjsonCodec().dumps(content)) == json.loads(JSONCodec().dumps(content))
+
+
+@requires_orjson
+def test_orjson_codec_falls_back_to_json():
+    codec = OrjsonCodec()
+
+    # non-string keys, integers beyond 64 bits and NaN aren't supported by orjson
+    assert codec.loads(codec.dumps({1: 2 ** 70})) == {'1': 2 ** 70}
+    assert codec.loads(b'{"value": NaN}')['value'] != 0
+    with pytest.raises(TypeError):
+        codec.dumps({'value': object()})
+    with pytest.raises(ValueError):
+        codec.loads(b'<html></html>')
+
+
+def test_get_codec(settings):
+    settings.GATEWAY_JSON_CODEC = 'json'
+    assert isinstance(get_codec(), JSONCodec)
+    assert get_codec('auto').name == ('json' if orjson is None else 'orjson')
+
+
+@pytest.mark.parametrize('name', ['json', pytest.param('orjson', marks=requires_orjson)])
+def test_codec_round_trip_of_joined_payload(name):
+    codec = get_codec(name)
+    payload = make_joined_payload(10)
+    assert codec.loads(codec.dumps(payload)) == payload
+
+
+@pytest.mark.benchmark
+@requires_orjson
+@pytest.mark.parametrize('size', [10, 100, 1000])
+def test_benchmark_json_codecs(size):
+    payload = make_joined_payload(size)
+    body = JSONCodec().dumps(payload)
+    number = max(20000 // size, 1)
+
+    results = []
+    for codec in (JSONCodec(), OrjsonCodec()):
+        encode_time = min(timeit.repeat(lambda: codec.dumps(payload), number=number, repeat=3)) / number
+        decode_time = min(timeit.repeat(lambda: codec.loads(body), number=number, repeat=3)) / number
+        results.append(
+            f'{codec.name}: encode {len(body) / encode_time / 1e6:.0f}MB/s, decode {len(body) / decode_time / 1e6:.0f}MB/s'
+        )
+    print(f'\nJoined payload of {len(body) / 1024:.0f}KB: ' + ', '.join(results))
@@ -0,0 +1,165 @@
+import os
+import timeit
+
+import httpretty
+import pytest
+from django.core.cache import cache
+
+import factories
+from core.tests.fixtures import auth_api_client, logic_module
+from gateway.metrics import (
+    SAMPLES_KEY, WORKERS_KEY, MetricsRegistry, gateway_request_duration, gateway_requests,
+    upstream_request_duration,
+)
+from gateway.registry import logic_module_registry
+from .fixtures import datamesh
+
+CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def metrics_enabled(settings):
+    settings.GATEWAY_METRICS_ENABLED = True
+    settings.GATEWAY_METRICS_TOKEN = ''
+
+
+def test_render_counter_and_histogram(metrics_enabled):
+    registry = MetricsRegistry()
+    registry.worker = 'test-render'
+    counter = registry.counter('requests_total', 'Requests', ('service', 'status'))
+    histogram = registry.histogram('duration_seconds', 'Duration', ('service',), buckets=(0.1, 1))
+
+    counter.inc('crm', 200)
+    counter.inc('crm', 200)
+    counter.inc('say "hi"\n', 500, value=3)
+    histogram.observe(0.05, 'crm')
+    histogram.observe(0.5, 'crm')
+    histogram.observe(5, 'crm')
+
+    assert registry.render().splitlines() == [
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{service="crm",status="200"} 2.0',
+        'requests_total{service="say \\"hi\\"\\n",status="500"} 3.0',
+        '# HELP duration_seconds Duration',
+        '# TYPE duration_seconds histogram',
+        'duration_seconds_bucket{service="crm",le="0.1"} 1.0',
+        'duration_seconds_bucket{service="crm",le="1.0"} 2.0',
+        'duration_seconds_bucket{service="crm",le="+Inf"} 3.0',
+        'duration_seconds_sum{service="crm"} 5.55',
+        'duration_seconds_count{service="crm"} 3.0',
+    ]
+    registry.clear()
+
+
+def test_samples_of_workers_are_added_up(metrics_enabled, settings):
+    settings.GATEWAY_METRICS_PUSH_INTERVAL = 60
+    registry = MetricsRegistry()
+    registry.worker = 'test-worker-1'
+    counter = registry.counter('requests_total', 'Requests', ('service',))
+    counter.inc('crm')
+
+    # another worker pushed its samples before
+    cache.set(SAMPLES_KEY.format(worker='test-worker-2'), {'requests_total': {('crm',): [2], ('hr',): [1]}})
+    cache.set(WORKERS_KEY, (cache.get(WORKERS_KEY) or []) + ['test-worker-2'])
+
+    # recorded after the last push, collecting pushes the samples of this worker first
+    counter.inc('crm')
+    assert registry.collect() == {'requests_total': {('crm',): [4], ('hr',): [1]}}
+
+    registry.clear()
+    cache.delete_many([WORKERS_KEY, SAMPLES_KEY.format(worker='test-worker-2')])
+
+
+def test_disabled_metrics_record_nothing(settings):
+    settings.GATEWAY_METRICS_ENABLED = False
+    registry = MetricsRegistry()
+    counter = registry.counter('requests_total', 'Requests', ('service',))
+    histogram = registry.histogram('duration_seconds', 'Duration', ('service',))
+
+    counter.inc('crm')
+    histogram.observe(0.1, 'crm')
+
+    assert counter.get_samples() == {}
+    assert histogram.get_samples() == {}
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_metrics_of_joined_request(auth_api_client, datamesh, metrics_enabled):
+    lm1, lm2, relationship = datamesh
+    factories.JoinRecord(
+        relationship=relationship,
+        record_id=None,
+        record_uuid='19a7f600-74a0-4123-9be5-dfa69aa172cc',
+        related_record_id=1,
+        related_record_uuid=None,
+    )
+    for logic_module, swagger, path, data in (
+        (lm1, 'swagger_location.json', 'siteprofiles/19a7f600-74a0-4123-9be5-dfa69aa172cc/', 'data_detail_siteprofile.json'),
+        (lm2, 'swagger_documents.json', 'documents/1/', 'data_detail_document.json'),
+    ):
+        for url, fixture in ((f'{logic_module.endpoint}/docs/swagger.json', swagger), (f'{logic_module.endpoint}/{path}', data)):
+            with open(os.path.join(CURRENT_PATH, 'fixtures', fixture)) as r:
+                httpretty.register_uri(
+                    httpretty.GET, url, body=r.read(), adding_headers={'Content-Type': 'application/json'}
+                )
+
+    response = auth_api_client.get(f'/{lm1.endpoint_name}/siteprofiles/19a7f600-74a0-4123-9be5-dfa69aa172cc/', {'join': 'true'})
+    assert response.status_code == 200
+
+    response = auth_api_client.get('/metrics/')
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+    lines = response.content.decode().splitlines()
+    assert 'gateway_requests_total{service="location",model="siteprofiles",method="GET",status="200"} 1.0' in lines
+    assert 'gateway_request_duration_seconds_count{service="location",method="GET"} 1.0' in lines
+    assert 'gateway_upstream_request_duration_seconds_count{service="location"} 1.0' in lines
+    assert 'gateway_upstream_request_duration_seconds_count{service="documents"} 1.0' in lines
+    assert 'datamesh_join_record_queries_total{relationship="documents"} 1.0' in lines
+    assert 'datamesh_related_fetches_total{relationship="documents"} 1.0' in lines
+    assert not any(line.startswith('gateway_upstream_errors_total{') for line in lines)
+
+
+@pytest.mark.django_db()
+def test_metrics_labels_of_unknown_services(client, logic_module, metrics_enabled):
+    logic_module_registry.get(logic_module.endpoint_name)
+    for i in range(5):
+        assert client.get(f'/service{i}/model{i}/').status_code == 401
+        assert client.get(f'/{logic_module.endpoint_name}/model{i}/').status_code == 401
+
+    # the URL can't create label series
+    assert gateway_requests.get_samples() == {
+        ('unknown', 'unknown', 'GET', '401'): [5.0],
+        (logic_module.endpoint_name, 'unknown', 'GET', '401'): [5.0],
+    }
+    assert set(gateway_request_duration.get_samples()) == {
+        ('unknown', 'GET'), (logic_module.endpoint_name, 'GET'),
+    }
+
+
+@pytest.mark.django_db()
+def test_metrics_endpoint_access(client, settings):
+    settings.GATEWAY_METRICS_ENABLED = False
+    assert client.get('/metrics/').status_code == 404
+
+    settings.GATEWAY_METRICS_ENABLED = True
+    settings.GATEWAY_METRICS_TOKEN = 'secret'
+    assert client.get('/metrics/').status_code == 401
+    assert client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code == 401
+    assert client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret').status_code == 200
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('enabled', [False, True])
+def test_benchmark_recording_metrics(settings, enabled):
+    settings.GATEWAY_METRICS_ENABLED = enabled
+    settings.GATEWAY_METRICS_PUSH_INTERVAL = 60
+    number = 100000
+
+    def record():
+        gateway_requests.inc('crm', 'contact', 'GET', 200)
+        upstream_request_duration.observe(0.042, 'crm')
+
+    elapsed = min(timeit.repeat(record, number=number, repeat=3)) / number
+    print(f'\nRecording a request with metrics {"enabled" if enabled else "disabled"}: {elapsed * 1e9:.0f}ns')
@@ -0,0 +1,170 @@
+import asyncio
+import io
+import os
+import tracemalloc
+from unittest.mock import patch
+
+import httpretty
+import pytest
+import requests
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.files.uploadhandler import MemoryFileUploadHandler
+from django.http.multipartparser import MultiPartParser
+
+from core.tests.fixtures import auth_api_client, logic_module
+from gateway.multipart import MultipartStream
+from .utils import AiohttpResponseMock, create_aiohttp_session_mock
+
+CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_multipart(body: bytes, content_type: str):
+    meta = {'CONTENT_TYPE': content_type, 'CONTENT_LENGTH': str(len(body))}
+    return MultiPartParser(meta, io.BytesIO(body), [MemoryFileUploadHandler()], 'utf-8').parse()
+
+
+def make_temporary_file(size: int) -> TemporaryUploadedFile:
+    file = TemporaryUploadedFile('large.bin', 'application/octet-stream', size, None)
+    chunk = b'x' * 1024 * 1024
+    for _ in range(size // len(chunk)):
+        file.write(chunk)
+    file.write(b'x' * (size % len(chunk)))
+    file.flush()
+    return file
+
+
+async def read_async(stream: MultipartStream) -> bytes:
+    return b''.join([chunk async for chunk in stream])
+
+
+def test_multipart_stream():
+    stream = MultipartStream(
+        fields=[('file_name', 'report "final"'), ('tag', 'a'), ('tag', 'b')],
+        files=[
+            ('file', SimpleUploadedFile('report.pdf', b'%PDF' * 100, 'application/pdf')),
+            ('file', SimpleUploadedFile('notes.txt', b'notes', 'text/plain')),
+            ('thumbnail', SimpleUploadedFile('thumb.png', b'\x89PNG', 'image/png')),
+        ],
+    )
+    body = b''.join(stream)
+    assert len(stream) == len(body)
+    assert b''.join(stream) == body
+    assert asyncio.run(read_async(stream)) == body
+
+    data, files = parse_multipart(body, stream.headers['Content-Type'])
+    assert data.getlist('tag') == ['a', 'b']
+    assert data['file_name'] == 'report "final"'
+    assert [file.name for file in files.getlist('file')] == ['report.pdf', 'notes.txt']
+    assert files.getlist('file')[0].read() == b'%PDF' * 100
+    assert files['thumbnail'].content_type == 'image/png'
+
+
+@pytest.mark.parametrize('asynchronous', [False, True])
+def test_multipart_stream_memory(settings, asynchronous):
+    settings.GATEWAY_STREAMING_CHUNK_SIZE = 64 * 1024
+    size = 4 * 1024 * 1024
+    with make_temporary_file(size) as file:
+        stream = MultipartStream(fields=[('name', 'large')], files=[('file', file)])
+
+        tracemalloc.start()
+        if asynchronous:
+            async def consume():
+                return sum([len(chunk) async for chunk in stream])
+            length = asyncio.run(consume())
+        else:
+            length = sum(len(chunk) for chunk in stream)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    # the file is never held in memory as a whole
+    assert length == len(stream) > size
+    assert peak < 1024 * 1024
+
+
+def test_multipart_stream_is_sent_with_content_length():
+    stream = MultipartStream(fields=[], files=[('file', SimpleUploadedFile('a.txt', b'a'))])
+    prepared = requests.Request('POST', 'http://service/documents/', data=stream, headers=stream.headers).prepare()
+    assert prepared.body is stream
+    assert prepared.headers['Content-Length'] == str(len(stream))
+    assert 'Transfer-Encoding' not in prepared.headers
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+@patch('gateway.clients.send_request')
+def test_upload_forwarding(send_request_mock, auth_api_client, logic_module):
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        httpretty.register_uri(
+            httpretty.GET, f'{logic_module.endpoint}/docs/swagger.json', body=r.read(),
+            adding_headers={'Content-Type': 'application/json'},
+        )
+    received = {}
+
+    def send_request(method, url, logic_module=None, **kwargs):
+        # read the streamed body like the service would
+        received['headers'] = kwargs['headers']
+        received['body'] = b''.join(kwargs['data'])
+        response = requests.Response()
+        response.status_code = 201
+        response.headers['Content-Type'] = 'application/json'
+        response.raw = io.BytesIO(b'{"id": 1}')
+        return response
+
+    send_request_mock.side_effect = send_request
+
+    response = auth_api_client.post(
+        f'/{logic_module.endpoint_name}/documents/',
+        {
+            'file_description': 'Yearly report',
+            'file': SimpleUploadedFile('report.pdf', b'%PDF-1.4', 'application/pdf'),
+            'thumbnail': SimpleUploadedFile('thumb.png', b'\x89PNG', 'image/png'),
+        },
+        format='multipart',
+    )
+    assert response.status_code == 201
+
+    assert received['headers']['Content-Length'] == str(len(received['body']))
+    data, files = parse_multipart(received['body'], received['headers']['Content-Type'])
+    assert data.dict() == {'file_description': 'Yearly report'}
+    assert files['file'].read() == b'%PDF-1.4'
+    assert files['thumbnail'].name == 'thumb.png'
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+@patch('gateway.clients.async_session_manager.get_session')
+def test_async_upload_forwarding(client_session_mock, auth_api_client, logic_module):
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json'), 'rb') as r:
+        swagger_body = r.read()
+    httpretty.register_uri(
+        httpretty.GET, f'{logic_module.endpoint}/docs/swagger.json', body=swagger_body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+    session = create_aiohttp_session_mock([
+        AiohttpResponseMock(
+            method='POST', url=f'{logic_module.endpoint}/documents/', status=201, body=b'{"id": 1}',
+            headers={'Content-Type': 'application/json'},
+        ),
+    ])
+    client_session_mock.return_value = session
+
+    response = auth_api_client.post(
+        f'/async/{logic_module.endpoint_name}/documents/',
+        {
+            'file_description': 'Yearly report',
+            'file': [
+                SimpleUploadedFile('report.pdf', b'%PDF-1.4', 'application/pdf'),
+                SimpleUploadedFile('annex.pdf', b'%PDF-1.5', 'application/pdf'),
+            ],
+            'thumbnail': SimpleUploadedFile('thumb.png', b'\x89PNG', 'image/png'),
+        },
+        format='multipart',
+    )
+    assert response.status_code == 201
+
+    (method, url, kwargs), = session.requests
+    assert kwargs['headers']['Content-Length'] == str(len(kwargs['data']))
+    data, files = parse_multipart(kwargs['data'], kwargs['headers']['Content-Type'])
+    assert data.dict() == {'file_description': 'Yearly report'}
+    assert [file.read() for file in files.getlist('file')] == [b'%PDF-1.4', b'%PDF-1.5']
+    assert files['thumbnail'].name == 'thumb.png'
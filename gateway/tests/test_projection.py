@@ -0,0 +1,189 @@
+import json
+import os
+from unittest.mock import patch
+
+import httpretty
+import pytest
+from django.http.request import QueryDict
+
+import factories
+from core.tests.fixtures import auth_api_client
+from gateway.projection import Projection, parse_paths
+from .fixtures import datamesh
+from .utils import AiohttpResponseMock, create_aiohttp_session_mock
+
+CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
+SITEPROFILE_UUID = '19a7f600-74a0-4123-9be5-dfa69aa172cc'
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(CURRENT_PATH, 'fixtures', name)) as r:
+        return r.read()
+
+
+def register_json_uri(url: str, body: str, **kwargs):
+    httpretty.register_uri(httpretty.GET, url, body=body, adding_headers={'Content-Type': 'application/json'}, **kwargs)
+
+
+def get_upstream_requests(path: str) -> list:
+    return [request for request in httpretty.latest_requests() if request.path.startswith(path)]
+
+
+@pytest.fixture
+def joined_siteprofile(datamesh):
+    lm1, lm2, relationship = datamesh
+    factories.JoinRecord(
+        relationship=relationship,
+        record_id=None,
+        record_uuid=SITEPROFILE_UUID,
+        related_record_id=1,
+        related_record_uuid=None,
+    )
+    return lm1, lm2
+
+
+def register_joined_mocks(lm1, lm2):
+    register_json_uri(f'{lm1.endpoint}/docs/swagger.json', read_fixture('swagger_location.json'))
+    register_json_uri(f'{lm2.endpoint}/docs/swagger.json', read_fixture('swagger_documents.json'))
+    register_json_uri(f'{lm1.endpoint}/siteprofiles/{SITEPROFILE_UUID}/', read_fixture('data_detail_siteprofile.json'))
+    register_json_uri(f'{lm2.endpoint}/documents/1/', read_fixture('data_detail_document.json'))
+
+
+def test_parse_paths():
+    assert parse_paths([]) is None
+    assert parse_paths(['', ' , ']) is None
+    assert parse_paths(['id, name', 'contacts.first_name,contacts.address.city']) == {
+        'id': None, 'name': None, 'contacts': {'first_name': None, 'address': {'city': None}},
+    }
+    # a field covers its nested fields, whatever the order
+    assert parse_paths(['contacts.first_name,contacts']) == {'contacts': None}
+    assert parse_paths(['contacts,contacts.first_name']) == {'contacts': None}
+
+
+def test_projection_apply():
+    data = {
+        'count': 2,
+        'results': [
+            {'id': 1, 'name': 'a', 'notes': 'x', 'contacts': [{'first_name': 'b', 'notes': 'y', 'email': 'z'}]},
+            {'id': 2, 'name': 'c', 'notes': 'x', 'contacts': []},
+        ],
+    }
+    projection = Projection.from_query_params(QueryDict('fields=id,contacts&exclude=contacts.notes'))
+    projection.apply(data)
+    assert data == {
+        'count': 2,
+        'results': [
+            {'id': 1, 'contacts': [{'first_name': 'b', 'email': 'z'}]},
+            {'id': 2, 'contacts': []},
+        ],
+    }
+
+    item = {'id': 1, 'name': 'a', 'contacts': [{'first_name': 'b', 'email': 'z'}]}
+    Projection.from_query_params(QueryDict('exclude=id,contacts.email')).apply(item, keep=('id',))
+    assert item == {'id': 1, 'name': 'a', 'contacts': [{'first_name': 'b'}]}
+
+
+def test_projection_includes_and_upstream_params():
+    assert Projection.from_query_params(QueryDict('join=true')) is None
+
+    projection = Projection.from_query_params(QueryDict('fields=id,name,contacts.first_name&exclude=notes'))
+    assert projection.includes('contacts')
+    assert not projection.includes('documents')
+    assert projection.get_upstream_params({'fields', 'exclude'}) == ({'fields': 'id,name,contacts', 'exclude': 'notes'}, False)
+    assert projection.get_upstream_params({'fields'}) == ({'fields': 'id,name,contacts'}, False)
+
+    projection = Projection.from_query_params(QueryDict('fields=id,name&exclude=documents'))
+    assert not projection.includes('documents')
+    assert projection.get_upstream_params({'fields', 'exclude'}) == ({'fields': 'id,name', 'exclude': 'documents'}, True)
+    assert projection.get_upstream_params(set()) == ({}, False)
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_projection_of_service_response(auth_api_client, datamesh):
+    lm1, _, _ = datamesh
+    register_json_uri(f'{lm1.endpoint}/docs/swagger.json', read_fixture('swagger_location.json'))
+    register_json_uri(f'{lm1.endpoint}/siteprofiles/', read_fixture('data_list_siteprofile.json'))
+
+    response = auth_api_client.get(f'/{lm1.endpoint_name}/siteprofiles/', {'fields': 'siteprofiles_uuid,country'})
+    assert response.status_code == 200
+    data = response.json()
+    assert data['count'] == 2002
+    assert all(set(item) == {'siteprofiles_uuid', 'country'} for item in data['results'])
+
+    # the service doesn't advertise the projection, so it isn't forwarded
+    upstream_request, = get_upstream_requests('/siteprofiles/')
+    assert 'fields' not in upstream_request.querystring
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_projection_is_forwarded_to_supporting_service(auth_api_client, datamesh):
+    lm1, _, _ = datamesh
+    spec = json.loads(read_fixture('swagger_location.json'))
+    spec['paths']['/siteprofiles/']['get']['parameters'].append(
+        {'name': 'fields', 'in': 'query', 'required': False, 'type': 'string'}
+    )
+    register_json_uri(f'{lm1.endpoint}/docs/swagger.json', json.dumps(spec))
+    # the service applies the projection itself, its response is passed through
+    body = '{"count": 1, "results": [{"siteprofiles_uuid": "1", "country": "ES"}]}'
+    register_json_uri(f'{lm1.endpoint}/siteprofiles/', body)
+
+    response = auth_api_client.get(f'/{lm1.endpoint_name}/siteprofiles/', {'fields': 'siteprofiles_uuid,country'})
+    assert response.status_code == 200
+    assert response.content == body.encode()
+
+    upstream_request, = get_upstream_requests('/siteprofiles/')
+    assert upstream_request.querystring['fields'] == ['siteprofiles_uuid,country']
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_projection_skips_joins_not_requested(auth_api_client, joined_siteprofile):
+    lm1, lm2 = joined_siteprofile
+    register_joined_mocks(lm1, lm2)
+    url = f'/{lm1.endpoint_name}/siteprofiles/{SITEPROFILE_UUID}/'
+
+    response = auth_api_client.get(url, {'join': 'true', 'fields': 'country,documents.file_name'})
+    assert response.status_code == 200
+    assert response.json() == {'country': 'ES', 'documents': [{'file_name': 'test.jpg'}]}
+
+    response = auth_api_client.get(url, {'join': 'true', 'fields': 'country'})
+    assert response.status_code == 200
+    assert response.json() == {'country': 'ES'}
+    # only the first request fetched the related document
+    assert len(get_upstream_requests('/documents/1/')) == 1
+
+    response = auth_api_client.get(url, {'join': 'true', 'exclude': 'documents'})
+    assert response.status_code == 200
+    assert 'documents' not in response.json()
+    assert response.json()['siteprofiles_uuid'] == SITEPROFILE_UUID
+    assert len(get_upstream_requests('/documents/1/')) == 1
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+@patch('gateway.clients.async_session_manager.get_session')
+def test_async_projection_of_joined_response(client_session_mock, auth_api_client, joined_siteprofile):
+    lm1, lm2 = joined_siteprofile
+    register_joined_mocks(lm1, lm2)
+    session = create_aiohttp_session_mock([
+        AiohttpResponseMock(
+            method='GET', url=f'{lm1.endpoint}/siteprofiles/{SITEPROFILE_UUID}/', status=200,
+            body=read_fixture('data_detail_siteprofile.json').encode(), headers={'Content-Type': 'application/json'},
+        ),
+        AiohttpResponseMock(
+            method='GET', url=f'{lm2.endpoint}/documents/1/', status=200,
+            body=read_fixture('data_detail_document.json').encode(), headers={'Content-Type': 'application/json'},
+        ),
+    ])
+    client_session_mock.return_value = session
+    url = f'/async/{lm1.endpoint_name}/siteprofiles/{SITEPROFILE_UUID}/'
+
+    response = auth_api_client.get(url, {'join': 'true', 'fields': 'country,documents.file_name,documents.file_type'})
+    assert response.status_code == 200
+    assert response.json() == {'country': 'ES', 'documents': [{'file_name': 'test.jpg', 'file_type': 'jpg'}]}
+
+    response = auth_api_client.get(url, {'join': 'true', 'fields': 'country'})
+    assert response.json() == {'country': 'ES'}
+    assert [url for _, url, _ in session.requests].count(f'{lm2.endpoint}/documents/1/') == 1
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+from django.core.cache import cache
+from rest_framework.request import Request
+
+import factories
+from core.models import LogicModule
+from core.tests.fixtures import logic_module, org, org_member
+from gateway.permissions import AllowLogicModuleGroup
+from gateway.registry import VERSION_KEY, logic_module_registry
+
+
+@pytest.fixture(autouse=True)
+def check_every_time(settings):
+    settings.GATEWAY_LOGIC_MODULE_REGISTRY_CHECK_INTERVAL = 0
+    cache.delete(VERSION_KEY)
+
+
+@pytest.mark.django_db()
+def test_registry_resolves_services_without_queries(logic_module, django_assert_num_queries):
+    assert logic_module_registry.get('documents') == logic_module
+
+    with django_assert_num_queries(0):
+        assert logic_module_registry.get('documents') == logic_module
+        assert logic_module_registry.get('unknown') is None
+
+
+@pytest.mark.django_db()
+def test_registry_is_invalidated_by_signals(logic_module):
+    assert logic_module_registry.get('documents').name == 'documents'
+
+    logic_module.name = 'Documents'
+    logic_module.save()
+    assert logic_module_registry.get('documents').name == 'Documents'
+
+    group = factories.CoreGroup(organization=None, is_global=True)
+    logic_module.core_groups.add(group)
+    assert list(logic_module_registry.get('documents').core_groups.all()) == [group]
+
+    logic_module.delete()
+    assert logic_module_registry.get('documents') is None
+
+
+@pytest.mark.django_db()
+def test_registry_reloads_on_version_change_of_other_worker(logic_module, settings):
+    settings.GATEWAY_LOGIC_MODULE_REGISTRY_CHECK_INTERVAL = 60
+    assert logic_module_registry.get('documents').name == 'documents'
+
+    # another worker changed the logic module and replaced the version stamp
+    LogicModule.objects.filter(pk=logic_module.pk).update(name='Documents')
+    cache.set(VERSION_KEY, 'other-worker', None)
+
+    # the stamp is only checked after the interval
+    assert logic_module_registry.get('documents').name == 'documents'
+    settings.GATEWAY_LOGIC_MODULE_REGISTRY_CHECK_INTERVAL = 0
+    assert logic_module_registry.get('documents').name == 'Documents'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_registry_aget(logic_module):
+    assert asyncio.run(logic_module_registry.aget('documents')) == logic_module
+
+
+@pytest.mark.django_db()
+def test_permission_check_without_queries(rf, logic_module, org, org_member, django_assert_num_queries):
+    group = factories.CoreGroup(organization=org, is_org_level=True, permissions=4)
+    logic_module.core_groups.add(group)
+    request = Request(rf.get('/documents/documents/'))
+    request.user = org_member
+    view = type('View', (), {'kwargs': {'service': 'documents'}})()
+    permission = AllowLogicModuleGroup()
+    assert permission.has_permission(request, view)
+
+    with django_assert_num_queries(0):
+        assert permission.has_permission(request, view)
+
+    request = Request(rf.delete('/documents/documents/1/'))
+    request.user = org_member
+    assert not permission.has_permission(request, view)
+
+
+@pytest.mark.django_db()
+def test_permissions_are_recomputed_when_groups_change(logic_module, org):
+    group = factories.CoreGroup(organization=org, is_org_level=True, permissions=4)
+    logic_module.core_groups.add(group)
+    other_group = factories.CoreGroup(organization=factories.Organization(name='Other'), is_org_level=True)
+    logic_module.core_groups.add(other_group)
+
+    assert logic_module_registry.get_permissions('documents', org.pk) == 0b0100
+    # no group applies to users without organization
+    assert logic_module_registry.get_permissions('documents', None) == 0b1111
+    assert logic_module_registry.get_permissions('unknown', org.pk) is None
+
+    group.permissions = 15
+    group.save()
+    assert logic_module_registry.get_permissions('documents', org.pk) == 0b1111
+
+    logic_module.core_groups.remove(group, other_group)
+    assert logic_module_registry.get_permissions('documents', org.pk) == 0b1111
@@ -0,0 +1,170 @@
+import asyncio
+import contextlib
+from unittest.mock import patch
+
+import pytest
+import httpretty
+import requests
+
+import factories
+from gateway import exceptions
+from gateway.breakers import circuit_breakers
+from gateway.retries import NO_RETRIES, RetryPolicy, retry_budget
+from gateway.upstream import send_async_request, send_request
+from .utils import AiohttpResponseMock, AiohttpSessionMock, _ResponseContextManager
+
+
+@pytest.fixture()
+def retried_logic_module():
+    return factories.LogicModule.create(
+        name='documents',
+        endpoint_name='documents',
+        endpoint='http://documentservice:8080',
+        max_retries=2,
+        retry_backoff=0.01,
+    )
+
+
+@pytest.fixture()
+def no_sleep():
+    with patch('gateway.upstream.time.sleep') as sleep_mock:
+        yield sleep_mock
+
+
+class SequenceSessionMock(AiohttpSessionMock):
+    """ Answers the requests with the response mocks in turn """
+
+    def request(self, method, url, *args, **kwargs):
+        self.requests.append((method, url, kwargs))
+        return _ResponseContextManager(self._response_mocks[len(self.requests) - 1])
+
+
+def test_retry_policy_falls_back_to_settings(settings):
+    settings.GATEWAY_UPSTREAM_MAX_RETRIES = 3
+    settings.GATEWAY_UPSTREAM_RETRY_BACKOFF = 0.5
+    logic_module = factories.LogicModule.build(max_retries=0)
+
+    assert RetryPolicy.from_logic_module(logic_module).max_retries == 0
+    assert RetryPolicy.from_logic_module(logic_module).backoff == 0.5
+    assert RetryPolicy.from_logic_module(None).max_retries == 3
+
+
+def test_retry_policy_backoff_is_jittered_and_capped():
+    policy = RetryPolicy(max_retries=5, backoff=0.1, backoff_max=0.3)
+
+    for attempt in range(5):
+        assert 0 <= policy.get_backoff(attempt) <= min(0.3, 0.1 * 2 ** attempt)
+    assert policy.get_max_retries('get') == 5
+    assert policy.get_max_retries('post') == 0
+    assert policy.get_max_retries('put', has_body_stream=True) == 0
+
+
+def test_retry_budget_limits_retries(settings):
+    settings.GATEWAY_RETRY_BUDGET_MIN_RETRIES = 1
+    settings.GATEWAY_RETRY_BUDGET_RATIO = 0.5
+    for _ in range(4):
+        retry_budget.record_request()
+
+    # one retry plus half of the four requests
+    assert [retry_budget.can_retry() for _ in range(4)] == [True, True, True, False]
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_send_request_retries_idempotent_request(retried_logic_module, no_sleep):
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{retried_logic_module.endpoint}/documents/',
+        responses=[
+            httpretty.Response(body='', status=503),
+            httpretty.Response(body='[]', status=200),
+        ],
+    )
+
+    response = send_request('get', f'{retried_logic_module.endpoint}/documents/', retried_logic_module)
+
+    assert response.status_code == 200
+    assert len(httpretty.latest_requests()) == 2
+    assert 0 <= no_sleep.call_args[0][0] <= 0.01
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_send_request_gives_up_after_max_retries(retried_logic_module, no_sleep):
+    httpretty.register_uri(httpretty.GET, f'{retried_logic_module.endpoint}/documents/', body='', status=504)
+
+    response = send_request('get', f'{retried_logic_module.endpoint}/documents/', retried_logic_module)
+
+    assert response.status_code == 504
+    assert len(httpretty.latest_requests()) == 3
+    assert retry_budget.get_stats() == {'requests': 1, 'retries': 2}
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_send_request_does_not_retry_post(retried_logic_module, no_sleep):
+    httpretty.register_uri(httpretty.POST, f'{retried_logic_module.endpoint}/documents/', body='', status=503)
+
+    response = send_request('post', f'{retried_logic_module.endpoint}/documents/', retried_logic_module)
+
+    assert response.status_code == 503
+    assert len(httpretty.latest_requests()) == 1
+    no_sleep.assert_not_called()
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_send_request_stops_retrying_when_circuit_opens(retried_logic_module, no_sleep, settings):
+    settings.GATEWAY_CIRCUIT_BREAKER_MIN_REQUESTS = 2
+    httpretty.register_uri(httpretty.GET, f'{retried_logic_module.endpoint}/documents/', body='', status=503)
+
+    response = send_request('get', f'{retried_logic_module.endpoint}/documents/', retried_logic_module)
+
+    assert response.status_code == 503
+    assert len(httpretty.latest_requests()) == 2
+    assert circuit_breakers.is_open(retried_logic_module)
+    with pytest.raises(exceptions.ServiceUnavailable):
+        send_request('get', f'{retried_logic_module.endpoint}/documents/', retried_logic_module)
+
+
+@httpretty.activate
+def test_send_request_to_gateway_is_not_retried_or_guarded(no_sleep, settings):
+    settings.GATEWAY_CIRCUIT_BREAKER_MIN_REQUESTS = 2
+    url = 'http://gateway:8080/documents/documents/1/'
+    httpretty.register_uri(httpretty.GET, url, body='', status=503)
+
+    for _ in range(5):
+        response = send_request('get', url, retry_policy=NO_RETRIES, guarded=False)
+        assert response.status_code == 503
+
+    # the gateway request retried the service already, one failing service doesn't open the gateway's circuit
+    assert len(httpretty.latest_requests()) == 5
+    assert circuit_breakers.get_stats() == {}
+    no_sleep.assert_not_called()
+
+
+@pytest.mark.django_db()
+def test_send_request_retries_connection_errors(retried_logic_module, no_sleep):
+    with patch('requests.Session.request', side_effect=requests.ConnectionError('refused')) as request_mock:
+        with pytest.raises(requests.ConnectionError):
+            send_request('delete', f'{retried_logic_module.endpoint}/documents/1/', retried_logic_module)
+
+    assert request_mock.call_count == 3
+
+
+@pytest.mark.django_db()
+def test_send_async_request_retries_idempotent_request(retried_logic_module):
+    url = f'{retried_logic_module.endpoint}/documents/'
+    session_mock = SequenceSessionMock([
+        AiohttpResponseMock(method='GET', url=url, status=502, body=b''),
+        AiohttpResponseMock(method='GET', url=url, status=200, body=b'[]'),
+    ])
+
+    async def request_documents():
+        async with contextlib.AsyncExitStack() as response_context:
+            response = await send_async_request(response_context, session_mock, 'get', url, retried_logic_module)
+            return response.status, await response.read()
+
+    assert asyncio.run(request_documents()) == (200, b'[]')
+
+    assert len(session_mock.requests) == 2
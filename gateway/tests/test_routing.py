@@ -0,0 +1,116 @@
+import os
+import json
+import timeit
+
+import pytest
+from bravado_core.spec import Spec
+
+from gateway.routing import RouteTable, get_route_table
+from gateway.specs import SWAGGER_CONFIG
+
+CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(scope='module')
+def documents_spec():
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        return Spec.from_dict(json.load(r), config=SWAGGER_CONFIG)
+
+
+def make_spec_with_models(models_count: int) -> Spec:
+    """ Build a spec with list and detail paths for a number of models """
+    paths = {}
+    operation = {'responses': {'200': {'description': ''}}, 'parameters': []}
+    for i in range(models_count):
+        model = f'model{i}'
+        paths[f'/{model}/'] = {
+            'get': {**operation, 'operationId': f'{model}_list'},
+            'post': {**operation, 'operationId': f'{model}_create'},
+        }
+        paths[f'/{model}/{{{model}_uuid}}/'] = {
+            'get': {**operation, 'operationId': f'{model}_read'},
+            'put': {**operation, 'operationId': f'{model}_update'},
+            'patch': {**operation, 'operationId': f'{model}_partial_update'},
+            'delete': {**operation, 'operationId': f'{model}_delete'},
+        }
+    spec_dict = {
+        'swagger': '2.0',
+        'info': {'title': 'Benchmark', 'version': '1.0'},
+        'host': 'benchmark:8080',
+        'schemes': ['http'],
+        'basePath': '/',
+        'paths': paths,
+    }
+    return Spec.from_dict(spec_dict, config=SWAGGER_CONFIG)
+
+
+def test_route_table_list_and_detail(documents_spec):
+    route_table = RouteTable(documents_spec)
+
+    route = route_table.get_route('GET', 'documents')
+    assert route.http_method == 'get'
+    assert route.build_url() == 'http://documentservice:8080/documents/'
+
+    route = route_table.get_route('PUT', 'documents', 'id')
+    assert route.http_method == 'put'
+    assert route.build_url('12') == 'http://documentservice:8080/documents/12/'
+
+
+def test_route_table_unknown_operation(documents_spec):
+    route_table = RouteTable(documents_spec)
+
+    assert route_table.get_route('GET', 'nowhere') is None
+    assert route_table.get_route('GET', 'documents', 'uuid') is None
+    assert route_table.get_route('POST', 'thumbnail', 'id') is None
+
+
+def test_route_table_options_fallback(documents_spec):
+    route_table = RouteTable(documents_spec)
+
+    route = route_table.get_route('OPTIONS', 'thumbnail', 'id')
+    assert route.http_method == 'options'
+    assert route.build_url('1') == 'http://documentservice:8080/thumbnail/1/'
+    # the GET route is left untouched
+    assert route_table.get_route('GET', 'thumbnail', 'id').http_method == 'get'
+
+
+def test_route_table_is_built_once_per_spec(documents_spec):
+    assert get_route_table(documents_spec) is get_route_table(documents_spec)
+
+
+def get_lookups(spec: Spec, pk: str):
+    """ URL of a model's detail operation looked up with bravado and with the route table """
+    route_table = get_route_table(spec)
+
+    def bravado_lookup():
+        path_parameter_name = 'model15_uuid'
+        operation = spec.get_op_for_request('GET', f'/model15/{{{path_parameter_name}}}/')
+        url = spec.api_url.rstrip('/') + operation.path_name
+        return url.replace(f'{{{path_parameter_name}}}', pk)
+
+    def route_table_lookup():
+        return route_table.get_route('GET', 'model15', 'uuid').build_url(pk)
+
+    return bravado_lookup, route_table_lookup
+
+
+def test_route_table_matches_bravado_lookup():
+    spec = make_spec_with_models(20)
+    assert len(get_route_table(spec)) == 20 * 6
+
+    bravado_lookup, route_table_lookup = get_lookups(spec, '39da9369-838e-4750-91a5-f7805cd82839')
+    assert bravado_lookup() == route_table_lookup()
+
+
+@pytest.mark.benchmark
+def test_benchmark_route_table_vs_bravado_lookup():
+    spec = make_spec_with_models(300)
+    bravado_lookup, route_table_lookup = get_lookups(spec, '39da9369-838e-4750-91a5-f7805cd82839')
+
+    number = 20000
+    bravado_time = min(timeit.repeat(bravado_lookup, number=number, repeat=3)) / number
+    route_table_time = min(timeit.repeat(route_table_lookup, number=number, repeat=3)) / number
+    print(
+        f'\nRouting on a spec with {len(get_route_table(spec))} operations: '
+        f'bravado {bravado_time * 1e6:.2f}us, route table {route_table_time * 1e6:.2f}us per request'
+    )
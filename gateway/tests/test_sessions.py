@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+import httpretty
+from asgiref.sync import async_to_sync
+
+from core.tests.fixtures import logic_module
+from gateway.sessions import AsyncSessionManager, SessionRegistry, UpstreamPoolConfig
+
+
+@pytest.mark.django_db()
+def test_pool_config_defaults_to_settings(logic_module, settings):
+    settings.GATEWAY_UPSTREAM_POOL_SIZE = 7
+    settings.GATEWAY_UPSTREAM_CONNECT_TIMEOUT = 2
+    settings.GATEWAY_UPSTREAM_READ_TIMEOUT = 20
+
+    config = UpstreamPoolConfig.from_logic_module(logic_module)
+    assert config == UpstreamPoolConfig(pool_size=7, keep_alive=True, connect_timeout=2, read_timeout=20)
+
+    logic_module.pool_size = 3
+    logic_module.read_timeout = 1.5
+    config = UpstreamPoolConfig.from_logic_module(logic_module)
+    assert config.pool_size == 3
+    assert config.timeout == (2, 1.5)
+
+
+@pytest.mark.django_db()
+def test_session_is_shared_per_logic_module(logic_module):
+    registry = SessionRegistry()
+
+    pool = registry.get_pool(logic_module, f'{logic_module.endpoint}/documents/')
+    assert registry.get_pool(logic_module, f'{logic_module.endpoint}/thumbnail/1/') is pool
+    # requests without logic module reuse the session of the URL's origin
+    assert registry.get_pool(url=f'{logic_module.endpoint}/documents/') is pool
+
+    # changed configuration of the logic module recreates the session
+    logic_module.pool_size = 2
+    new_pool = registry.get_pool(logic_module, f'{logic_module.endpoint}/documents/')
+    assert new_pool is not pool
+    assert new_pool.config.pool_size == 2
+
+
+@pytest.mark.django_db()
+def test_session_without_keep_alive(logic_module):
+    logic_module.keep_alive = False
+    pool = SessionRegistry().get_pool(logic_module)
+    assert pool.session.headers['Connection'] == 'close'
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_session_registry_stats(logic_module):
+    httpretty.register_uri(httpretty.GET, f'{logic_module.endpoint}/documents/', body='[]')
+    registry = SessionRegistry()
+    pool = registry.get_pool(logic_module)
+    pool.session.get(f'{logic_module.endpoint}/documents/')
+    pool.session.get(f'{logic_module.endpoint}/documents/')
+
+    stats = registry.get_stats()[logic_module.endpoint]
+    assert stats['requests'] == 2
+    assert stats['connections_opened'] == 1
+    assert stats['in_use'] == 0
+    assert stats['pool_size'] == pool.config.pool_size
+
+
+def test_async_session_is_shared_within_event_loop(settings):
+    settings.GATEWAY_ASYNC_CONNECTION_LIMIT_PER_HOST = 4
+    settings.GATEWAY_ASYNC_DNS_CACHE_TTL = 30
+    manager = AsyncSessionManager()
+
+    async def get_sessions():
+        session = manager.get_session()
+        assert session.connector.limit_per_host == 4
+        assert session.connector.use_dns_cache
+        same_session = await asyncio.gather(*[asyncio.sleep(0, manager.get_session()) for _ in range(10)])
+        assert all(s is session for s in same_session)
+        await manager.close()
+        assert session.closed
+        return session
+
+    session1 = asyncio.run(get_sessions())
+    session2 = asyncio.run(get_sessions())
+    assert session1 is not session2
+
+
+def test_async_session_close_all_after_loop_finished():
+    manager = AsyncSessionManager()
+
+    async def get_session():
+        return manager.get_session()
+
+    loop = asyncio.new_event_loop()
+    session = loop.run_until_complete(get_session())
+    manager.close_all()
+    assert session.closed
+
+    session = loop.run_until_complete(get_session())
+    loop.close()
+    manager.close_all()
+    assert session.closed
+
+
+def test_async_session_of_scope_is_closed():
+    manager = AsyncSessionManager()
+
+    async def request():
+        async with manager.scope():
+            session = manager.get_session()
+            # nested scopes and tasks of the request share its session
+            async with manager.scope():
+                assert manager.get_session() is session
+            assert await asyncio.ensure_future(asyncio.sleep(0, manager.get_session())) is session
+        return session
+
+    # every request under WSGI runs in an event loop of its own
+    sessions = [async_to_sync(request)() for _ in range(20)]
+    assert len(set(sessions)) == 20
+    assert all(session.closed for session in sessions)
+    assert manager._sessions == {}
+
+
+def test_async_session_is_shared_in_open_loop():
+    manager = AsyncSessionManager()
+
+    async def serve():
+        manager.open()
+        sessions = []
+        for _ in range(3):
+            async with manager.scope():
+                sessions.append(manager.get_session())
+        assert all(session is sessions[0] for session in sessions)
+        assert not sessions[0].closed
+        await manager.close()
+        assert sessions[0].closed
+
+    asyncio.run(serve())
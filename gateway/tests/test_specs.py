@@ -0,0 +1,125 @@
+import os
+import json
+import threading
+from unittest.mock import Mock, patch
+
+import pytest
+from django.core.cache import cache
+from django.utils import timezone
+
+from core.models import LogicModule
+from core.tests.fixtures import logic_module
+from gateway.models import SwaggerVersionHistory
+from gateway.specs import SPEC_FETCH_LOCK_PREFIX, SpecRegistry, get_spec_fingerprint, spec_registry
+
+CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def swagger_dict():
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        return json.load(r)
+
+
+def test_spec_fingerprint_ignores_key_order():
+    assert get_spec_fingerprint({'a': 1, 'b': 2}) == get_spec_fingerprint({'b': 2, 'a': 1})
+    assert get_spec_fingerprint({'a': 1}) != get_spec_fingerprint({'a': 2})
+
+
+@pytest.mark.django_db()
+@patch('gateway.specs.Spec.from_dict')
+def test_spec_is_compiled_once_per_worker(from_dict_mock, logic_module, swagger_dict):
+    logic_module.api_specification = swagger_dict
+    logic_module.save()
+    registry = SpecRegistry()
+
+    spec1 = registry.get_spec(LogicModule.objects.get(pk=logic_module.pk))
+    spec2 = registry.get_spec(LogicModule.objects.get(pk=logic_module.pk))
+
+    assert spec1 is spec2
+    assert from_dict_mock.call_count == 1
+
+
+@pytest.mark.django_db()
+@patch('gateway.specs.Spec.from_dict')
+def test_spec_is_recompiled_when_specification_changes(from_dict_mock, logic_module, swagger_dict):
+    logic_module.api_specification = swagger_dict
+    logic_module.save()
+    registry = SpecRegistry()
+    registry.get_spec(logic_module)
+
+    # another worker saved the module without changing the specification
+    LogicModule.objects.get(pk=logic_module.pk).save()
+    registry.get_spec(LogicModule.objects.get(pk=logic_module.pk))
+    assert from_dict_mock.call_count == 1
+
+    # another worker stored a new specification without notifying this one
+    swagger_dict['info']['version'] = '2.0'
+    LogicModule.objects.filter(pk=logic_module.pk).update(
+        api_specification=swagger_dict, edit_date=timezone.now()
+    )
+    registry.get_spec(LogicModule.objects.get(pk=logic_module.pk))
+    assert from_dict_mock.call_count == 2
+
+
+@pytest.mark.django_db()
+def test_spec_registry_invalidated_by_signals(logic_module, swagger_dict):
+    logic_module.api_specification = swagger_dict
+    logic_module.save()
+    spec_registry.get_spec(logic_module)
+    assert logic_module.pk in spec_registry._entries
+
+    logic_module.save()
+    assert logic_module.pk not in spec_registry._entries
+
+    spec_registry.get_spec(logic_module)
+    SwaggerVersionHistory.objects.create(
+        endpoint_name=logic_module.endpoint_name, old_version='latest', new_version='2.0'
+    )
+    assert logic_module.pk not in spec_registry._entries
+
+
+@pytest.mark.django_db(transaction=True)
+@patch('gateway.specs.utils.get_swagger_from_url')
+def test_spec_fetch_is_single_flight(get_swagger_mock, logic_module, swagger_dict):
+    started = threading.Event()
+
+    def slow_fetch(url):
+        started.set()
+        threading.Event().wait(0.2)
+        return Mock(json=Mock(return_value=swagger_dict))
+
+    get_swagger_mock.side_effect = slow_fetch
+    registry = SpecRegistry()
+    results = []
+
+    def get_spec():
+        results.append(registry.get_spec(LogicModule.objects.get(pk=logic_module.pk)))
+
+    expected_specification = json.loads(json.dumps(swagger_dict))
+    threads = [threading.Thread(target=get_spec) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert get_swagger_mock.call_count == 1
+    assert len(results) == 5
+    assert LogicModule.objects.get(pk=logic_module.pk).api_specification == expected_specification
+
+
+@pytest.mark.django_db()
+@patch('gateway.specs.SPEC_FETCH_POLL_INTERVAL', 0.01)
+@patch('gateway.specs.utils.get_swagger_from_url')
+def test_spec_fetch_keeps_lock_of_other_process(get_swagger_mock, logic_module, swagger_dict, settings):
+    settings.GATEWAY_SPEC_FETCH_LOCK_TIMEOUT = 0.05
+    get_swagger_mock.return_value = Mock(json=Mock(return_value=swagger_dict))
+    lock_key = f'{SPEC_FETCH_LOCK_PREFIX}{logic_module.pk}'
+    # another process holds the lock and doesn't store the specification in time
+    cache.set(lock_key, 'other-process', timeout=60)
+
+    SpecRegistry().get_spec(LogicModule.objects.get(pk=logic_module.pk))
+
+    assert get_swagger_mock.call_count == 1
+    assert cache.get(lock_key) == 'other-process'
+    cache.delete(lock_key)
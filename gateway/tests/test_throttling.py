@@ -0,0 +1,165 @@
+import os
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+import httpretty
+from django.core.cache import cache
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+import factories
+from core.tests.fixtures import org
+from gateway.throttling import GatewayRateThrottle, Rate, TokenBucket
+
+CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(autouse=True)
+def clear_buckets():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture()
+def throttled_logic_module():
+    return factories.LogicModule.create(
+        name='documents',
+        endpoint_name='documents',
+        endpoint='http://documentservice:8080',
+        user_throttle_rate='2/minute',
+        organization_throttle_rate='3/minute',
+    )
+
+
+def register_documents(logic_module):
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        swagger_body = r.read()
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{logic_module.endpoint}/docs/swagger.json',
+        body=swagger_body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{logic_module.endpoint}/documents/',
+        body='[]',
+        adding_headers={'Content-Type': 'application/json'},
+    )
+
+
+def make_client(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+def test_rate_parse():
+    assert Rate.parse('100/minute') == Rate(requests=100, period=60)
+    assert Rate.parse('5/s') == Rate(requests=5, period=1)
+    assert Rate.parse('') is None
+    assert Rate(requests=100, period=60).interval == 600
+
+
+def test_token_bucket_allows_burst_then_refills():
+    bucket = TokenBucket('documents:user:1', Rate(requests=3, period=60))
+
+    with patch('gateway.throttling.time.time', return_value=1000):
+        assert [bucket.consume() for _ in range(3)] == [0, 0, 0]
+        assert bucket.consume() == 20
+        # denied requests don't take tokens
+        assert bucket.consume() == 20
+
+    with patch('gateway.throttling.time.time', return_value=1020):
+        assert bucket.consume() == 0
+        assert bucket.consume() == 20
+
+    # an idle bucket is full again
+    with patch('gateway.throttling.time.time', return_value=2000):
+        assert [bucket.consume() for _ in range(3)] == [0, 0, 0]
+        assert bucket.consume() > 0
+
+
+
+def test_token_bucket_outlives_long_rate_period():
+    bucket = TokenBucket('documents:user:1', Rate.parse('2/day'))
+
+    # the cache expires keys by the same clock
+    with patch('time.time', return_value=1000):
+        assert [bucket.consume() for _ in range(2)] == [0, 0]
+        assert bucket.consume() > 0
+
+    # the bucket isn't dropped when the cache timeout of its creation is over
+    with patch('time.time', return_value=1000 + 2 * 60 * 60):
+        assert bucket.consume() > 0
+
+    with patch('time.time', return_value=1000 + 12 * 60 * 60):
+        assert bucket.consume() == 0
+        assert bucket.consume() > 0
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_make_service_request_throttles_user(org, throttled_logic_module):
+    register_documents(throttled_logic_module)
+    client = make_client(factories.CoreUser(organization=org))
+
+    responses = [client.get('/documents/documents/') for _ in range(3)]
+
+    assert [response.status_code for response in responses] == [200, 200, 429]
+    assert 0 < int(responses[-1]['Retry-After']) <= 30
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_make_service_request_throttles_organization(org, throttled_logic_module):
+    register_documents(throttled_logic_module)
+    first_client = make_client(factories.CoreUser(organization=org))
+    second_client = make_client(factories.CoreUser(organization=org))
+    other_org_client = make_client(factories.CoreUser(organization=factories.Organization(name='Other')))
+
+    statuses = [client.get('/documents/documents/').status_code for client in (first_client, first_client, second_client)]
+    assert statuses == [200, 200, 200]
+
+    # the organization used its requests, other organizations have their own
+    assert second_client.get('/documents/documents/').status_code == 429
+    assert other_org_client.get('/documents/documents/').status_code == 200
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_make_service_request_group_grants_higher_rate(org, throttled_logic_module):
+    throttled_logic_module.organization_throttle_rate = ''
+    throttled_logic_module.save()
+    register_documents(throttled_logic_module)
+    user = factories.CoreUser(organization=org)
+    user.core_groups.add(factories.CoreGroup(organization=org, throttle_rate='5/minute'))
+    client = make_client(user)
+
+    statuses = [client.get('/documents/documents/').status_code for _ in range(6)]
+
+    assert statuses == [200] * 5 + [429]
+
+
+@pytest.mark.django_db()
+def test_throttle_check_without_queries(rf, org, throttled_logic_module, django_assert_num_queries):
+    user = factories.CoreUser(organization=org)
+    request = Request(rf.get('/documents/documents/'))
+    request.user = user
+    view = SimpleNamespace(kwargs={'service': 'documents'})
+    GatewayRateThrottle().allow_request(request, view)
+
+    # no group has a rate
+    with django_assert_num_queries(0):
+        assert GatewayRateThrottle().allow_request(request, view)
+
+    group = factories.CoreGroup(organization=org, throttle_rate='5/minute')
+    user.core_groups.add(group)
+    assert GatewayRateThrottle.get_user_rate(user, throttled_logic_module) == Rate(requests=5, period=60)
+    # the rates of the user's groups are kept
+    with django_assert_num_queries(0):
+        assert GatewayRateThrottle.get_user_rate(user, throttled_logic_module) == Rate(requests=5, period=60)
+
+    user.core_groups.remove(group)
+    assert GatewayRateThrottle.get_user_rate(user, throttled_logic_module) == Rate(requests=2, period=60)
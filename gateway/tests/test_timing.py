@@ -0,0 +1,90 @@
+import logging
+import os
+import time
+
+import httpretty
+import pytest
+
+import factories
+from core.tests.fixtures import auth_api_client
+from gateway.timing import RequestTimer
+from .fixtures import datamesh
+
+CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def register_joined_request_mocks(lm1, lm2):
+    for logic_module, swagger, path, data in (
+        (lm1, 'swagger_location.json', 'siteprofiles/19a7f600-74a0-4123-9be5-dfa69aa172cc/', 'data_detail_siteprofile.json'),
+        (lm2, 'swagger_documents.json', 'documents/1/', 'data_detail_document.json'),
+    ):
+        for url, fixture in ((f'{logic_module.endpoint}/docs/swagger.json', swagger), (f'{logic_module.endpoint}/{path}', data)):
+            with open(os.path.join(CURRENT_PATH, 'fixtures', fixture)) as r:
+                httpretty.register_uri(
+                    httpretty.GET, url, body=r.read(), adding_headers={'Content-Type': 'application/json'}
+                )
+
+
+def test_request_timer_adds_up_phases():
+    timer = RequestTimer()
+    for _ in range(2):
+        with timer.phase('upstream'):
+            time.sleep(0.01)
+    with pytest.raises(ValueError):
+        with timer.phase('encode'):
+            raise ValueError()
+
+    assert timer.phases['upstream'] >= 0.02
+    assert set(timer.phases) == {'upstream', 'encode'}
+    names = [metric.split(';')[0] for metric in timer.get_server_timing().split(', ')]
+    assert names == ['upstream', 'encode', 'total']
+
+
+def test_slow_request_log(settings, caplog):
+    settings.GATEWAY_SLOW_REQUEST_THRESHOLD = 0.01
+    timer = RequestTimer()
+    with timer.phase('upstream'):
+        pass
+
+    with caplog.at_level(logging.WARNING, logger='gateway.timing'):
+        timer.log_if_slow('GET', '/crm/contact/', 200)
+        assert caplog.records == []
+
+        time.sleep(0.01)
+        timer.log_if_slow('GET', '/crm/contact/', 200)
+    record, = caplog.records
+    assert record.getMessage().startswith('Slow gateway request GET /crm/contact/ (200) took')
+    assert record.path == '/crm/contact/'
+    assert set(record.phases_ms) == {'upstream'}
+
+    settings.GATEWAY_SLOW_REQUEST_THRESHOLD = 0
+    caplog.clear()
+    timer.log_if_slow('GET', '/crm/contact/', 200)
+    assert caplog.records == []
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_server_timing_of_joined_request(auth_api_client, datamesh, settings):
+    lm1, lm2, relationship = datamesh
+    factories.JoinRecord(
+        relationship=relationship,
+        record_id=None,
+        record_uuid='19a7f600-74a0-4123-9be5-dfa69aa172cc',
+        related_record_id=1,
+        related_record_uuid=None,
+    )
+    register_joined_request_mocks(lm1, lm2)
+    url = f'/{lm1.endpoint_name}/siteprofiles/19a7f600-74a0-4123-9be5-dfa69aa172cc/'
+
+    response = auth_api_client.get(url, {'join': 'true'})
+    assert response.status_code == 200
+    assert not response.has_header('Server-Timing')
+
+    settings.GATEWAY_SERVER_TIMING = True
+    response = auth_api_client.get(url, {'join': 'true'})
+    assert response.status_code == 200
+    names = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+    assert names == [
+        'auth', 'permission', 'throttle', 'spec', 'upstream', 'join-records', 'related', 'datamesh', 'encode', 'total',
+    ]
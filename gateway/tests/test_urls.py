@@ -1,8 +1,14 @@
+import re
+import timeit
 from collections import OrderedDict
 
-from django.urls import resolve
+import pytest
+from django.urls import re_path, resolve, reverse
 from django.test import TestCase
 
+from gateway import API_GATEWAY_RESERVED_NAMES
+from gateway.resolvers import GATEWAY_PATH_REGEX, gateway_path
+
 
 class URLPatternsTest(TestCase):
     def test_api_gateway_urls_with_fragment(self):
@@ -82,3 +88,52 @@ class URLPatternsTest(TestCase):
     def test_docs_swagger_json(self):
         match = resolve('/docs/swagger.json')
         self.assertEqual(match.url_name, 'schema-swagger-json')
+
+    def test_async_api_gateway_urls(self):
+        match = resolve('/async/crm/appointment/1/')
+        self.assertEqual(match.url_name, 'api-gateway-async')
+        self.assertEqual(match.kwargs, {'service': 'crm', 'model': 'appointment', 'pk': '1'})
+
+    def test_reserved_names_are_not_forwarded(self):
+        self.assertEqual(resolve('/token/refresh/').url_name, 'token_refresh')
+        self.assertEqual(resolve('/coreuser/me/').url_name, 'coreuser-me')
+        self.assertEqual(resolve('/organization/1/').url_name, 'organization-detail')
+        # only whole segments are reserved
+        self.assertEqual(resolve('/documents/document/').url_name, 'api-gateway')
+
+    def test_reverse_api_gateway_urls(self):
+        self.assertEqual(reverse('api-gateway', kwargs={'service': 'crm', 'model': 'appointment'}), '/crm/appointment')
+        self.assertEqual(
+            reverse('api-gateway-async', kwargs={'service': 'crm', 'model': 'appointment', 'pk': 1}),
+            '/async/crm/appointment/1',
+        )
+
+
+def test_gateway_path_with_many_reserved_names():
+    reserved_names = API_GATEWAY_RESERVED_NAMES + [f'reserved{i}' for i in range(1000)]
+    pattern = gateway_path(lambda request: None, reserved_names, name='api-gateway')
+
+    match = pattern.resolve('crm/appointment/39da9369-838e-4750-91a5-f7805cd82839/')
+    assert match.kwargs == {'service': 'crm', 'model': 'appointment', 'pk': '39da9369-838e-4750-91a5-f7805cd82839'}
+    assert pattern.resolve('reserved999/appointment/') is None
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('reserved_count', [10, 100, 1000])
+def test_benchmark_gateway_url_resolution(reserved_count):
+    reserved_names = API_GATEWAY_RESERVED_NAMES + [f'reserved{i}' for i in range(reserved_count)]
+    lookaheads = ''.join(f'(?!{re.escape(name)}/)' for name in reserved_names)
+    patterns = {
+        'regex': re_path(rf'^{lookaheads}{GATEWAY_PATH_REGEX}', lambda request: None, name='api-gateway'),
+        'split': gateway_path(lambda request: None, reserved_names, name='api-gateway'),
+    }
+    path = 'crm/appointment/39da9369-838e-4750-91a5-f7805cd82839/'
+    number = 10000
+
+    results = []
+    for name, pattern in patterns.items():
+        assert pattern.resolve(path).kwargs['pk'] == '39da9369-838e-4750-91a5-f7805cd82839'
+        assert pattern.resolve(f'{reserved_names[-1]}/appointment/') is None
+        elapsed = min(timeit.repeat(lambda: pattern.resolve(path), number=number, repeat=3)) / number
+        results.append(f'{name} {elapsed * 1e6:.2f}us')
+    print(f'\nResolving with {len(reserved_names)} reserved names: ' + ', '.join(results))
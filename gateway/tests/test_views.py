@@ -1,4 +1,5 @@
 import os
+import gzip
 import json
 
 import pytest
@@ -291,3 +292,281 @@ def test_make_service_request_with_datamesh_list(auth_api_client, datamesh):
     item2 = data["results"][1]
     assert relationship.key in item2
     assert len(item2[relationship.key]) == 0
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_make_service_request_streams_large_response(auth_api_client, logic_module, settings):
+    settings.GATEWAY_STREAMING_THRESHOLD = 1024
+    settings.GATEWAY_STREAMING_CHUNK_SIZE = 512
+    url = f'/{logic_module.endpoint_name}/thumbnail/1/'
+    content = b'x' * 4096
+
+    # mock requests
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        swagger_body = r.read()
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{logic_module.endpoint}/docs/swagger.json',
+        body=swagger_body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{logic_module.endpoint}/thumbnail/1/',
+        body=content,
+        adding_headers={
+            'Content-Type': 'image/jpeg',
+            'Content-Disposition': 'attachment; filename="test.jpg"',
+        },
+    )
+
+    # make api request
+    response = auth_api_client.get(url)
+
+    assert response.status_code == 200
+    assert response.streaming
+    chunks = list(response.streaming_content)
+    assert len(chunks) == 8
+    assert b''.join(chunks) == content
+    assert response.get('Content-Type') == 'image/jpeg'
+    assert response.get('Content-Disposition') == 'attachment; filename="test.jpg"'
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_make_service_request_does_not_stream_joined_response(auth_api_client, datamesh, settings):
+    settings.GATEWAY_STREAMING_THRESHOLD = 0
+    lm1, lm2, relationship = datamesh
+    url = f'/{lm1.endpoint_name}/siteprofiles/19a7f600-74a0-4123-9be5-dfa69aa172cc/'
+
+    # mock requests
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_location.json')) as r:
+        swagger_location_body = r.read()
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        swagger_documents_body = r.read()
+    with open(os.path.join(CURRENT_PATH, 'fixtures/data_detail_siteprofile.json')) as r:
+        data_location_body = r.read()
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{lm1.endpoint}/docs/swagger.json',
+        body=swagger_location_body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{lm2.endpoint}/docs/swagger.json',
+        body=swagger_documents_body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{lm1.endpoint}/siteprofiles/19a7f600-74a0-4123-9be5-dfa69aa172cc/',
+        body=data_location_body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+
+    # make api request
+    response = auth_api_client.get(url, {'join': 'true'})
+
+    # the response gets aggregated, so it can't be passed through
+    assert response.status_code == 200
+    assert not response.streaming
+    assert response.json()[relationship.key] == []
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_make_service_request_forwards_validators(auth_api_client, logic_module):
+    url = f'/{logic_module.endpoint_name}/thumbnail/1/'
+
+    # mock requests
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        swagger_body = r.read()
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{logic_module.endpoint}/docs/swagger.json',
+        body=swagger_body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{logic_module.endpoint}/thumbnail/1/',
+        responses=[
+            httpretty.Response(
+                body='{"details": "IT IS A TEST"}',
+                adding_headers={
+                    'Content-Type': 'application/json',
+                    'ETag': '"v1"',
+                    'Last-Modified': 'Mon, 01 Jul 2019 17:41:54 GMT',
+                    'Cache-Control': 'private, max-age=60',
+                },
+            ),
+            httpretty.Response(body='', status=304, adding_headers={'ETag': '"v1"'}),
+        ],
+    )
+
+    # make api request
+    response = auth_api_client.get(url)
+
+    assert response.status_code == 200
+    assert response.get('ETag') == '"v1"'
+    assert response.get('Last-Modified') == 'Mon, 01 Jul 2019 17:41:54 GMT'
+    assert response.get('Cache-Control') == 'private, max-age=60'
+
+    # the validators are forwarded, so the service doesn't send the body again
+    response = auth_api_client.get(url, HTTP_IF_NONE_MATCH='"v1"')
+
+    assert response.status_code == 304
+    assert response.content == b''
+    assert httpretty.last_request().headers['If-None-Match'] == '"v1"'
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_make_service_request_forwards_validators_of_reads_only(auth_api_client, logic_module):
+    url = f'/{logic_module.endpoint_name}/documents/1/'
+
+    # mock requests
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        swagger_body = r.read()
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{logic_module.endpoint}/docs/swagger.json',
+        body=swagger_body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+    httpretty.register_uri(
+        httpretty.PUT,
+        f'{logic_module.endpoint}/documents/1/',
+        body='{"documents_id": 1}',
+        adding_headers={'Content-Type': 'application/json', 'ETag': '"v2"'},
+    )
+
+    # make api request
+    response = auth_api_client.put(
+        url, {'file_name': 'test.jpg'}, format='json',
+        HTTP_IF_NONE_MATCH='"v1"', HTTP_IF_MODIFIED_SINCE='Mon, 01 Jul 2019 17:41:54 GMT',
+    )
+
+    assert response.status_code == 200
+    assert 'If-None-Match' not in httpretty.last_request().headers
+    assert 'If-Modified-Since' not in httpretty.last_request().headers
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_make_service_request_computes_etag(auth_api_client, logic_module):
+    url = f'/{logic_module.endpoint_name}/thumbnail/1/'
+
+    # mock requests
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        swagger_body = r.read()
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{logic_module.endpoint}/docs/swagger.json',
+        body=swagger_body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{logic_module.endpoint}/thumbnail/1/',
+        body='{"details": "IT IS A TEST"}',
+        adding_headers={'Content-Type': 'application/json'},
+    )
+
+    # make api request
+    response = auth_api_client.get(url)
+
+    assert response.status_code == 200
+    etag = response.get('ETag')
+    assert etag and not etag.startswith('W/')
+
+    # the service doesn't know the validator, the gateway answers for it
+    response = auth_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == 304
+    assert response.get('ETag') == etag
+
+    response = auth_api_client.get(url, HTTP_IF_NONE_MATCH='"outdated"')
+
+    assert response.status_code == 200
+    assert response.content == b'{"details": "IT IS A TEST"}'
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_make_service_request_joined_response_etag(auth_api_client, datamesh):
+    lm1, lm2, relationship = datamesh
+    url = f'/{lm1.endpoint_name}/siteprofiles/19a7f600-74a0-4123-9be5-dfa69aa172cc/'
+
+    # mock requests
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_location.json')) as r:
+        swagger_location_body = r.read()
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        swagger_documents_body = r.read()
+    with open(os.path.join(CURRENT_PATH, 'fixtures/data_detail_siteprofile.json')) as r:
+        data_location_body = r.read()
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{lm1.endpoint}/docs/swagger.json',
+        body=swagger_location_body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{lm2.endpoint}/docs/swagger.json',
+        body=swagger_documents_body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{lm1.endpoint}/siteprofiles/19a7f600-74a0-4123-9be5-dfa69aa172cc/',
+        body=data_location_body,
+        adding_headers={'Content-Type': 'application/json', 'ETag': '"siteprofile"'},
+    )
+
+    # make api request
+    response = auth_api_client.get(url, {'join': 'true'})
+
+    # the validator of the service doesn't describe the joined body
+    assert response.status_code == 200
+    etag = response.get('ETag')
+    assert etag is not None and etag != '"siteprofile"'
+    assert 'If-None-Match' not in httpretty.last_request().headers
+
+    response = auth_api_client.get(url, {'join': 'true'}, HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == 304
+
+
+@pytest.mark.django_db()
+@httpretty.activate
+def test_make_service_request_negotiates_compression(auth_api_client, logic_module):
+    url = f'/{logic_module.endpoint_name}/documents/'
+    content = json.dumps([{'documents_id': i, 'name': 'document'} for i in range(200)]).encode()
+
+    # mock requests
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        swagger_body = r.read()
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{logic_module.endpoint}/docs/swagger.json',
+        body=swagger_body,
+        adding_headers={'Content-Type': 'application/json'},
+    )
+    httpretty.register_uri(
+        httpretty.GET,
+        f'{logic_module.endpoint}/documents/',
+        body=gzip.compress(content),
+        adding_headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'},
+    )
+
+    # make api request
+    response = auth_api_client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+
+    # the service was asked for a compressed response and the client gets one too
+    assert 'gzip' in httpretty.last_request().headers['Accept-Encoding']
+    assert response.status_code == 200
+    assert response['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.content) == content
@@ -1,11 +1,17 @@
 import os
 import json
+import asyncio
 from unittest.mock import patch
 
 import pytest
+import httpretty
+from bravado_core.spec import Spec
+from rest_framework.request import Request
 
 import factories
 from core.tests.fixtures import auth_api_client, logic_module
+from gateway.clients import AsyncSwaggerClient
+from gateway.specs import SWAGGER_CONFIG
 from .fixtures import datamesh
 from .utils import AiohttpResponseMock, create_aiohttp_session_mock
 
@@ -13,6 +19,18 @@ from .utils import AiohttpResponseMock, create_aiohttp_session_mock
 CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
 
 
+def register_swagger_mocks(responses):
+    """ Swagger specs are pulled with requests by the spec registry """
+    for response in responses:
+        if response.url.endswith('/docs/swagger.json'):
+            httpretty.register_uri(
+                httpretty.GET,
+                response.url,
+                body=response.body,
+                adding_headers=response.headers,
+            )
+
+
 @pytest.mark.parametrize(
     "content,content_type",
     [
@@ -22,14 +40,14 @@ CURRENT_PATH = os.path.dirname(os.path.abspath(__file__))
     ],
 )
 @pytest.mark.django_db()
-@patch('gateway.request.aiohttp.ClientSession')
+@httpretty.activate
+@patch('gateway.clients.async_session_manager.get_session')
 def test_make_service_request_data_and_raw(
     client_session_mock,
     auth_api_client,
     logic_module,
     content,
     content_type,
-    event_loop,
 ):
     url = f'/async/{logic_module.endpoint_name}/thumbnail/1/'
 
@@ -53,9 +71,8 @@ def test_make_service_request_data_and_raw(
             headers={'Content-Type': content_type},
         ),
     ]
-    client_session_mock.return_value = create_aiohttp_session_mock(
-        responses, loop=event_loop
-    )
+    client_session_mock.return_value = create_aiohttp_session_mock(responses)
+    register_swagger_mocks(responses)
 
     # make api request
     response = auth_api_client.get(url)
@@ -70,9 +87,10 @@ def test_make_service_request_data_and_raw(
 
 
 @pytest.mark.django_db()
-@patch('gateway.request.aiohttp.ClientSession')
+@httpretty.activate
+@patch('gateway.clients.async_session_manager.get_session')
 def test_make_service_request_to_unexisting_list_endpoint(
-    client_session_mock, auth_api_client, logic_module, event_loop
+    client_session_mock, auth_api_client, logic_module
 ):
 
     url = f'/async/{logic_module.endpoint_name}/nowhere/'
@@ -89,9 +107,8 @@ def test_make_service_request_to_unexisting_list_endpoint(
             headers={'Content-Type': 'application/json'},
         )
     ]
-    client_session_mock.return_value = create_aiohttp_session_mock(
-        responses, loop=event_loop
-    )
+    client_session_mock.return_value = create_aiohttp_session_mock(responses)
+    register_swagger_mocks(responses)
 
     # make api request
     response = auth_api_client.get(url)
@@ -104,9 +121,10 @@ def test_make_service_request_to_unexisting_list_endpoint(
 
 
 @pytest.mark.django_db()
-@patch('gateway.request.aiohttp.ClientSession')
+@httpretty.activate
+@patch('gateway.clients.async_session_manager.get_session')
 def test_make_service_request_to_unexisting_detail_endpoint(
-    client_session_mock, auth_api_client, logic_module, event_loop
+    client_session_mock, auth_api_client, logic_module
 ):
 
     url = f'/async/{logic_module.endpoint_name}/nowhere/123/'
@@ -123,9 +141,8 @@ def test_make_service_request_to_unexisting_detail_endpoint(
             headers={'Content-Type': 'application/json'},
         )
     ]
-    client_session_mock.return_value = create_aiohttp_session_mock(
-        responses, loop=event_loop
-    )
+    client_session_mock.return_value = create_aiohttp_session_mock(responses)
+    register_swagger_mocks(responses)
 
     # make api request
     response = auth_api_client.get(url)
@@ -138,9 +155,10 @@ def test_make_service_request_to_unexisting_detail_endpoint(
 
 
 @pytest.mark.django_db()
-@patch('gateway.request.aiohttp.ClientSession')
+@httpretty.activate
+@patch('gateway.clients.async_session_manager.get_session')
 def test_make_service_request_with_datamesh_detailed(
-    client_session_mock, auth_api_client, datamesh, event_loop
+    client_session_mock, auth_api_client, datamesh
 ):
     lm1, lm2, relationship = datamesh
     factories.JoinRecord(
@@ -198,9 +216,8 @@ def test_make_service_request_with_datamesh_detailed(
             headers={'Content-Type': 'application/json'},
         ),
     ]
-    client_session_mock.return_value = create_aiohttp_session_mock(
-        responses, loop=event_loop
-    )
+    client_session_mock.return_value = create_aiohttp_session_mock(responses)
+    register_swagger_mocks(responses)
 
     # make api request
     response = auth_api_client.get(url, {'join': 'true'})
@@ -215,9 +232,10 @@ def test_make_service_request_with_datamesh_detailed(
 
 
 @pytest.mark.django_db()
-@patch('gateway.request.aiohttp.ClientSession')
+@httpretty.activate
+@patch('gateway.clients.async_session_manager.get_session')
 def test_make_service_request_with_datamesh_list(
-    client_session_mock, auth_api_client, datamesh, event_loop
+    client_session_mock, auth_api_client, datamesh
 ):
     lm1, lm2, relationship = datamesh
     factories.JoinRecord(
@@ -273,9 +291,8 @@ def test_make_service_request_with_datamesh_list(
             headers={'Content-Type': 'application/json'},
         ),
     ]
-    client_session_mock.return_value = create_aiohttp_session_mock(
-        responses, loop=event_loop
-    )
+    client_session_mock.return_value = create_aiohttp_session_mock(responses)
+    register_swagger_mocks(responses)
 
     # make api request
     response = auth_api_client.get(url, {'join': 'true'})
@@ -295,3 +312,38 @@ def test_make_service_request_with_datamesh_list(
     item2 = data["results"][1]
     assert relationship.key in item2
     assert len(item2[relationship.key]) == 0
+
+
+@pytest.mark.django_db()
+def test_async_client_streams_large_response(rf, logic_module, settings):
+    settings.GATEWAY_STREAMING_THRESHOLD = 1024
+    settings.GATEWAY_STREAMING_CHUNK_SIZE = 512
+    content = b'x' * 4096
+
+    with open(os.path.join(CURRENT_PATH, 'fixtures/swagger_documents.json')) as r:
+        spec = Spec.from_dict(json.load(r), config=SWAGGER_CONFIG)
+    responses = [
+        AiohttpResponseMock(
+            method='GET',
+            url=f'{logic_module.endpoint}/thumbnail/1/',
+            status=200,
+            body=content,
+            headers={'Content-Type': 'image/jpeg'},
+        ),
+    ]
+    request = Request(rf.get('/async/documents/thumbnail/1/'))
+
+    async def stream():
+        client = AsyncSwaggerClient(spec, request, logic_module)
+        body, status_code, headers = await client.request(
+            streaming=True, service='documents', model='thumbnail', pk='1'
+        )
+        return [chunk async for chunk in body], status_code
+
+    with patch('gateway.clients.async_session_manager.get_session') as client_session_mock:
+        client_session_mock.return_value = create_aiohttp_session_mock(responses)
+        chunks, status_code = asyncio.run(stream())
+
+    assert status_code == 200
+    assert len(chunks) == 8
+    assert b''.join(chunks) == content
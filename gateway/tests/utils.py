@@ -1,9 +1,8 @@
 import typing
-import asyncio
 import json
 from unittest.mock import Mock
 
-from aiohttp import ClientSession, StreamReader, ContentTypeError, RequestInfo
+from aiohttp import StreamReader, ContentTypeError, RequestInfo
 
 
 class AiohttpResponseMock:
@@ -28,12 +27,12 @@ class AiohttpResponseMock:
     def content(self):
         protocol = Mock(_reading_paused=False)
         stream = StreamReader(protocol, limit=65536)
-        stream.feed_data(self.body)
+        stream.feed_data(self.body or b'')
         stream.feed_eof()
         return stream
 
     async def read(self):
-        return self.content.read()
+        return await self.content.read()
 
     async def text(self, encoding='utf-8'):
         return self.body.decode(encoding)
@@ -50,16 +49,40 @@ class AiohttpResponseMock:
         pass
 
 
-def create_aiohttp_session_mock(
-    response_mocks: typing.Iterable[AiohttpResponseMock],
-    loop: asyncio.AbstractEventLoop = None,
-) -> ClientSession:
-    async def _request(method, url, *args, **kwargs):
-        for response in response_mocks:
+class AiohttpSessionMock:
+    """ Shared aiohttp session replacement answering requests with response mocks """
+
+    closed = False
+
+    def __init__(self, response_mocks: typing.Iterable[AiohttpResponseMock]):
+        self._response_mocks = list(response_mocks)
+        self.requests = []
+
+    def request(self, method, url, *args, **kwargs):
+        self.requests.append((method, url, kwargs))
+        for response in self._response_mocks:
             if response.match_request(method, url):
-                return response
+                return _ResponseContextManager(response, kwargs)
         assert False, f'No response mock for {method} {url}'
 
-    session = ClientSession(loop=loop)
-    session._request = _request
-    return session
+
+class _ResponseContextManager:
+    def __init__(self, response: AiohttpResponseMock, request_kwargs: typing.Optional[dict] = None):
+        self._response = response
+        self._request_kwargs = request_kwargs or {}
+
+    async def __aenter__(self):
+        # a streamed body is read like the service would, the recorded request gets its bytes
+        data = self._request_kwargs.get('data')
+        if hasattr(data, '__aiter__'):
+            self._request_kwargs['data'] = b''.join([chunk async for chunk in data])
+        return self._response
+
+    async def __aexit__(self, *args):
+        await self._response.release()
+
+
+def create_aiohttp_session_mock(
+    response_mocks: typing.Iterable[AiohttpResponseMock],
+) -> AiohttpSessionMock:
+    return AiohttpSessionMock(response_mocks)
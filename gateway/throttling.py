@@ -0,0 +1,149 @@
+import logging
+import time
+from typing import List, NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from core.models import LogicModule
+
+from .registry import logic_module_registry
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+# Buckets of idle clients are dropped after that many seconds, or after the period
+# of their rate when it's longer, which refills them
+BUCKET_TIMEOUT = 60 * 60
+
+
+class Rate(NamedTuple):
+    requests: int
+    period: int
+
+    @classmethod
+    def parse(cls, rate: Optional[str]) -> Optional['Rate']:
+        """ Parse a rate like '100/minute', None if there is no limit """
+        if not rate:
+            return None
+        requests, period = rate.split('/')
+        return cls(requests=int(requests), period=PERIODS[period[0]])
+
+    @property
+    def interval(self) -> int:
+        """ Milliseconds between two requests at the sustained rate """
+        return max(round(self.period * 1000 / self.requests), 1)
+
+
+class TokenBucket:
+    """
+    Token bucket in the cache GATEWAY_THROTTLE_CACHE_ALIAS. The limit holds across
+    workers and nodes only when that cache is shared (Redis, Memcached), with a
+    local-memory cache every worker has buckets of its own. The bucket holds
+    `rate.requests` tokens and refills at the rate. It's stored as the time the
+    bucket will be full again (generic cell rate algorithm), which a single atomic
+    increment consumes a token from.
+    """
+
+    def __init__(self, key: str, rate: Rate):
+        self.key = f'gateway:throttle:{key}'
+        self.rate = rate
+
+    @property
+    def cache(self):
+        return caches[settings.GATEWAY_THROTTLE_CACHE_ALIAS]
+
+    @property
+    def timeout(self) -> int:
+        """ The bucket is full again at most a rate period after a token was taken """
+        return max(BUCKET_TIMEOUT, self.rate.period)
+
+    def consume(self) -> float:
+        """ Take a token, return 0 if there was one or the seconds until there is one """
+        interval = self.rate.interval
+        now = int(time.time() * 1000)
+        try:
+            full_at = self.cache.incr(self.key, interval)
+        except ValueError:
+            full_at = now + interval
+            if self.cache.add(self.key, full_at, self.timeout):
+                return 0
+            full_at = self.cache.incr(self.key, interval)
+        # incrementing doesn't extend the expiry of the key, a dropped bucket would be full
+        self.cache.touch(self.key, self.timeout)
+
+        if full_at - interval < now:
+            # the bucket was full, concurrent refills may let a few more requests through
+            self.cache.set(self.key, now + interval, self.timeout)
+            return 0
+
+        excess = full_at - now - self.rate.requests * interval
+        if excess > 0:
+            self.refund()
+            return excess / 1000
+        return 0
+
+    def refund(self) -> None:
+        """ Put back a token that was taken for a request that isn't made """
+        try:
+            self.cache.decr(self.key, self.rate.interval)
+        except ValueError:
+            pass
+
+
+class GatewayRateThrottle(BaseThrottle):
+    """
+    Limits the requests to a service per user and per organization. The rates are
+    taken from the logic module, the user's groups may grant a higher user rate,
+    the gateway settings are the defaults.
+    """
+
+    def __init__(self):
+        self._wait = None
+
+    def get_buckets(self, request, view) -> List[TokenBucket]:
+        service = view.kwargs.get('service')
+        logic_module = logic_module_registry.get(service)
+        buckets = []
+        # without configured rates this takes no DB queries
+
+        user_rate = self.get_user_rate(request.user, logic_module)
+        if user_rate is not None:
+            buckets.append(TokenBucket(f'{service}:user:{request.user.pk}', user_rate))
+
+        organization_id = getattr(request.user, 'organization_id', None)
+        organization_rate = Rate.parse(
+            getattr(logic_module, 'organization_throttle_rate', None) or settings.GATEWAY_THROTTLE_ORGANIZATION_RATE
+        )
+        if organization_id is not None and organization_rate is not None:
+            buckets.append(TokenBucket(f'{service}:organization:{organization_id}', organization_rate))
+        return buckets
+
+    @staticmethod
+    def get_user_rate(user, logic_module: Optional[LogicModule]) -> Optional[Rate]:
+        """ The most generous rate of the user's groups, else the rate of the service """
+        group_rates = [Rate.parse(rate) for rate in logic_module_registry.get_group_throttle_rates(user.pk)]
+        if group_rates:
+            return max(group_rates, key=lambda rate: rate.requests / rate.period)
+        return Rate.parse(getattr(logic_module, 'user_throttle_rate', None) or settings.GATEWAY_THROTTLE_USER_RATE)
+
+    def allow_request(self, request, view) -> bool:
+        if request.user.is_anonymous:
+            return True
+
+        consumed = []
+        for bucket in self.get_buckets(request, view):
+            wait = bucket.consume()
+            if wait:
+                logger.info(f'Throttled request to {bucket.key}')
+                # the narrower buckets don't pay for a request that isn't made
+                for consumed_bucket in consumed:
+                    consumed_bucket.refund()
+                self._wait = wait
+                return False
+            consumed.append(bucket)
+        return True
+
+    def wait(self) -> Optional[float]:
+        return self._wait
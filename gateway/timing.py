@@ -0,0 +1,54 @@
+import contextlib
+import logging
+import time
+from typing import Dict, Iterator
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTimer:
+    """
+    Time spent in the phases of a gateway request. A phase entered several times
+    adds up, phases of concurrent tasks may overlap each other.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases: Dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - started
+
+    @property
+    def total(self) -> float:
+        return time.monotonic() - self.started
+
+    def get_server_timing(self) -> str:
+        """ Value of the Server-Timing header with the durations in milliseconds """
+        metrics = {**self.phases, 'total': self.total}
+        return ', '.join(f'{name};dur={duration * 1000:.1f}' for name, duration in metrics.items())
+
+    def log_if_slow(self, method: str, path: str, status_code: int) -> None:
+        """ Log the breakdown of a request that took longer than GATEWAY_SLOW_REQUEST_THRESHOLD """
+        total = self.total
+        if not settings.GATEWAY_SLOW_REQUEST_THRESHOLD or total < settings.GATEWAY_SLOW_REQUEST_THRESHOLD:
+            return
+        phases = {name: round(duration * 1000, 1) for name, duration in self.phases.items()}
+        breakdown = ', '.join(f'{name} {duration}ms' for name, duration in phases.items())
+        logger.warning(
+            f'Slow gateway request {method} {path} ({status_code}) took {total * 1000:.0f}ms: {breakdown}',
+            extra={
+                'method': method,
+                'path': path,
+                'status_code': status_code,
+                'duration_ms': round(total * 1000, 1),
+                'phases_ms': phases,
+            },
+        )
@@ -0,0 +1,155 @@
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Optional
+
+import aiohttp
+import requests
+
+from core.models import LogicModule
+
+from .breakers import CircuitBreaker, circuit_breakers
+from .metrics import upstream_errors, upstream_request_duration
+from .multipart import MultipartStream
+from .retries import RETRYABLE_STATUS_CODES, RetryPolicy, retry_budget
+from .sessions import UpstreamPoolConfig, get_upstream_key, session_registry
+
+logger = logging.getLogger(__name__)
+
+
+def can_retry(breaker: CircuitBreaker, attempt: int, max_retries: int) -> bool:
+    """ Retry while the policy and the retry budget allow it, unless the failures opened the circuit """
+    return attempt < max_retries and breaker.allow_request() and retry_budget.can_retry()
+
+
+def record_response(breaker: CircuitBreaker, status_code: int, duration: float) -> None:
+    """ Record the latency of a call that got a response, server errors count as errors """
+    upstream_request_duration.observe(duration, breaker.name)
+    if status_code >= 500:
+        upstream_errors.inc(breaker.name, status_code)
+
+
+def send_request(
+    method: str,
+    url: str,
+    logic_module: Optional[LogicModule] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    guarded: bool = True,
+    **kwargs,
+) -> requests.Response:
+    """
+    Request a service over its keep-alive session, with the timeouts and the retry
+    policy of the logic module, guarded by the circuit breaker of the service.
+    `retry_policy` overrides the policy, and requests that aren't `guarded` don't use
+    or feed the circuit breaker, e.g. requests to the gateway itself that are retried and
+    guarded by the gateway request they reach. Keyword arguments are passed to
+    `requests.Session.request`.
+    """
+    pool = session_registry.get_pool(logic_module, url)
+    if guarded:
+        breaker = circuit_breakers.get(logic_module, url)
+    else:
+        breaker = CircuitBreaker(get_upstream_key(logic_module, url), enabled=False)
+    policy = retry_policy or RetryPolicy.from_logic_module(logic_module)
+    max_retries = policy.get_max_retries(method, isinstance(kwargs.get('data'), MultipartStream))
+    retry_budget.record_request()
+
+    breaker.check()
+    # a trial call of a half-open circuit holds its slot until the outcome is recorded
+    pending = True
+    attempt = 0
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                response = pool.session.request(method, url, timeout=pool.timeout, **kwargs)
+            except requests.RequestException as e:
+                pending = False
+                breaker.record_failure()
+                upstream_errors.inc(breaker.name, e.__class__.__name__)
+                if can_retry(breaker, attempt, max_retries):
+                    pending = True
+                    logger.info(f'Retrying {method.upper()} {url} after {e.__class__.__name__}')
+                    time.sleep(policy.get_backoff(attempt))
+                    attempt += 1
+                    continue
+                raise
+
+            duration = time.monotonic() - started
+            pending = False
+            breaker.record(response.status_code, duration)
+            record_response(breaker, response.status_code, duration)
+            if response.status_code in RETRYABLE_STATUS_CODES and can_retry(breaker, attempt, max_retries):
+                pending = True
+                logger.info(f'Retrying {method.upper()} {url} after status {response.status_code}')
+                response.close()
+                time.sleep(policy.get_backoff(attempt))
+                attempt += 1
+                continue
+            return response
+    finally:
+        if pending:
+            breaker.release()
+
+
+async def send_async_request(
+    response_context: contextlib.AsyncExitStack,
+    session: aiohttp.ClientSession,
+    method: str,
+    url: str,
+    logic_module: Optional[LogicModule] = None,
+    **kwargs,
+) -> aiohttp.ClientResponse:
+    """
+    Async counterpart of `send_request` over the given aiohttp session. The response
+    is released when the response context exits. Keyword arguments are passed to
+    `aiohttp.ClientSession.request`.
+    """
+    config = UpstreamPoolConfig.from_logic_module(logic_module)
+    breaker = circuit_breakers.get(logic_module, url)
+    policy = RetryPolicy.from_logic_module(logic_module)
+    max_retries = policy.get_max_retries(method, isinstance(kwargs.get('data'), MultipartStream))
+    retry_budget.record_request()
+
+    breaker.check()
+    # a trial call of a half-open circuit holds its slot until the outcome is recorded,
+    # the request may also end with a cancellation when the client disconnects
+    pending = True
+    attempt = 0
+    try:
+        while True:
+            attempt_context = contextlib.AsyncExitStack()
+            started = time.monotonic()
+            try:
+                response = await attempt_context.enter_async_context(
+                    session.request(method, url, timeout=config.client_timeout, **kwargs)
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                pending = False
+                breaker.record_failure()
+                upstream_errors.inc(breaker.name, e.__class__.__name__)
+                if can_retry(breaker, attempt, max_retries):
+                    pending = True
+                    logger.info(f'Retrying {method.upper()} {url} after {e.__class__.__name__}')
+                    await asyncio.sleep(policy.get_backoff(attempt))
+                    attempt += 1
+                    continue
+                raise
+
+            duration = time.monotonic() - started
+            pending = False
+            breaker.record(response.status, duration)
+            record_response(breaker, response.status, duration)
+            if response.status in RETRYABLE_STATUS_CODES and can_retry(breaker, attempt, max_retries):
+                pending = True
+                logger.info(f'Retrying {method.upper()} {url} after status {response.status}')
+                await attempt_context.aclose()
+                await asyncio.sleep(policy.get_backoff(attempt))
+                attempt += 1
+                continue
+            await response_context.enter_async_context(attempt_context)
+            return response
+    finally:
+        if pending:
+            breaker.release()
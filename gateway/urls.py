@@ -4,6 +4,7 @@ from rest_framework import permissions
 from . import API_GATEWAY_RESERVED_NAMES
 from . import generator
 from . import views
+from .resolvers import gateway_path
 
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
@@ -22,26 +23,18 @@ schema_view = get_schema_view(
 )
 
 urlpatterns = [
-    # Exclude paths starting with 'oauth/' and other ORM-related endpoints from the gateway
-    re_path(
-        rf"^(?!o/)(?!oauth/)(?!coregroups/)(?!coreuser/)(?!organization/)(?!logicmodule/)(?!partner/)(?!subscription/)(?!{'|'.join(API_GATEWAY_RESERVED_NAMES)})"
-        r"async/"
-        r"(?P<service>[^/?#]+)/"
-        r"(?P<model>[^/?#]+)/?"
-        r"(?:(?P<pk>[^?#/]+)/?)?"
-        r"(?:\?(?P<query>[^#]*))?"
-        r"(?:#(?P<fragment>.*))?",
-        views.APIGatewayView.as_view(),
+    path('batch/', views.APIBatchView.as_view(), name='api-gateway-batch'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    # Paths starting with an ORM-related endpoint or another reserved name aren't forwarded
+    gateway_path(
+        views.APIAsyncGatewayView.as_view(),
+        API_GATEWAY_RESERVED_NAMES,
+        prefix='async/',
         name='api-gateway-async',
     ),
-    re_path(
-        rf"^(?!o/)(?!oauth/)(?!coregroups/)(?!coreuser/)(?!organization/)(?!logicmodule/)(?!partner/)(?!subscription/)(?!{'|'.join(API_GATEWAY_RESERVED_NAMES)})"
-        r"(?P<service>[^/?#]+)/"
-        r"(?P<model>[^/?#]+)/?"
-        r"(?:(?P<pk>[^?#/]+)/?)?"
-        r"(?:\?(?P<query>[^#]*))?"
-        r"(?:#(?P<fragment>.*))?",
+    gateway_path(
         views.APIGatewayView.as_view(),
+        API_GATEWAY_RESERVED_NAMES,
         name='api-gateway',
     ),
     re_path(
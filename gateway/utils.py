@@ -132,10 +132,17 @@ class GatewayJSONEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
+UUID4_HEX_RE = re.compile(
+    r'^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}\Z',
+    re.I,
+)
+
+
 def valid_uuid4(uuid_string):
-    uuid4hex = re.compile(
-        '^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}\Z',  # noqa
-        re.I,
-    )
-    match = uuid4hex.match(uuid_string)
+    match = UUID4_HEX_RE.match(uuid_string)
     return bool(match)
+
+
+def get_pk_kind(pk: str) -> str:
+    """ Get the kind of the primary key used in the service's URL path parameters """
+    return 'uuid' if valid_uuid4(pk) else 'id'
@@ -1,16 +1,37 @@
+import asyncio
 import logging
+from typing import Tuple
 
-from django.http import HttpResponse
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.cache import get_conditional_response, set_response_etag
+from django.utils.http import parse_http_date_safe
 from rest_framework import views
 from rest_framework.request import Request
 from rest_framework.permissions import IsAuthenticated
 
 from gateway import exceptions
+from gateway.batch import BatchGatewayRequest
+from gateway.metrics import UNKNOWN_LABEL, gateway_request_duration, gateway_requests, metrics_registry
 from gateway.permissions import AllowLogicModuleGroup
-from gateway.request import GatewayRequest, AsyncGatewayRequest
+from gateway.registry import logic_module_registry
+from gateway.request import GatewayRequest, AsyncGatewayRequest, GatewayResponse
+from gateway.sessions import async_session_manager
+from gateway.throttling import GatewayRateThrottle
+from gateway.timing import RequestTimer
 
 logger = logging.getLogger(__name__)
 
+# Headers of the service response that are passed on to the client besides Content-Type
+PROXIED_RESPONSE_HEADERS = ('Content-Disposition', 'Content-Language')
+# Headers that only describe the response of the service when its body is passed on as is
+PASSTHROUGH_RESPONSE_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control')
+# Requests rejected before reaching the service, or for models it doesn't have, aren't labelled with their model
+UNLABELLED_MODEL_STATUS_CODES = (401, 403, 404)
+
+
 class APIGatewayView(views.APIView):
     """
     API gateway receives API requests, enforces throttling and security
@@ -19,6 +40,7 @@ class APIGatewayView(views.APIView):
     """
 
     permission_classes = (IsAuthenticated, AllowLogicModuleGroup)
+    throttle_classes = (GatewayRateThrottle,)
     schema = None
     gateway_request_class = GatewayRequest
 
@@ -28,6 +50,45 @@ class APIGatewayView(views.APIView):
         self._data = dict()
         super().__init__(*args, **kwargs)
 
+    def initialize_request(self, request, *args, **kwargs):
+        self.timer = RequestTimer()
+        return super().initialize_request(request, *args, **kwargs)
+
+    def perform_authentication(self, request):
+        with self.timer.phase('auth'):
+            super().perform_authentication(request)
+
+    def check_permissions(self, request):
+        with self.timer.phase('permission'):
+            super().check_permissions(request)
+
+    def check_throttles(self, request):
+        with self.timer.phase('throttle'):
+            super().check_throttles(request)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if 'service' in self.kwargs:
+            service, model = self.get_metric_labels(response.status_code)
+            gateway_requests.inc(service, model, request.method, response.status_code)
+            gateway_request_duration.observe(self.timer.total, service, request.method)
+        if settings.GATEWAY_SERVER_TIMING:
+            response['Server-Timing'] = self.timer.get_server_timing()
+        self.timer.log_if_slow(request.method, request.path, response.status_code)
+        return response
+
+    def get_metric_labels(self, status_code: int) -> Tuple[str, str]:
+        """
+        Service and model labels of the request's metrics. The values come from the URL, so
+        only known services are labelled, and models only of requests that were let through
+        """
+        service = self.kwargs['service']
+        if not logic_module_registry.is_loaded(service):
+            return UNKNOWN_LABEL, UNKNOWN_LABEL
+        if status_code in UNLABELLED_MODEL_STATUS_CODES:
+            return service, UNKNOWN_LABEL
+        return service, self.kwargs.get('model', '')
+
     def get(self, request, *args, **kwargs):
         return self.make_service_request(request, *args, **kwargs)
 
@@ -57,14 +118,54 @@ class APIGatewayView(views.APIView):
                 content=e.content, status=e.status, content_type=e.content_type
             )
 
-        gw_request = self.gateway_request_class(request, **kwargs)
+        gw_request = self.gateway_request_class(request, timer=self.timer, **kwargs)
         gw_response = gw_request.perform()
 
-        return HttpResponse(
-            content=gw_response.content,
-            status=gw_response.status_code,
-            content_type=gw_response.headers.get('Content-Type'),
+        return self._build_response(gw_response)
+
+    def _build_response(self, gw_response: GatewayResponse) -> HttpResponse:
+        if gw_response.streaming:
+            response = StreamingHttpResponse(
+                streaming_content=gw_response.content,
+                status=gw_response.status_code,
+                content_type=gw_response.headers.get('Content-Type'),
+            )
+        else:
+            response = HttpResponse(
+                content=gw_response.content,
+                status=gw_response.status_code,
+                content_type=gw_response.headers.get('Content-Type'),
+            )
+        proxied_headers = PROXIED_RESPONSE_HEADERS
+        if gw_response.passthrough:
+            proxied_headers += PASSTHROUGH_RESPONSE_HEADERS
+        for header in proxied_headers:
+            value = gw_response.headers.get(header)
+            if value is not None:
+                response[header] = value
+
+        if self.request.method == 'GET' and response.status_code == 200:
+            response = self._make_conditional(response)
+        return response
+
+    def _make_conditional(self, response: HttpResponse) -> HttpResponse:
+        """
+        Make sure the response has a validator, the body is hashed if the service didn't
+        provide one or the body was aggregated. Answer with 304 Not Modified if the client
+        has the response already.
+        """
+        if not response.has_header('ETag') and not response.streaming:
+            set_response_etag(response)
+        conditional_response = get_conditional_response(
+            self.request,
+            etag=response.get('ETag'),
+            last_modified=parse_http_date_safe(response.get('Last-Modified', '')),
+            response=response,
         )
+        if conditional_response is not response:
+            # release the connection to the service of a streamed body
+            response.close()
+        return conditional_response
 
     def _validate_incoming_request(self, request: Request, **kwargs: dict) -> None:
         """
@@ -74,4 +175,113 @@ class APIGatewayView(views.APIView):
             request.META['REQUEST_METHOD'] in ['PUT', 'PATCH', 'DELETE']
             and kwargs.get('pk') is None
         ):
-            raise exceptions.RequestValidationError('The object ID is missing.', 400)
\ No newline at end of file
+            raise exceptions.RequestValidationError('The object ID is missing.', 400)
+
+
+class APIAsyncGatewayView(APIGatewayView):
+    """
+    Native async version of the API gateway. Authentication and permission checks
+    run in a worker thread, while the upstream calls and datamesh joins are awaited,
+    so under ASGI one worker serves many slow upstream calls concurrently.
+    """
+
+    gateway_request_class = AsyncGatewayRequest
+
+    async def dispatch(self, request, *args, **kwargs):
+        """ Async counterpart of APIView.dispatch """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            async with async_session_manager.scope():
+                response = handler(request, *args, **kwargs)
+                if asyncio.iscoroutine(response):
+                    response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def get(self, request, *args, **kwargs):
+        return await self.make_service_request(request, *args, **kwargs)
+
+    async def post(self, request, *args, **kwargs):
+        return await self.make_service_request(request, *args, **kwargs)
+
+    async def delete(self, request, *args, **kwargs):
+        return await self.make_service_request(request, *args, **kwargs)
+
+    async def put(self, request, *args, **kwargs):
+        return await self.make_service_request(request, *args, **kwargs)
+
+    async def patch(self, request, *args, **kwargs):
+        return await self.make_service_request(request, *args, **kwargs)
+
+    async def options(self, request, *args, **kwargs):
+        return await self.make_service_request(request, *args, **kwargs)
+
+    async def make_service_request(self, request, *args, **kwargs):
+        """
+        Create a request for the defined service
+        """
+        try:
+            self._validate_incoming_request(request, **kwargs)
+        except exceptions.RequestValidationError as e:
+            return HttpResponse(
+                content=e.content, status=e.status, content_type=e.content_type
+            )
+
+        gw_request = self.gateway_request_class(request, timer=self.timer, **kwargs)
+        gw_response = await gw_request.perform()
+
+        return self._build_response(gw_response)
+
+
+class APIBatchView(APIAsyncGatewayView):
+    """
+    Performs a list of gateway requests with one request to the gateway, so a client
+    pays authentication and the round trip once. Each sub-request is checked against
+    the service's permissions and throttles on its own.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    throttle_classes = ()
+    sub_request_permission_classes = (AllowLogicModuleGroup,)
+    sub_request_throttle_classes = (GatewayRateThrottle,)
+    http_method_names = ['post']
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            batch_request = BatchGatewayRequest(request, self)
+        except exceptions.RequestValidationError as e:
+            return HttpResponse(
+                content=e.content, status=e.status, content_type=e.content_type
+            )
+
+        gw_response = await batch_request.perform()
+
+        return self._build_response(gw_response)
+
+
+def metrics_view(request):
+    """
+    Metrics of all gateway workers in Prometheus text format, behind a bearer token
+    when GATEWAY_METRICS_TOKEN is set
+    """
+    if not settings.GATEWAY_METRICS_ENABLED:
+        return HttpResponse(status=404)
+    token = settings.GATEWAY_METRICS_TOKEN
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')